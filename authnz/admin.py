@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
 from authnz.models import User
-from feed.models import FollowFeed, EntryRead
+from feed.models import FollowFeed, ReadState
 
 
 class FollowFeedAdminInline(admin.TabularInline):
@@ -31,15 +31,17 @@ class FollowFeedAdminInline(admin.TabularInline):
         return False
 
 
-class EntryReadAdminInline(admin.TabularInline):
-    model = EntryRead
+class ReadStateAdminInline(admin.TabularInline):
+    model = ReadState
     fields = (
-        "entry",
-        "created_at",
+        "feed",
+        "read_until",
+        "updated_at",
     )
     readonly_fields = (
-        "entry",
-        "created_at",
+        "feed",
+        "read_until",
+        "updated_at",
     )
     can_delete = False
     classes = ["collapse"]
@@ -64,7 +66,7 @@ class UserAdmin(UserAdmin):
     )
     inlines = (
         FollowFeedAdminInline,
-        EntryReadAdminInline,
+        ReadStateAdminInline,
     )
 
     def has_add_permission(self, request, obj=None):
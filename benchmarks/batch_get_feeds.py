@@ -0,0 +1,100 @@
+"""
+Benchmark of iterating due feeds in schedule_fetch_feed_batch
+
+    python -m benchmarks.batch_get_feeds --feeds 100000 --batch-size 100
+
+it compares OFFSET pagination with one query of FeedManager.batch_get_feeds
+over due feeds in order of next_fetch_at, --limit is budget of a tick,
+set DJANGO_SETTINGS_MODULE to run it on postgres
+"""
+import argparse
+import time
+from datetime import timedelta
+
+from benchmarks.django_setup import benchmark_database
+
+
+def due_feeds(due_at):
+    from feed.models import Feed
+
+    return (
+        Feed.objects.filter(
+            status__in=Feed.SCHEDULED_STATUSES, next_fetch_at__lte=due_at
+        )
+        .order_by("next_fetch_at", "id")
+        .values_list("id", flat=True)
+    )
+
+
+def offset_batches(due_at, batch_size: int, limit: int = None):
+    queryset = due_feeds(due_at)
+    cursor = 0
+    while limit is None or cursor < limit:
+        end = cursor + batch_size if limit is None else min(cursor + batch_size, limit)
+        batch = queryset[cursor:end]
+        if len(batch) == 0:
+            break
+        yield batch
+        cursor = end
+
+
+def create_feeds(count: int, now):
+    from authnz.models import User
+    from feed.models import Feed
+
+    user = User.objects.create(username="benchmark", email="benchmark@feed.cloud")
+    Feed.objects.bulk_create(
+        (
+            Feed(
+                title=f"Feed {count - i}",
+                link=f"https://feed{i}.io/rss",
+                status=Feed.ACTIVE,
+                creator=user,
+                # ids are not in order of due time
+                next_fetch_at=now - timedelta(seconds=i * 7919 % count),
+            )
+            for i in range(count)
+        ),
+        batch_size=5000,
+    )
+
+
+def measure(batches) -> (float, int):
+    start = time.perf_counter()
+    count = sum(len(batch) for batch in batches)
+    return time.perf_counter() - start, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--feeds", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument(
+        "--limit", type=int, default=None, help="all due feeds by default"
+    )
+    args = parser.parse_args()
+
+    with benchmark_database():
+        from django.utils import timezone
+
+        from feed.models import Feed
+
+        now = timezone.now()
+        create_feeds(args.feeds, now)
+        strategies = (
+            ("offset", lambda: offset_batches(now, args.batch_size, args.limit)),
+            (
+                "batch_get_feeds",
+                lambda: Feed.objects.batch_get_feeds(
+                    due_at=now, batch_size=args.batch_size, limit=args.limit
+                ),
+            ),
+        )
+        print(f"{'strategy':<20}{'seconds':>10}{'feeds':>10}")
+        for name, batches in strategies:
+            elapsed, count = measure(batches())
+            print(f"{name:<20}{elapsed:>10.3f}{count:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Benchmark of date parsing of entries on a corpus of real world date strings
+
+    python -m benchmarks.date_parsing --repeat 2000
+
+cold is parse_date with an empty cache on every round, warm is parse_date
+with cached dates like refetching of a feed
+"""
+import argparse
+import time
+
+from dateutil.parser import parse
+
+from feedreader.dates import parse_date
+
+
+CORPUS = "feedreader/tests/corpus/dates.txt"
+
+
+def run(function, dates, repeat: int, before_round=None) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        if before_round:
+            before_round()
+        for value in dates:
+            function(value)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    with open(CORPUS) as file:
+        dates = file.read().splitlines()
+    modes = (
+        ("dateutil", parse, None),
+        ("cold", parse_date, parse_date.cache_clear),
+        ("warm", parse_date, None),
+    )
+    count = len(dates) * args.repeat
+    print(f"{'mode':<10}{'seconds':>10}{'us/date':>10}")
+    for name, function, before_round in modes:
+        elapsed = run(function, dates, args.repeat, before_round)
+        print(f"{name:<10}{elapsed:>10.3f}{elapsed / count * 10 ** 6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
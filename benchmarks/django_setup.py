@@ -0,0 +1,24 @@
+"""
+Django setup of benchmarks that need database
+
+it creates a separate test database (in memory for sqlite) like pytest does,
+so benchmarks never touch data of the configured database
+"""
+import contextlib
+import os
+
+import django
+
+
+@contextlib.contextmanager
+def benchmark_database():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "feedcloud.settings.testing")
+    django.setup()
+    from django.db import connection
+
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,101 @@
+"""
+Benchmark of unique index of entries on link against unique index on
+64 bit hash of link
+
+    python -m benchmarks.entry_link_index --rows 1000000
+
+rows are inserted in batches that ignore conflicts like ingest does, then a
+batch of already saved links is inserted again, set DJANGO_SETTINGS_MODULE
+to run it on postgres with tens of millions of rows
+"""
+import argparse
+import time
+import uuid
+
+from benchmarks.django_setup import benchmark_database
+
+
+TABLES = {
+    "link": "link varchar(500) NOT NULL UNIQUE",
+    "link_hash": "link varchar(500) NOT NULL, link_hash bigint NOT NULL UNIQUE",
+}
+
+
+def generate_links(count: int):
+    prefix = "https://www.example-news-site.com/2021/09/22/an-article-about-feeds"
+    return [f"{prefix}-{uuid.uuid4().hex}" for _ in range(count)]
+
+
+def insert(cursor, table: str, links, with_hash: bool):
+    from feed.links import hash_link
+
+    if with_hash:
+        cursor.executemany(
+            f"INSERT INTO {table} (link, link_hash) VALUES (%s, %s) "
+            "ON CONFLICT DO NOTHING",
+            [(link, hash_link(link)) for link in links],
+        )
+    else:
+        cursor.executemany(
+            f"INSERT INTO {table} (link) VALUES (%s) ON CONFLICT DO NOTHING",
+            [(link,) for link in links],
+        )
+
+
+def index_size(connection, cursor, table: str) -> int:
+    if connection.vendor == "postgresql":
+        cursor.execute(
+            "SELECT SUM(pg_relation_size(indexrelid)) FROM pg_index "
+            "WHERE indrelid = %s::regclass AND NOT indisprimary",
+            [table],
+        )
+    else:
+        cursor.execute(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name IN (SELECT name FROM "
+            "sqlite_master WHERE type = 'index' AND tbl_name = %s)",
+            [table],
+        )
+    return cursor.fetchone()[0] or 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    with benchmark_database() as connection:
+        primary_key = (
+            "id bigserial PRIMARY KEY"
+            if connection.vendor == "postgresql"
+            else "id integer PRIMARY KEY AUTOINCREMENT"
+        )
+        print(
+            f"{'unique on':<11}{'seconds':>10}{'rows/s':>10}"
+            f"{'dup rows/s':>12}{'index MiB':>11}"
+        )
+        for column, definition in TABLES.items():
+            table = f"benchmark_entry_{column}"
+            with_hash = column == "link_hash"
+            with connection.cursor() as cursor:
+                cursor.execute(f"CREATE TABLE {table} ({primary_key}, {definition})")
+                elapsed, saved = 0, []
+                for _ in range(0, args.rows, args.batch_size):
+                    links = generate_links(args.batch_size)
+                    start = time.perf_counter()
+                    insert(cursor, table, links, with_hash)
+                    elapsed += time.perf_counter() - start
+                    saved = links
+                start = time.perf_counter()
+                insert(cursor, table, saved, with_hash)
+                duplicate_elapsed = time.perf_counter() - start
+                size = index_size(connection, cursor, table)
+                cursor.execute(f"DROP TABLE {table}")
+            print(
+                f"{column:<11}{elapsed:>10.2f}{args.rows / elapsed:>10.0f}"
+                f"{len(saved) / duplicate_elapsed:>12.0f}{size / 2 ** 20:>11.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark of latency of a page of entries at a depth in entry list
+
+    python -m benchmarks.entry_pagination --entries 200000 --depths 10 1000 100000
+
+depth is the number of entries before the page, index mode is OFFSET and
+LIMIT like ?index=&size=, cursor mode is keyset pagination on
+(published_at, id) like ?cursor=, set DJANGO_SETTINGS_MODULE to run it on
+postgres
+"""
+import argparse
+import statistics
+import time
+from datetime import timedelta
+
+from benchmarks.django_setup import benchmark_database
+
+
+ORDERING = ("-published_at", "-id")
+
+
+def create_entries(count: int, feeds: int = 100):
+    from django.utils import timezone
+
+    from authnz.models import User
+    from feed.models import Entry, Feed
+
+    user = User.objects.create(username="benchmark", email="benchmark@feed.cloud")
+    Feed.objects.bulk_create(
+        Feed(title=f"Feed {i}", link=f"https://feed{i}.io/rss", creator=user)
+        for i in range(feeds)
+    )
+    feed_ids = list(Feed.objects.values_list("id", flat=True))
+    now = timezone.now()
+    Entry.objects.bulk_create(
+        (
+            Entry(
+                feed_id=feed_ids[i % feeds],
+                title=f"Entry {i}",
+                link=f"https://feed{i % feeds}.io/entry/{i}",
+                summary="Summary",
+                # entries of a minute share publish time, id breaks ties
+                published_at=now - timedelta(minutes=i // 10),
+            )
+            for i in range(count)
+        ),
+        batch_size=5000,
+    )
+
+
+def measure(function, repeat: int) -> float:
+    """
+    :return: median milliseconds of function
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=200_000)
+    parser.add_argument("--depths", type=int, nargs="+", default=(10, 1_000, 100_000))
+    parser.add_argument("--size", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        from feed.models import Entry
+        from utils.utils import encode_cursor, keyset_page
+
+        create_entries(args.entries)
+        queryset = Entry.objects.all()
+        print(f"{'depth':>10}{'index ms':>12}{'cursor ms':>12}")
+        for depth in args.depths:
+            before = queryset.order_by(*ORDERING)[depth - 1]
+            cursor = encode_cursor(
+                ORDERING, [getattr(before, field.lstrip("-")) for field in ORDERING]
+            )
+            offset_page = list(queryset.order_by(*ORDERING)[depth : depth + args.size])
+            cursor_page, _ = keyset_page(queryset, ORDERING, cursor, args.size)
+            assert offset_page == cursor_page
+            index_ms = measure(
+                lambda: list(queryset.order_by(*ORDERING)[depth : depth + args.size]),
+                args.repeat,
+            )
+            cursor_ms = measure(
+                lambda: keyset_page(queryset, ORDERING, cursor, args.size),
+                args.repeat,
+            )
+            print(f"{depth:>10}{index_ms:>12.2f}{cursor_ms:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
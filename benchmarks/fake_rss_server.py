@@ -0,0 +1,78 @@
+"""
+Local fake RSS server used by benchmarks
+
+it speaks HTTP/1.1 keep-alive, counts accepted connections and can sleep
+on every new connection to simulate cost of TCP/TLS handshake
+"""
+import threading
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def generate_rss(items: int = 20, title: str = "Fake feed") -> bytes:
+    now = datetime.now(timezone.utc)
+    entries = "".join(
+        f"<item><title>Item {i}</title>"
+        f"<link>https://fake.feed/items/{i}</link>"
+        f"<description>Summary of item {i}</description>"
+        f"<pubDate>{format_datetime(now - timedelta(minutes=i))}</pubDate></item>"
+        for i in range(items)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+        f"<title>{title}</title><link>https://fake.feed</link>{entries}"
+        "</channel></rss>"
+    ).encode()
+
+
+class FakeRSSServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, content: bytes, connect_delay: float = 0):
+        self.content = content
+        self.connect_delay = connect_delay
+        self.connections = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        super().__init__(("127.0.0.1", 0), _FakeRSSHandler)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/feed"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        # clients may close connection before reading whole body
+        pass
+
+
+class _FakeRSSHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server._lock:
+            self.server.connections += 1
+        if self.server.connect_delay:
+            threading.Event().wait(self.server.connect_delay)
+
+    def do_GET(self):
+        with self.server._lock:
+            self.server.requests += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "application/rss+xml")
+        self.send_header("Content-Length", str(len(self.server.content)))
+        self.end_headers()
+        self.wfile.write(self.server.content)
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,56 @@
+"""
+Benchmark of FeedReader request agents against a local fake RSS server
+
+    python -m benchmarks.http_sessions --fetches 500 --connect-delay 0.02
+
+connect-delay simulates TCP/TLS handshake cost of a remote host, the pooled
+session agent pays it once per connection instead of once per fetch
+"""
+import argparse
+import time
+
+import feedparser
+import requests
+
+from benchmarks.fake_rss_server import FakeRSSServer, generate_rss
+from feedreader.agents import SessionRequestAgent
+from feedreader.feedreader import FeedReader
+
+
+def run(request_agent, url: str, fetches: int) -> float:
+    start = time.perf_counter()
+    for _ in range(fetches):
+        FeedReader(
+            url, request_agent=request_agent, parser_agent=feedparser
+        ).get_entries()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--fetches", type=int, default=200)
+    parser.add_argument("--items", type=int, default=20)
+    parser.add_argument("--connect-delay", type=float, default=0.02)
+    args = parser.parse_args()
+
+    agents = (
+        ("requests", requests),
+        ("session", SessionRequestAgent()),
+    )
+    print(f"{'agent':<10}{'seconds':>10}{'fetch/s':>10}{'connections':>13}")
+    for name, agent in agents:
+        server = FakeRSSServer(
+            generate_rss(args.items), connect_delay=args.connect_delay
+        ).start()
+        try:
+            elapsed = run(agent, server.url, args.fetches)
+        finally:
+            server.stop()
+        print(
+            f"{name:<10}{elapsed:>10.3f}{args.fetches / elapsed:>10.1f}"
+            f"{server.connections:>13}"
+        )
+
+
+if __name__ == "__main__":
+    main()
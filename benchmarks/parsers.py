@@ -0,0 +1,50 @@
+"""
+Benchmark of parser agents of FeedReader on synthetic RSS documents
+
+    python -m benchmarks.parsers --items 200 --repeat 20
+
+every document is parsed completely and all entries are read
+"""
+import argparse
+import time
+
+import feedparser
+
+from benchmarks.fake_rss_server import generate_rss
+from feedreader.parsers import LxmlParser, StreamingParser
+
+
+def run(parser_agent, content: bytes, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        data = parser_agent.parse(content)
+        for entry in data.entries:
+            entry["title"], entry["link"], entry["summary"], entry["published"]
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    content = generate_rss(args.items)
+    agents = (
+        ("feedparser", feedparser),
+        ("streaming", StreamingParser()),
+        ("lxml", LxmlParser()),
+    )
+    print(f"{'parser':<12}{'seconds':>10}{'doc/s':>10}{'speedup':>9}")
+    baseline = None
+    for name, agent in agents:
+        elapsed = run(agent, content, args.repeat)
+        baseline = baseline or elapsed
+        print(
+            f"{name:<12}{elapsed:>10.3f}{args.repeat / elapsed:>10.1f}"
+            f"{baseline / elapsed:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
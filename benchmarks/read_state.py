@@ -0,0 +1,256 @@
+"""
+Benchmark of read state of users, one row per read entry against one read
+state per followed feed
+
+    python -m benchmarks.read_state --feeds 10000 --entries-per-feed 1000 --users 100000
+
+every user follows --follows feeds, has read a random prefix of every
+followed feed and a few random entries after it, or a random number of
+newest entries of --newest-first of feeds, reads are saved as rows of
+(user, entry) like old EntryRead and as read states, it prints size of
+both, largest number of ids in read condition of a user and median latency
+of unread counts of followed feeds and a page of unread entries of a sample
+of users, set DJANGO_SETTINGS_MODULE to run it on postgres
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from benchmarks.django_setup import benchmark_database
+
+
+READ_TABLE = "benchmark_entry_read"
+
+
+def create_entries(feeds: int, entries_per_feed: int) -> dict:
+    """
+    :return: ids of entries of every feed in order of id
+    """
+    from django.utils import timezone
+
+    from authnz.models import User
+    from feed.models import Entry, Feed
+
+    creator = User.objects.create(username="creator", email="creator@feed.cloud")
+    Feed.objects.bulk_create(
+        Feed(title=f"Feed {i}", link=f"https://feed{i}.io/rss", creator=creator)
+        for i in range(feeds)
+    )
+    feed_ids = list(Feed.objects.values_list("id", flat=True))
+    now = timezone.now()
+    # entries of feeds interleave like entries of periodic fetches
+    Entry.objects.bulk_create(
+        (
+            Entry(
+                feed_id=feed_id,
+                title=f"Entry {i}",
+                link=f"https://feed{feed_id}.io/entry/{i}",
+                summary="Summary",
+                published_at=now - timedelta(minutes=entries_per_feed - i),
+            )
+            for i in range(entries_per_feed)
+            for feed_id in feed_ids
+        ),
+        batch_size=10000,
+    )
+    entry_ids = {feed_id: [] for feed_id in feed_ids}
+    for entry_id, feed_id in Entry.objects.order_by("id").values_list("id", "feed_id"):
+        entry_ids[feed_id].append(entry_id)
+    return entry_ids
+
+
+def create_reads(
+    connection,
+    users: int,
+    follows: int,
+    entry_ids: dict,
+    out_of_order: int,
+    newest_first: float,
+) -> list:
+    """
+    :return: ids of users
+    """
+    from authnz.models import User
+    from feed.models import FollowFeed, ReadState
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE {READ_TABLE} (user_id bigint, entry_id bigint, "
+            "PRIMARY KEY (user_id, entry_id))"
+        )
+    User.objects.bulk_create(
+        (User(username=f"user{i}", email=f"user{i}@feed.cloud") for i in range(users)),
+        batch_size=10000,
+    )
+    user_ids = list(
+        User.objects.exclude(username="creator").values_list("id", flat=True)
+    )
+    feed_ids = list(entry_ids)
+    for user_id in user_ids:
+        follows_of_user, states, reads = [], [], []
+        for feed_id in random.sample(feed_ids, follows):
+            ids = entry_ids[feed_id]
+            if random.random() < newest_first:
+                read = ids[len(ids) - random.randint(0, len(ids)) :]
+            else:
+                prefix = random.randint(0, len(ids))
+                count = min(out_of_order, len(ids) - prefix)
+                read = ids[:prefix] + random.sample(ids[prefix:], count)
+            reads.extend((user_id, entry_id) for entry_id in read)
+            follows_of_user.append(FollowFeed(user_id=user_id, feed_id=feed_id))
+            state = ReadState(user_id=user_id, feed_id=feed_id)
+            state.add_reads(read)
+            states.append(state)
+        FollowFeed.objects.bulk_create(follows_of_user)
+        ReadState.objects.bulk_create(states)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {READ_TABLE} (user_id, entry_id) VALUES (%s, %s)", reads
+            )
+    return user_ids
+
+
+def row_unread_counts(connection, user_id: int, feed_ids: list) -> dict:
+    from feed.models import Entry
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT entry.feed_id, COUNT(*) FROM {Entry._meta.db_table} entry "
+            f"WHERE entry.feed_id IN ({', '.join(['%s'] * len(feed_ids))}) "
+            f"AND NOT EXISTS (SELECT 1 FROM {READ_TABLE} read "
+            "WHERE read.user_id = %s AND read.entry_id = entry.id) "
+            "GROUP BY entry.feed_id",
+            [*feed_ids, user_id],
+        )
+        counts = dict(cursor.fetchall())
+    return {feed_id: counts.get(feed_id, 0) for feed_id in feed_ids}
+
+
+def row_unread_page(connection, user_id: int, feed_ids: list, size: int) -> list:
+    from feed.models import Entry
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT entry.id FROM {Entry._meta.db_table} entry "
+            f"WHERE entry.feed_id IN ({', '.join(['%s'] * len(feed_ids))}) "
+            f"AND NOT EXISTS (SELECT 1 FROM {READ_TABLE} read "
+            "WHERE read.user_id = %s AND read.entry_id = entry.id) "
+            "ORDER BY entry.published_at DESC, entry.id DESC LIMIT %s",
+            [*feed_ids, user_id, size],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def state_unread_page(user_id: int, feed_ids: list, size: int) -> list:
+    from feed.models import Entry, ReadState
+
+    return list(
+        Entry.objects.filter(feed_id__in=feed_ids)
+        .exclude(ReadState.objects.read_filter(user_id))
+        .order_by("-published_at", "-id")
+        .values_list("id", flat=True)[:size]
+    )
+
+
+def measure(function, arguments: list) -> float:
+    """
+    :return: median milliseconds of function for every arguments
+    """
+    timings = []
+    for argument in arguments:
+        start = time.perf_counter()
+        function(*argument)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--feeds", type=int, default=10_000)
+    parser.add_argument("--entries-per-feed", type=int, default=1_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--follows", type=int, default=20)
+    parser.add_argument("--out-of-order", type=int, default=5)
+    parser.add_argument("--newest-first", type=float, default=0.2)
+    parser.add_argument("--sample", type=int, default=50)
+    parser.add_argument("--size", type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(0)
+    with benchmark_database() as connection:
+        from feed.models import FollowFeed, ReadState
+
+        entry_ids = create_entries(args.feeds, args.entries_per_feed)
+        user_ids = create_reads(
+            connection,
+            args.users,
+            args.follows,
+            entry_ids,
+            args.out_of_order,
+            args.newest_first,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {READ_TABLE}")
+            read_rows = cursor.fetchone()[0]
+        bitmap_bytes = sum(
+            len(reads) + len(unreads)
+            for reads, unreads in ReadState.objects.values_list(
+                "read_ids", "unread_ids"
+            )
+        )
+        print(
+            f"{connection.vendor}, {sum(map(len, entry_ids.values()))} entries, "
+            f"{len(user_ids)} users"
+        )
+        print(f"read rows {read_rows}, read states {ReadState.objects.count()}")
+        print(f"bitmaps {bitmap_bytes / 1024:.1f} KiB")
+
+        follows = {}
+        for user_id, feed_id in FollowFeed.objects.filter(
+            user_id__in=random.sample(user_ids, min(args.sample, len(user_ids)))
+        ).values_list("user_id", "feed_id"):
+            follows.setdefault(user_id, []).append(feed_id)
+        samples = list(follows.items())
+        # ids of a feed are one array parameter on postgres
+        condition_ids = max(
+            sum(
+                len(param) if isinstance(param, list) else 1
+                for param in getattr(
+                    ReadState.objects.read_filter(user_id).children[0], "params", ()
+                )
+            )
+            for user_id, _ in samples
+        )
+        print(f"largest read condition {condition_ids} ids")
+        for user_id, feed_ids in samples:
+            assert row_unread_counts(
+                connection, user_id, feed_ids
+            ) == ReadState.objects.unread_counts(user_id, feed_ids)
+            assert row_unread_page(
+                connection, user_id, feed_ids, args.size
+            ) == state_unread_page(user_id, feed_ids, args.size)
+
+        print(f"{'':>14}{'rows ms':>12}{'states ms':>12}")
+        rows_ms = measure(
+            lambda user_id, feed_ids: row_unread_counts(connection, user_id, feed_ids),
+            samples,
+        )
+        states_ms = measure(ReadState.objects.unread_counts, samples)
+        print(f"{'unread counts':>14}{rows_ms:>12.2f}{states_ms:>12.2f}")
+        rows_ms = measure(
+            lambda user_id, feed_ids: row_unread_page(
+                connection, user_id, feed_ids, args.size
+            ),
+            samples,
+        )
+        states_ms = measure(
+            lambda user_id, feed_ids: state_unread_page(user_id, feed_ids, args.size),
+            samples,
+        )
+        print(f"{'unread page':>14}{rows_ms:>12.2f}{states_ms:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Simulation of fetch queue of schedule_fetch_feed_batch over time
+
+    python -m benchmarks.schedule_spread --feeds 10000 --workers 40 --minutes 60
+
+beat ticks every tick seconds, every tick enqueues due feeds and leases
+them like the scheduler does, workers take fetches from queue and every
+fetch sets next_fetch_at of its feed after an interval, intervals are
+multiples of a minute, a feed is not enqueued again while it is in queue
+
+burst ticks every window, due ticks every tick seconds, phase ticks every
+tick seconds too and moves next_fetch_at of every feed to its stable phase
+in window, no fetch is delayed by an ETA, it prints queue depth and waits
+of fetches and average queue depth by second of window
+"""
+import argparse
+import random
+import statistics
+from collections import deque
+from datetime import datetime, timezone
+
+from feed.scheduling import fetch_countdown
+
+
+INTERVALS = (120, 300, 600, 1800, 3600)
+LEASE = 600
+STEP = 0.1
+
+
+def simulate(
+    feeds: int,
+    workers: int,
+    minutes: int,
+    window: int,
+    tick: int,
+    phase: bool,
+    seed: int,
+) -> dict:
+    rand = random.Random(seed)
+    intervals = [rand.choice(INTERVALS) for _ in range(feeds)]
+    next_fetch_at = [rand.uniform(0, interval) for interval in intervals]
+    enqueued = [False] * feeds
+    due_at = [0.0] * feeds
+    ready = deque()  # (enqueued at, feed)
+    busy_until = [0.0] * workers
+    depths, waits, lateness = [], [], []
+    depth_by_second = [[] for _ in range(window)]
+
+    def schedule(feed: int, at: float) -> float:
+        if not phase:
+            return at
+        moment = datetime.fromtimestamp(at, timezone.utc)
+        return at + fetch_countdown(feed + 1, moment, window)
+
+    steps = int(minutes * 60 / STEP)
+    steps_per_tick = int(tick / STEP)
+    for step in range(steps):
+        now = step * STEP
+        if step % steps_per_tick == 0:
+            for feed in range(feeds):
+                if enqueued[feed] or next_fetch_at[feed] > now:
+                    continue
+                enqueued[feed] = True
+                due_at[feed] = next_fetch_at[feed]
+                next_fetch_at[feed] = now + LEASE
+                ready.append((now, feed))
+        for worker in range(workers):
+            if not ready:
+                break
+            if busy_until[worker] > now:
+                continue
+            enqueued_at, feed = ready.popleft()
+            enqueued[feed] = False
+            duration = rand.uniform(0.2, 1.5)
+            busy_until[worker] = now + duration
+            next_fetch_at[feed] = schedule(feed, now + duration + intervals[feed])
+            waits.append(now - enqueued_at)
+            lateness.append(now - due_at[feed])
+        depths.append(len(ready))
+        depth_by_second[int(now % window)].append(len(ready))
+
+    waits.sort()
+    lateness.sort()
+    return {
+        "fetches": len(waits),
+        "peak depth": max(depths),
+        "mean depth": statistics.mean(depths),
+        "p99 wait": waits[int(len(waits) * 0.99)],
+        "p99 late": lateness[int(len(lateness) * 0.99)],
+        "by second": [statistics.mean(depth) for depth in depth_by_second],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--feeds", type=int, default=10_000)
+    parser.add_argument("--workers", type=int, default=40)
+    parser.add_argument("--minutes", type=int, default=60)
+    parser.add_argument("--window", type=int, default=60)
+    parser.add_argument("--tick", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = {
+        name: simulate(
+            args.feeds, args.workers, args.minutes, args.window, tick, phase, args.seed
+        )
+        for name, tick, phase in (
+            ("burst", args.window, False),
+            ("due", args.tick, False),
+            ("phase", args.tick, True),
+        )
+    }
+    columns = ("fetches", "peak depth", "mean depth", "p99 wait", "p99 late")
+    print(f"{'mode':<10}" + "".join(f"{column:>12}" for column in columns))
+    for name, result in results.items():
+        values = [f"{result['fetches']:>12}"]
+        values.extend(f"{result[column]:>12.1f}" for column in columns[1:])
+        print(f"{name:<10}" + "".join(values))
+    print()
+    print(f"{'second':<10}" + "".join(f"{name:>12}" for name in results))
+    for second in range(0, args.window, max(args.window // 12, 1)):
+        print(
+            f"{second:<10}"
+            + "".join(
+                f"{result['by second'][second]:>12.1f}" for result in results.values()
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark of buffered against streamed download and parsing of a large feed
+on a local fake RSS server
+
+    python -m benchmarks.streaming_parse --items 5000 --new-items 20
+
+peak memory is measured by tracemalloc, new-items is number of entries that
+are newer than last_modified of reader, the streaming parser stops reading
+body after them
+"""
+import argparse
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+import feedparser
+
+from benchmarks.fake_rss_server import FakeRSSServer, generate_rss
+from feedreader.agents import SessionRequestAgent
+from feedreader.feedreader import FeedReader
+from feedreader.parsers import StreamingParser
+
+
+def run(url: str, fetches: int, last_modified: datetime, **kwargs):
+    request_agent = SessionRequestAgent()
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(fetches):
+        entries = FeedReader(
+            url,
+            request_agent=request_agent,
+            last_modified=last_modified,
+            **kwargs,
+        ).get_entries()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    request_agent.close()
+    return elapsed, peak, len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--fetches", type=int, default=3)
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--new-items", type=int, default=20)
+    args = parser.parse_args()
+
+    # items of generate_rss are published every minute, newest first
+    last_modified = datetime.now(timezone.utc) - timedelta(minutes=args.new_items - 0.5)
+    content = generate_rss(args.items)
+    modes = (
+        ("buffered feedparser", dict(parser_agent=feedparser)),
+        ("streamed feedparser", dict(parser_agent=feedparser, stream=True)),
+        ("streamed incremental", dict(parser_agent=StreamingParser(), stream=True)),
+    )
+    print(f"body {len(content) / 2 ** 20:.1f} MiB")
+    print(f"{'mode':<22}{'seconds':>10}{'peak MiB':>10}{'entries':>9}")
+    for name, kwargs in modes:
+        server = FakeRSSServer(content).start()
+        try:
+            elapsed, peak, entries = run(
+                server.url, args.fetches, last_modified, **kwargs
+            )
+        finally:
+            server.stop()
+        print(f"{name:<22}{elapsed:>10.3f}{peak / 2 ** 20:>10.1f}{entries:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark of latency of a page of timeline of a user by number of followed
+feeds
+
+    python -m benchmarks.timeline --feeds 1000 --entries-per-feed 50 --follows 10 100 500
+
+timeline merges newest entries of followed feeds on read, first page is
+the newest page, deep page is after --depth entries of timeline, set
+DJANGO_SETTINGS_MODULE to run it on postgres where every followed feed is
+a LATERAL index range scan, other databases filter entries by followed feeds
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from benchmarks.django_setup import benchmark_database
+
+
+def create_feeds(feeds: int, entries_per_feed: int):
+    from django.utils import timezone
+
+    from authnz.models import User
+    from feed.models import Entry, Feed
+
+    user = User.objects.create(username="creator", email="creator@feed.cloud")
+    Feed.objects.bulk_create(
+        Feed(title=f"Feed {i}", link=f"https://feed{i}.io/rss", creator=user)
+        for i in range(feeds)
+    )
+    feed_ids = list(Feed.objects.values_list("id", flat=True))
+    now = timezone.now()
+    random.seed(0)
+    Entry.objects.bulk_create(
+        (
+            Entry(
+                feed_id=feed_id,
+                title=f"Entry {i}",
+                link=f"https://feed{feed_id}.io/entry/{i}",
+                summary="Summary",
+                # feeds publish at different cadences
+                published_at=now - timedelta(minutes=i * random.randint(1, 600)),
+            )
+            for feed_id in feed_ids
+            for i in range(entries_per_feed)
+        ),
+        batch_size=5000,
+    )
+    return feed_ids
+
+
+def create_follower(index: int, feed_ids: list, follows: int):
+    from authnz.models import User
+    from feed.models import FollowFeed
+
+    user = User.objects.create(
+        username=f"follower{index}", email=f"follower{index}@feed.cloud"
+    )
+    FollowFeed.objects.bulk_create(
+        FollowFeed(user=user, feed_id=feed_id)
+        for feed_id in random.sample(feed_ids, follows)
+    )
+    return user
+
+
+def measure(function, repeat: int) -> float:
+    """
+    :return: median milliseconds of function
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--feeds", type=int, default=1_000)
+    parser.add_argument("--entries-per-feed", type=int, default=50)
+    parser.add_argument("--follows", type=int, nargs="+", default=(10, 100, 500))
+    parser.add_argument("--size", type=int, default=20)
+    parser.add_argument("--depth", type=int, default=1_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with benchmark_database() as connection:
+        from feed.models import Entry
+
+        feed_ids = create_feeds(args.feeds, args.entries_per_feed)
+        print(f"{connection.vendor}, {Entry.objects.count()} entries")
+        print(f"{'follows':>10}{'first ms':>12}{'deep ms':>12}")
+        for index, follows in enumerate(args.follows):
+            user = create_follower(index, feed_ids, follows)
+            deep = Entry.objects.timeline(user.id, limit=args.depth)[-1]
+            before = (deep.published_at, deep.id)
+            first_ms = measure(
+                lambda: Entry.objects.timeline(user.id, limit=args.size + 1),
+                args.repeat,
+            )
+            deep_ms = measure(
+                lambda: Entry.objects.timeline(user.id, before, args.size + 1),
+                args.repeat,
+            )
+            print(f"{follows:>10}{first_ms:>12.2f}{deep_ms:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 
-from feed.models import Feed, FollowFeed, Entry, EntryRead
+from feed.models import Feed, FollowFeed, Entry
 
 
 class FollowFeedAdminInline(admin.TabularInline):
@@ -42,6 +42,12 @@ class FeedAdmin(admin.ModelAdmin):
         "timeout",
         "status",
         "priority",
+        "next_fetch_at",
+        "last_published_at",
+        "last_fetched_at",
+        "last_status_code",
+        "consecutive_failures",
+        "circuit_state",
         "created_at",
         "updated_at",
     )
@@ -52,11 +58,13 @@ class FeedAdmin(admin.ModelAdmin):
         "timeout",
         "status",
         "priority",
+        "circuit_state",
     )
     list_filter = (
         "timeout",
         "status",
         "priority",
+        "circuit_state",
     )
     search_fields = (
         "title",
@@ -67,6 +75,11 @@ class FeedAdmin(admin.ModelAdmin):
         "id",
         "creator",
         "link",
+        "last_published_at",
+        "last_fetched_at",
+        "last_status_code",
+        "consecutive_failures",
+        "circuit_state",
         "created_at",
         "updated_at",
     )
@@ -91,30 +104,6 @@ class FeedAdmin(admin.ModelAdmin):
         return False
 
 
-class EntryReadAdminInline(admin.TabularInline):
-    model = EntryRead
-    fields = (
-        "user",
-        "created_at",
-    )
-    readonly_fields = (
-        "user",
-        "created_at",
-    )
-    can_delete = False
-    classes = ["collapse"]
-    extra = 0
-
-    def has_add_permission(self, request, obj=None):
-        return False
-
-    def has_delete_permission(self, request, obj=None):
-        return False
-
-    def has_change_permission(self, request, obj=None):
-        return False
-
-
 @admin.register(Entry)
 class EntryAdmin(admin.ModelAdmin):
     model = Entry
@@ -146,7 +135,6 @@ class EntryAdmin(admin.ModelAdmin):
     )
     list_max_show_all = 100
     list_per_page = 100
-    inlines = (EntryReadAdminInline,)
 
     def feed_link(self, obj):
         return mark_safe(
@@ -0,0 +1,90 @@
+import logging
+import typing
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Min
+from kombu.exceptions import ChannelError, OperationalError
+
+from feed.leases import in_flight_count
+from feed.models import Feed
+from feedcloud.celery import BACKGROUND_QUEUE, app
+
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = "feed:schedule_metrics"
+
+
+def queue_depth(queue: str = BACKGROUND_QUEUE) -> typing.Optional[int]:
+    """
+    Number of messages that are waiting in a queue of broker
+
+    :return: None if broker is not reachable
+    """
+    try:
+        with app.connection_for_read() as connection:
+            connection.ensure_connection(max_retries=1)
+            return connection.default_channel.queue_declare(
+                queue=queue, passive=True
+            ).message_count
+    except ChannelError:
+        # queue is not declared yet, no message is published to it
+        return 0
+    except (OperationalError, OSError) as e:
+        logger.warning(f"Depth of queue {queue} is unknown, got error {e}.")
+        return None
+
+
+def schedule_lag(now: datetime, priority: int = None) -> float:
+    """
+    Seconds that the most overdue scheduled feed is past its next_fetch_at
+
+    :return: 0 if no feed is due
+    """
+    feeds = Feed.objects.filter(
+        status__in=Feed.SCHEDULED_STATUSES, next_fetch_at__lte=now
+    )
+    if priority is not None:
+        feeds = feeds.filter(priority=priority)
+    due_at = feeds.aggregate(due_at=Min("next_fetch_at"))["due_at"]
+    return (now - due_at).total_seconds() if due_at else 0.0
+
+
+def measure_pipeline(now: datetime, priority: int = None) -> dict:
+    """
+    Measure fetch pipeline before a tick of schedule_fetch_feed_batch
+
+    budget is the number of feeds that the tick may enqueue, it is 0 when
+    background fetch queue has FEED_SCHEDULE_MAX_QUEUE_DEPTH messages, otherwise
+    feeds that are enqueued or being fetched are filled up to
+    FEED_SCHEDULE_MAX_IN_FLIGHT
+    """
+    depth = queue_depth()
+    in_flight = in_flight_count()
+    budget = max(settings.FEED_SCHEDULE_MAX_IN_FLIGHT - in_flight, 0)
+    if depth is not None and depth >= settings.FEED_SCHEDULE_MAX_QUEUE_DEPTH:
+        budget = 0
+    return {
+        "measured_at": now.isoformat(),
+        "queue_depth": depth,
+        "in_flight": in_flight,
+        "lag": schedule_lag(now, priority=priority),
+        "budget": budget,
+    }
+
+
+def record_metrics(metrics: dict):
+    """
+    Keep metrics of last tick of scheduler, they are served to staffs
+    """
+    cache.set(METRICS_KEY, metrics, timeout=None)
+    logger.info(
+        "Schedule tick: queue depth {queue_depth}, in flight {in_flight}, "
+        "lag {lag:.0f}s, enqueued {enqueued} feeds.".format(**metrics)
+    )
+
+
+def get_metrics() -> dict:
+    return cache.get(METRICS_KEY) or {}
@@ -0,0 +1,109 @@
+import struct
+import typing
+
+
+CONTAINER_BITS = 16
+LOW_MASK = (1 << CONTAINER_BITS) - 1
+# containers with more ids are stored as bitmaps, they are smaller then
+ARRAY_MAX_IDS = 4096
+BITMAP_BYTES = (1 << CONTAINER_BITS) // 8
+ARRAY, BITMAP = 0, 1
+# high bits of ids of container, kind of container, number of ids - 1
+HEADER = struct.Struct(">QBH")
+
+
+class IdBitmap:
+    """
+    Compressed set of ids in layout of roaring bitmaps
+
+    ids are grouped into containers by their high bits, a container of at
+    most ARRAY_MAX_IDS ids is stored as a sorted array of their 16 low bits
+    and a denser one as a bitmap of 8 KiB, so a sparse set takes 2 bytes per
+    id and a dense one at most 1 bit per id
+    """
+
+    def __init__(self, ids: typing.Iterable[int] = ()):
+        self._containers: typing.Dict[int, typing.Set[int]] = {}
+        for value in ids:
+            self.add(value)
+
+    def add(self, value: int):
+        self._containers.setdefault(value >> CONTAINER_BITS, set()).add(
+            value & LOW_MASK
+        )
+
+    def discard(self, value: int):
+        lows = self._containers.get(value >> CONTAINER_BITS)
+        if lows is not None:
+            lows.discard(value & LOW_MASK)
+            if not lows:
+                del self._containers[value >> CONTAINER_BITS]
+
+    def discard_until(self, value: int):
+        """
+        Remove ids that are not greater than value
+        """
+        high, low = value >> CONTAINER_BITS, value & LOW_MASK
+        for key in list(self._containers):
+            if key < high:
+                del self._containers[key]
+            elif key == high:
+                lows = {item for item in self._containers[key] if item > low}
+                if lows:
+                    self._containers[key] = lows
+                else:
+                    del self._containers[key]
+
+    def __contains__(self, value: int) -> bool:
+        lows = self._containers.get(value >> CONTAINER_BITS)
+        return lows is not None and value & LOW_MASK in lows
+
+    def __iter__(self) -> typing.Iterator[int]:
+        for key in sorted(self._containers):
+            high = key << CONTAINER_BITS
+            for low in sorted(self._containers[key]):
+                yield high | low
+
+    def __len__(self) -> int:
+        return sum(len(lows) for lows in self._containers.values())
+
+    def to_bytes(self) -> bytes:
+        chunks = []
+        for key in sorted(self._containers):
+            lows = sorted(self._containers[key])
+            if len(lows) <= ARRAY_MAX_IDS:
+                chunks.append(HEADER.pack(key, ARRAY, len(lows) - 1))
+                chunks.append(struct.pack(f">{len(lows)}H", *lows))
+            else:
+                bits = 0
+                for low in lows:
+                    bits |= 1 << low
+                chunks.append(HEADER.pack(key, BITMAP, len(lows) - 1))
+                chunks.append(bits.to_bytes(BITMAP_BYTES, "little"))
+        return b"".join(chunks)
+
+    @classmethod
+    def from_bytes(cls, data: typing.Optional[bytes]) -> "IdBitmap":
+        """
+        :param data: bytes of to_bytes, memoryview of a BinaryField or None
+        """
+        bitmap = cls()
+        data = bytes(data or b"")
+        offset = 0
+        while offset < len(data):
+            key, kind, count = HEADER.unpack_from(data, offset)
+            offset += HEADER.size
+            count += 1
+            if kind == ARRAY:
+                lows = set(struct.unpack_from(f">{count}H", data, offset))
+                offset += count * 2
+            else:
+                bits = int.from_bytes(data[offset : offset + BITMAP_BYTES], "little")
+                offset += BITMAP_BYTES
+                lows = set()
+                while bits:
+                    lowest = bits & -bits
+                    lows.add(lowest.bit_length() - 1)
+                    bits ^= lowest
+            bitmap._containers[key] = lows
+        return bitmap
@@ -0,0 +1,373 @@
+import csv
+import io
+import json
+import logging
+import os
+import socket
+import time
+import typing
+from collections import deque
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, connection, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils.dateparse import parse_datetime
+from django_redis import get_redis_connection
+from redis.exceptions import ResponseError
+
+from feed.dedup import get_entry_deduplicator
+from feed.links import hash_link
+from feed.models import Entry, Feed
+
+
+logger = logging.getLogger(__name__)
+
+ENTRY_COLUMNS = ("feed_id", "title", "link", "link_hash", "summary", "published_at")
+STAGING_TABLE = "feed_entry_staging"
+
+
+def entry_rows(entries: typing.Iterable[Entry]) -> typing.List[dict]:
+    """
+    Entries as json serializable rows of buffer
+    """
+    return [
+        {
+            "feed_id": entry.feed_id,
+            "title": entry.title,
+            "link": entry.link,
+            "link_hash": hash_link(entry.link),
+            "summary": entry.summary,
+            "published_at": entry.published_at.isoformat(),
+        }
+        for entry in entries
+    ]
+
+
+class LocalEntryBuffer:
+    """
+    Buffer of entries in memory of a process, entries are lost if process
+    dies before they are flushed, so it is just for tests and development
+    """
+
+    def __init__(self):
+        self._messages = deque()
+        self._last_id = 0
+
+    def push(self, rows: typing.List[dict]):
+        self._last_id += 1
+        self._messages.append((str(self._last_id), rows))
+
+    def read(self, count: int, block: int = None) -> typing.List[tuple]:
+        """
+        :return: up to count messages as id of message and its rows
+        """
+        messages = []
+        while self._messages and len(messages) < count:
+            messages.append(self._messages.popleft())
+        return messages
+
+    def ack(self, message_ids: typing.Sequence[str]):
+        pass
+
+    def size(self) -> int:
+        return len(self._messages)
+
+
+class RedisEntryBuffer:
+    """
+    Buffer of entries in a redis stream shared by all workers, every fetch
+    adds one message of its entries
+
+    flushers read it by a consumer group and delete messages after their
+    entries are inserted, messages of a flusher that died before that are
+    claimed by other flushers after claim_idle milliseconds
+    """
+
+    key = "feed:entry_buffer"
+    group = "flushers"
+
+    def __init__(self, claim_idle: int, consumer: str = None):
+        self._claim_idle = claim_idle
+        self._consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self._group_created = False
+
+    def push(self, rows: typing.List[dict]):
+        get_redis_connection("default").xadd(self.key, {"rows": json.dumps(rows)})
+
+    def _create_group(self, redis):
+        if self._group_created:
+            return
+        try:
+            redis.xgroup_create(self.key, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_created = True
+
+    def _claim(self, redis, count: int) -> list:
+        """
+        Claim up to count messages that are pending longer than claim_idle
+
+        it is XPENDING and XCLAIM, XAUTOCLAIM is not in redis client 3.5,
+        pending messages are just messages that flushers read and did not
+        ack yet, so they are paged through until count idle ones are found
+        """
+        message_ids, start = [], "-"
+        while len(message_ids) < count:
+            pending = redis.xpending_range(self.key, self.group, start, "+", count)
+            message_ids.extend(
+                message["message_id"]
+                for message in pending
+                if message["time_since_delivered"] >= self._claim_idle
+            )
+            if len(pending) < count:
+                break
+            milliseconds, sequence = pending[-1]["message_id"].decode().split("-")
+            start = f"{milliseconds}-{int(sequence) + 1}"
+        if not message_ids:
+            return []
+        return redis.xclaim(
+            self.key,
+            self.group,
+            self._consumer,
+            self._claim_idle,
+            message_ids[:count],
+        )
+
+    def read(self, count: int, block: int = None) -> typing.List[tuple]:
+        """
+        Claim messages of dead flushers, then read new messages
+
+        :param block: milliseconds to wait for new messages
+        :return: up to count messages as id of message and its rows
+        """
+        redis = get_redis_connection("default")
+        self._create_group(redis)
+        # claimed messages that are deleted already have no fields
+        messages = [message for message in self._claim(redis, count) if message[1]]
+        if len(messages) < count:
+            streams = redis.xreadgroup(
+                self.group,
+                self._consumer,
+                {self.key: ">"},
+                count=count - len(messages),
+                block=None if messages else block,
+            )
+            for _, stream_messages in streams:
+                messages.extend(stream_messages)
+        return [
+            (message_id.decode(), json.loads(fields[b"rows"]))
+            for message_id, fields in messages
+        ]
+
+    def ack(self, message_ids: typing.Sequence[str]):
+        if not message_ids:
+            return
+        pipe = get_redis_connection("default").pipeline(transaction=False)
+        pipe.xack(self.key, self.group, *message_ids)
+        pipe.xdel(self.key, *message_ids)
+        pipe.execute()
+
+    def size(self) -> int:
+        return get_redis_connection("default").xlen(self.key)
+
+
+_buffer = None
+_buffer_pid = None
+
+
+def get_entry_buffer():
+    """
+    Entry buffer of process based on FEED_ENTRY_BUFFER setting
+
+    None means fetches insert their entries themselves
+    """
+    global _buffer, _buffer_pid
+    if settings.FEED_ENTRY_BUFFER is None:
+        return None
+    if _buffer is None or _buffer_pid != os.getpid():
+        if settings.FEED_ENTRY_BUFFER == "redis":
+            _buffer = RedisEntryBuffer(claim_idle=settings.FEED_ENTRY_FLUSH_CLAIM_IDLE)
+        else:
+            _buffer = LocalEntryBuffer()
+        _buffer_pid = os.getpid()
+    return _buffer
+
+
+def _copy_entry_rows(rows: typing.List[dict]) -> int:
+    """
+    COPY rows to a temporary staging table and insert them by one statement,
+    rows of deleted feeds and saved links are skipped
+
+    :return: number of inserted entries
+    """
+    data = io.StringIO()
+    # empty strings are quoted, unquoted empty values are NULL in COPY
+    writer = csv.writer(data, quoting=csv.QUOTE_ALL)
+    writer.writerows([row[column] for column in ENTRY_COLUMNS] for row in rows)
+    data.seek(0)
+    columns = ", ".join(ENTRY_COLUMNS)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE IF NOT EXISTS {STAGING_TABLE} ("
+            "feed_id bigint, title text, link text, link_hash bigint, "
+            "summary text, published_at timestamp with time zone"
+            ") ON COMMIT DELETE ROWS"
+        )
+        cursor.cursor.copy_expert(
+            f"COPY {STAGING_TABLE} ({columns}) FROM STDIN WITH (FORMAT csv)", data
+        )
+        cursor.execute(
+            f"INSERT INTO {Entry._meta.db_table} ({columns}, created_at) "
+            f"SELECT {', '.join(f'staging.{column}' for column in ENTRY_COLUMNS)}, "
+            f"now() FROM {STAGING_TABLE} staging "
+            f"JOIN {Feed._meta.db_table} feed ON feed.id = staging.feed_id "
+            "ON CONFLICT (link_hash) DO NOTHING"
+        )
+        return cursor.rowcount
+
+
+def _bulk_create_entry_rows(rows: typing.List[dict]) -> int:
+    """
+    Insert rows by bulk_create on databases without COPY, rows of deleted
+    feeds and saved links are skipped
+
+    :return: number of inserted entries
+    """
+    feed_ids = set(
+        Feed.objects.filter(id__in={row["feed_id"] for row in rows}).values_list(
+            "id", flat=True
+        )
+    )
+    entries = [
+        Entry(
+            feed_id=row["feed_id"],
+            title=row["title"],
+            link=row["link"],
+            summary=row["summary"],
+            published_at=parse_datetime(row["published_at"]),
+        )
+        for row in rows
+        if row["feed_id"] in feed_ids
+    ]
+    with transaction.atomic():
+        saved = set(
+            Entry.objects.filter(
+                link_hash__in={row["link_hash"] for row in rows}
+            ).values_list("link_hash", flat=True)
+        )
+        Entry.objects.bulk_create(entries, ignore_conflicts=True)
+    return len({entry.link_hash for entry in entries} - saved)
+
+
+def insert_entry_rows(rows: typing.List[dict]) -> int:
+    """
+    :return: number of inserted entries
+    :raise DataError: if rows are invalid
+    """
+    if not rows:
+        return 0
+    if connection.vendor == "postgresql":
+        return _copy_entry_rows(rows)
+    return _bulk_create_entry_rows(rows)
+
+
+@dataclass
+class FlushStats:
+    messages: int = 0
+    rows: int = 0
+    inserted: int = 0
+    dropped: int = 0
+    seconds: float = 0.0
+
+
+def _insert_message_rows(
+    message_id: str, rows: typing.List[dict], stats: FlushStats
+) -> typing.List[dict]:
+    """
+    Insert rows of a message, if it is invalid, rows are inserted one by
+    one and invalid rows are dropped
+
+    :return: rows that are saved
+    """
+    try:
+        stats.inserted += insert_entry_rows(rows)
+        return rows
+    except (DataError, IntegrityError) as e:
+        logger.warning(f"Entry buffer message {message_id} got error {e}.")
+    saved = []
+    for row in rows:
+        try:
+            stats.inserted += insert_entry_rows([row])
+            saved.append(row)
+        except (DataError, IntegrityError) as e:
+            logger.error(f"Entry {row['link']} of feed {row['feed_id']} got error {e}.")
+            stats.dropped += 1
+    return saved
+
+
+def _refetch_feeds(feed_ids: typing.Set[int]):
+    """
+    Drop validators of feeds and move their last_published_at back to
+    their newest saved entry, validators and last_published_at are kept
+    when entries are pushed, so without it entries that are dropped would
+    not be fetched again
+    """
+    newest = (
+        Entry.objects.filter(feed_id=OuterRef("id"))
+        .order_by("-published_at")
+        .values("published_at")[:1]
+    )
+    Feed.objects.filter(id__in=feed_ids).update(
+        http_etag=None,
+        http_last_modified=None,
+        content_digest=None,
+        last_published_at=Subquery(newest),
+    )
+
+
+def flush_entry_buffer(buffer=None, block: int = None) -> FlushStats:
+    """
+    Insert a batch of FEED_ENTRY_FLUSH_MESSAGES buffered messages
+
+    if batch is invalid, messages are inserted one by one and rows of
+    invalid messages one by one, invalid rows are dropped, so they do not
+    block buffer, and their feeds are fetched again in full
+
+    links of saved rows are marked saved in dedup filter
+
+    :param block: milliseconds to wait for messages
+    """
+    buffer = buffer or get_entry_buffer()
+    messages = buffer.read(settings.FEED_ENTRY_FLUSH_MESSAGES, block=block)
+    if not messages:
+        return FlushStats()
+    start = time.perf_counter()
+    stats = FlushStats(messages=len(messages))
+    rows = [row for _, message_rows in messages for row in message_rows]
+    stats.rows = len(rows)
+    try:
+        stats.inserted = insert_entry_rows(rows)
+        saved = rows
+    except (DataError, IntegrityError) as e:
+        logger.warning(f"Entry flush got error {e}, messages are inserted one by one.")
+        saved = []
+        for message_id, message_rows in messages:
+            saved.extend(_insert_message_rows(message_id, message_rows, stats))
+    if stats.dropped:
+        saved_links = {row["link"] for row in saved}
+        _refetch_feeds(
+            {row["feed_id"] for row in rows if row["link"] not in saved_links}
+        )
+    deduplicator = get_entry_deduplicator()
+    if deduplicator:
+        deduplicator.mark_saved([row["link"] for row in saved])
+    buffer.ack([message_id for message_id, _ in messages])
+    stats.seconds = time.perf_counter() - start
+    logger.info(
+        f"Flushed {stats.rows} entries of {stats.messages} fetches, "
+        f"{stats.inserted} inserted, {stats.dropped} dropped "
+        f"in {stats.seconds:.3f}s."
+    )
+    return stats
@@ -0,0 +1,190 @@
+import hashlib
+import logging
+import os
+import typing
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django_redis import get_redis_connection
+
+from feed.links import hash_link
+from feed.models import Entry
+
+
+logger = logging.getLogger(__name__)
+
+
+def _bit_positions(key: str, bits: int, hashes: int) -> typing.List[int]:
+    """
+    Positions of a key in a bloom filter by double hashing
+    """
+    digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "little")
+    h2 = int.from_bytes(digest[8:], "little") | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+
+class LocalLinkFilter:
+    """
+    Bloom filter of seen links in memory of a worker process
+
+    it is cleared when it holds capacity links, so its false positive rate
+    does not grow
+    """
+
+    def __init__(self, bits: int, hashes: int, capacity: int):
+        self._bits = bits
+        self._hashes = hashes
+        self._capacity = capacity
+        self._array = bytearray((bits + 7) // 8)
+        self._count = 0
+
+    def contains(self, links: typing.Sequence[str]) -> typing.List[bool]:
+        return [
+            all(
+                self._array[position >> 3] & (1 << (position & 7))
+                for position in _bit_positions(link, self._bits, self._hashes)
+            )
+            for link in links
+        ]
+
+    def add(self, links: typing.Sequence[str]):
+        if self._count + len(links) > self._capacity:
+            self._array = bytearray(len(self._array))
+            self._count = 0
+        for link in links:
+            for position in _bit_positions(link, self._bits, self._hashes):
+                self._array[position >> 3] |= 1 << (position & 7)
+        self._count += len(links)
+
+
+class RedisLinkFilter:
+    """
+    Bloom filter of seen links in a redis string shared by all workers
+
+    the key expires after ttl seconds from its creation, so its false
+    positive rate does not grow
+    """
+
+    key = "feed:seen_entry_links"
+
+    def __init__(self, bits: int, hashes: int, ttl: int):
+        self._bits = bits
+        self._hashes = hashes
+        self._ttl = ttl
+
+    def contains(self, links: typing.Sequence[str]) -> typing.List[bool]:
+        pipe = get_redis_connection("default").pipeline(transaction=False)
+        for link in links:
+            for position in _bit_positions(link, self._bits, self._hashes):
+                pipe.getbit(self.key, position)
+        bits = pipe.execute()
+        return [
+            all(bits[i * self._hashes : (i + 1) * self._hashes])
+            for i in range(len(links))
+        ]
+
+    def add(self, links: typing.Sequence[str]):
+        connection = get_redis_connection("default")
+        pipe = connection.pipeline(transaction=False)
+        for link in links:
+            for position in _bit_positions(link, self._bits, self._hashes):
+                pipe.setbit(self.key, position, 1)
+        pipe.ttl(self.key)
+        if pipe.execute()[-1] == -1:
+            connection.expire(self.key, self._ttl)
+
+
+@dataclass
+class DedupStats:
+    candidates: int = 0
+    filter_hits: int = 0
+    false_positives: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.filter_hits / self.candidates if self.candidates else 0.0
+
+    @property
+    def false_positive_rate(self) -> float:
+        return self.false_positives / self.filter_hits if self.filter_hits else 0.0
+
+
+class EntryDeduplicator:
+    """
+    Drop entries that their link is saved before, so they do not reach
+    insert and its unique index
+
+    links that link filter has seen are checked exactly in database, other
+    links are new as long as filter was not cleared, insert still ignores
+    conflicts for them
+    """
+
+    def __init__(self, link_filter):
+        self._filter = link_filter
+        self.stats = DedupStats()
+
+    def filter_new(self, entries: typing.Sequence[Entry]) -> typing.List[Entry]:
+        if not entries:
+            return []
+        seen = self._filter.contains([entry.link for entry in entries])
+        maybe_saved = {entry.link for entry, hit in zip(entries, seen) if hit}
+        saved = set()
+        if maybe_saved:
+            saved = set(
+                Entry.objects.filter(
+                    link_hash__in=[hash_link(link) for link in maybe_saved]
+                ).values_list("link", flat=True)
+            )
+        self.stats.candidates += len(entries)
+        self.stats.filter_hits += len(maybe_saved)
+        self.stats.false_positives += len(maybe_saved - saved)
+        logger.debug(
+            f"Entry dedup dropped {len(saved)} of {len(entries)} entries, "
+            f"hit rate {self.stats.hit_rate:.3f}, "
+            f"false positive rate {self.stats.false_positive_rate:.3f}."
+        )
+        return [entry for entry in entries if entry.link not in saved]
+
+    def mark_saved(self, links: typing.Sequence[str]):
+        if links:
+            self._filter.add(list(links))
+
+
+_deduplicator = None
+_deduplicator_pid = None
+
+
+def get_entry_deduplicator() -> typing.Optional[EntryDeduplicator]:
+    """
+    Deduplicator of worker process based on FEED_DEDUP_FILTER setting
+
+    None means entries are not deduplicated before insert
+
+    :raise ImproperlyConfigured: if filter is local and entry buffer is
+        redis, links marked by flushers would never reach filters of workers
+    """
+    global _deduplicator, _deduplicator_pid
+    if settings.FEED_DEDUP_FILTER is None:
+        return None
+    if settings.FEED_DEDUP_FILTER == "local" and settings.FEED_ENTRY_BUFFER == "redis":
+        raise ImproperlyConfigured(
+            "FEED_DEDUP_FILTER should be redis when FEED_ENTRY_BUFFER is redis."
+        )
+    if _deduplicator is None or _deduplicator_pid != os.getpid():
+        if settings.FEED_DEDUP_FILTER == "redis":
+            link_filter = RedisLinkFilter(
+                settings.FEED_DEDUP_FILTER_BITS,
+                settings.FEED_DEDUP_FILTER_HASHES,
+                ttl=settings.FEED_DEDUP_FILTER_TTL,
+            )
+        else:
+            link_filter = LocalLinkFilter(
+                settings.FEED_DEDUP_FILTER_BITS,
+                settings.FEED_DEDUP_FILTER_HASHES,
+                capacity=settings.FEED_DEDUP_FILTER_CAPACITY,
+            )
+        _deduplicator = EntryDeduplicator(link_filter)
+        _deduplicator_pid = os.getpid()
+    return _deduplicator
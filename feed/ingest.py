@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import typing
+from dataclasses import dataclass
+
+import aiohttp
+from django.conf import settings
+from django.db.utils import DataError
+
+from feed.buffer import entry_rows, get_entry_buffer
+from feed.dedup import get_entry_deduplicator
+from feed.links import canonicalize_url
+from feed.models import Feed, Entry
+from feed.throttle import (
+    HostRateLimitedException,
+    acquire_host,
+    block_host,
+    track_host,
+)
+from feedreader.agents import AioHttpRequestAgent, get_shared_session_agent
+from feedreader.exceptions import FeedReaderBaseException, RateLimitedException
+from feedreader.feedreader import AsyncFeedReader, FeedReader, fetch_concurrently
+from feedreader.parsers import LxmlParser, StreamingParser
+from utils.counting import invalidate_counts
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FetchResult:
+    feed: Feed
+    reader: FeedReader
+    error: typing.Optional[Exception] = None
+    # entries that are read while fetching, None if they are not read yet
+    entries: typing.Optional[list] = None
+
+
+def get_request_agent():
+    """
+    Request agent of FeedReader based on FEED_REQUEST_AGENT setting
+
+    None means FeedReader default agent
+    """
+    if settings.FEED_REQUEST_AGENT == "session":
+        return get_shared_session_agent(
+            pool_connections=settings.FEED_HTTP_POOL_CONNECTIONS,
+            pool_maxsize=settings.FEED_HTTP_POOL_MAXSIZE,
+            pool_timeout=settings.FEED_HTTP_POOL_TIMEOUT,
+        )
+    return None
+
+
+def get_parser_agent():
+    """
+    Parser agent of FeedReader based on FEED_PARSER_AGENT setting
+
+    None means FeedReader default agent
+    """
+    if settings.FEED_PARSER_AGENT == "streaming":
+        return StreamingParser()
+    if settings.FEED_PARSER_AGENT == "lxml":
+        return LxmlParser()
+    return None
+
+
+def build_entries(feed: Feed, entries) -> typing.List[Entry]:
+    return [
+        Entry(
+            feed=feed,
+            title=entry.title[:200],
+            link=canonicalize_url(entry.url),
+            summary=entry.summary[:2000],
+            published_at=entry.published_at,
+        )
+        for entry in entries
+    ]
+
+
+def save_entries(entries: typing.List[Entry]):
+    """
+    Insert entries that are not saved before, duplicate links are ignored
+
+    with an entry buffer entries are pushed to it and a flusher inserts
+    them in large batches later, links are marked saved in dedup filter by
+    flusher after they are inserted
+
+    :raise DataError: if entries are invalid
+    """
+    deduplicator = get_entry_deduplicator()
+    if deduplicator:
+        entries = deduplicator.filter_new(entries)
+    buffer = get_entry_buffer()
+    if buffer:
+        if entries:
+            buffer.push(entry_rows(entries))
+        return
+    Entry.objects.bulk_create(entries, ignore_conflicts=True)
+    if deduplicator:
+        deduplicator.mark_saved([entry.link for entry in entries])
+
+
+def throttle_error(feed: Feed) -> typing.Optional[RateLimitedException]:
+    """
+    Take a token of host of feed before fetching it
+
+    :return: error of fetch if host does not have token, None if it has
+    """
+    wait = acquire_host(feed.link)
+    if wait:
+        return HostRateLimitedException("Host is rate limited", retry_after=wait)
+    return None
+
+
+def fetch_feeds(feeds: typing.Iterable[Feed]) -> typing.List[FetchResult]:
+    """
+    Fetch feeds one by one with request agent of FEED_REQUEST_AGENT
+
+    feeds that their host is rate limited are not fetched
+
+    feeds should be annotated with followers_count
+    """
+    request_agent = get_request_agent()
+    results = []
+    for feed in feeds:
+        reader = FeedReader(
+            feed.link,
+            request_agent=request_agent,
+            parser_agent=get_parser_agent(),
+            timeout=feed.timeout,
+            last_modified=feed.last_published_at,
+            etag=feed.http_etag,
+            modified=feed.http_last_modified,
+            content_digest=feed.content_digest,
+            stream=settings.FEED_STREAM_RESPONSE,
+            max_bytes=settings.FEED_MAX_RESPONSE_BYTES,
+        )
+        result = FetchResult(feed=feed, reader=reader, error=throttle_error(feed))
+        if result.error is None:
+            try:
+                # body is read before next feed is fetched, a streamed body
+                # keeps its pooled connection until it is read, so many
+                # feeds of a host would exhaust pool of host
+                result.entries = reader.get_entries()
+            except Exception as e:
+                result.error = e
+        results.append(result)
+    return results
+
+
+def fetch_feeds_async(feeds: typing.Iterable[Feed]) -> typing.List[FetchResult]:
+    """
+    Fetch feeds concurrently on one event loop
+
+    feeds that their host is rate limited are not fetched
+
+    feeds should be annotated with followers_count
+    """
+    return asyncio.run(_fetch_feeds_async(list(feeds)))
+
+
+async def _fetch_feeds_async(feeds: typing.List[Feed]) -> typing.List[FetchResult]:
+    connector = aiohttp.TCPConnector(
+        limit=settings.FEED_ASYNC_CONCURRENCY,
+        limit_per_host=settings.FEED_HTTP_POOL_MAXSIZE,
+    )
+    async with aiohttp.ClientSession(connector=connector) as session:
+        request_agent = AioHttpRequestAgent(
+            session, max_bytes=settings.FEED_MAX_RESPONSE_BYTES
+        )
+        readers = [
+            AsyncFeedReader(
+                feed.link,
+                request_agent,
+                parser_agent=get_parser_agent(),
+                timeout=feed.timeout,
+                last_modified=feed.last_published_at,
+                etag=feed.http_etag,
+                modified=feed.http_last_modified,
+                content_digest=feed.content_digest,
+            )
+            for feed in feeds
+        ]
+        errors = [throttle_error(feed) for feed in feeds]
+        fetch_errors = iter(
+            await fetch_concurrently(
+                [reader for reader, error in zip(readers, errors) if error is None],
+                concurrency=settings.FEED_ASYNC_CONCURRENCY,
+            )
+        )
+        errors = [error or next(fetch_errors) for error in errors]
+    return [
+        FetchResult(feed=feed, reader=reader, error=error)
+        for feed, reader, error in zip(feeds, readers, errors)
+    ]
+
+
+def persist_fetch_results(results: typing.Iterable[FetchResult]):
+    """
+    Save entries of all fetched feeds with one bulk insert,
+    then save changes of all feeds with one bulk update
+    """
+    results = list(results)
+    entries_by_feed, published_dates = {}, {}
+    for result in results:
+        feed = result.feed
+        if result.error is None and result.entries is None:
+            try:
+                result.entries = result.reader.get_entries()
+            except Exception as e:
+                result.error = e
+        entries = result.entries
+        if isinstance(result.error, RateLimitedException):
+            logger.info(f"Feed {feed.id} got error {result.error}.")
+            continue
+        if result.error is not None:
+            if isinstance(result.error, FeedReaderBaseException):
+                logger.error(f"Feed {feed.id} got error {result.error}.")
+            else:
+                logger.error(
+                    f"Feed {feed.id} got error {result.error}.", exc_info=result.error
+                )
+            continue
+        if not result.reader.not_modified:
+            entries_by_feed[feed.id] = build_entries(feed, entries)
+            published_dates[feed.id] = [entry.published_at for entry in entries]
+
+    not_saved_feed_ids = _bulk_create_entries(entries_by_feed)
+    statuses = {result.feed.id: result.feed.status for result in results}
+    fetched_feeds = []
+    for result in results:
+        feed, reader = result.feed, result.reader
+        if isinstance(result.error, HostRateLimitedException):
+            feed.feed_throttled(result.error.retry_after, save=False)
+        elif isinstance(result.error, RateLimitedException):
+            # server asked to wait, so other feeds of host wait too
+            delay = block_host(feed.link, result.error.retry_after)
+            feed.feed_throttled(delay, status_code=reader.status_code, save=False)
+        elif result.error is not None:
+            track_host(feed.link, result.error, reader.status_code)
+            feed.feed_fail(status_code=reader.status_code, save=False)
+        elif feed.id in not_saved_feed_ids:
+            # validators are not kept, so entries will be fetched again
+            continue
+        else:
+            track_host(feed.link, status_code=reader.status_code)
+            feed.update_http_validators(
+                reader.etag, reader.modified, reader.content_digest, save=False
+            )
+            feed.track_permanent_redirect(reader.permanent_redirect)
+            if not feed.title and not reader.not_modified:
+                feed_info = reader.get_feed_info()
+                feed.title = feed_info.title if feed_info else ""
+            feed.feed_success(
+                published_dates=published_dates.get(feed.id, ()),
+                followers_count=feed.followers_count,
+                status_code=reader.status_code,
+                save=False,
+            )
+        fetched_feeds.append(feed)
+    # bulk_update does not send post_save, so update_feed signal is not called
+    Feed.objects.bulk_update(fetched_feeds, Feed.fetch_state_fields)
+    if any(feed.status != statuses[feed.id] for feed in fetched_feeds):
+        invalidate_counts(Feed)
+
+
+def _bulk_create_entries(
+    entries_by_feed: typing.Dict[int, typing.List[Entry]]
+) -> typing.Set[int]:
+    """
+    Insert entries of all feeds in one statement, if it failed because of
+    invalid data, insert them feed by feed to find the invalid feeds
+
+    :return: id of feeds that their entries could not be saved
+    """
+    try:
+        save_entries(
+            [entry for entries in entries_by_feed.values() for entry in entries]
+        )
+        return set()
+    except DataError as e:
+        logger.error(f"Batch insert of entries got error {e}.")
+
+    not_saved_feed_ids = set()
+    for feed_id, entries in entries_by_feed.items():
+        try:
+            save_entries(entries)
+        except DataError as e:
+            logger.error(f"Feed {feed_id} got error {e}.")
+            not_saved_feed_ids.add(feed_id)
+    return not_saved_feed_ids
@@ -0,0 +1,175 @@
+import math
+import time
+import typing
+import uuid
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+
+# feeds that are enqueued or leased are kept in a sorted set by expiry of
+# their mark or lease too, so they are counted without scanning keys
+TRACK_SCRIPT = """
+local function track(key, expires_at, feed_id)
+    local current = redis.call("ZSCORE", key, feed_id)
+    if not current or tonumber(current) < tonumber(expires_at) then
+        redis.call("ZADD", key, expires_at, feed_id)
+    end
+end
+"""
+# mark a feed enqueued if it is not, with in_flight not if it is leased too
+CLAIM_SCRIPT = (
+    TRACK_SCRIPT
+    + """
+if ARGV[2] == "1" and redis.call("EXISTS", KEYS[2]) == 1 then
+    return 0
+end
+if redis.call("SET", KEYS[1], 1, "NX", "EX", ARGV[1]) then
+    track(KEYS[3], ARGV[3], ARGV[4])
+    return 1
+end
+return 0
+"""
+)
+# lease a feed if it is not leased, its message is consumed anyway, it may
+# be a periodic or an interactive message, so both marks are removed
+ACQUIRE_SCRIPT = """
+redis.call("DEL", KEYS[2], KEYS[4])
+if redis.call("SET", KEYS[1], ARGV[1], "NX", "EX", ARGV[2]) then
+    redis.call("ZADD", KEYS[3], ARGV[3], ARGV[4])
+    return 1
+end
+return 0
+"""
+# delete a lease just if it is not expired and taken by another fetch
+RELEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    redis.call("ZREM", KEYS[2], ARGV[2])
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+ENQUEUED_KEY = "feed:fetch_enqueued:{}"
+INTERACTIVE_ENQUEUED_KEY = "feed:fetch_enqueued:interactive:{}"
+LEASE_KEY = "feed:fetch_lease:{}"
+IN_FLIGHT_KEY = "feed:fetch_in_flight"
+
+
+def claim_enqueue(
+    feed_ids: typing.Iterable[int],
+    ttl: int,
+    in_flight: bool = False,
+    interactive: bool = False,
+) -> typing.List[int]:
+    """
+    Mark feeds enqueued until their fetch starts, so just one message per
+    feed is published
+
+    mark expires after ttl seconds in case its message is lost
+
+    :param in_flight: True to not enqueue feeds that are being fetched too
+    :param interactive: True for fetches that users wait for, they have
+        their own mark, so they are not collapsed into a periodic fetch
+        that waits in background queue
+    :return: id of feeds that were not enqueued, they should be published
+    """
+    feed_ids = list(feed_ids)
+    ttl = max(int(ttl), 1)
+    connection = get_redis_connection("default")
+    script = connection.register_script(CLAIM_SCRIPT)
+    pipe = connection.pipeline(transaction=False)
+    for feed_id in feed_ids:
+        script(
+            keys=(
+                (INTERACTIVE_ENQUEUED_KEY if interactive else ENQUEUED_KEY).format(
+                    feed_id
+                ),
+                LEASE_KEY.format(feed_id),
+                IN_FLIGHT_KEY,
+            ),
+            args=(ttl, int(in_flight), time.time() + ttl, feed_id),
+            client=pipe,
+        )
+    return [feed_id for feed_id, claimed in zip(feed_ids, pipe.execute()) if claimed]
+
+
+def acquire_leases(
+    feed_ids: typing.Iterable[int], seconds: int
+) -> typing.Dict[int, str]:
+    """
+    Lease feeds to fetch them, a feed is leased by one fetch at a time
+
+    message of feeds is consumed, so their enqueued marks are removed even
+    if their lease is taken
+
+    :param seconds: lease expires after it in case fetch is killed
+    :return: token of leases of feeds that are leased, by id of feed
+    """
+    feed_ids = list(feed_ids)
+    seconds = max(int(seconds), 1)
+    tokens = [uuid.uuid4().hex for _ in feed_ids]
+    connection = get_redis_connection("default")
+    script = connection.register_script(ACQUIRE_SCRIPT)
+    pipe = connection.pipeline(transaction=False)
+    for feed_id, token in zip(feed_ids, tokens):
+        script(
+            keys=(
+                LEASE_KEY.format(feed_id),
+                ENQUEUED_KEY.format(feed_id),
+                IN_FLIGHT_KEY,
+                INTERACTIVE_ENQUEUED_KEY.format(feed_id),
+            ),
+            args=(token, seconds, time.time() + seconds, feed_id),
+            client=pipe,
+        )
+    acquired = pipe.execute()
+    return {
+        feed_id: token for feed_id, token, ok in zip(feed_ids, tokens, acquired) if ok
+    }
+
+
+def release_leases(leases: typing.Mapping[int, str]):
+    connection = get_redis_connection("default")
+    script = connection.register_script(RELEASE_SCRIPT)
+    pipe = connection.pipeline(transaction=False)
+    for feed_id, token in leases.items():
+        script(
+            keys=(LEASE_KEY.format(feed_id), IN_FLIGHT_KEY),
+            args=(token, feed_id),
+            client=pipe,
+        )
+    pipe.execute()
+
+
+def in_flight_count() -> int:
+    """
+    Number of feeds that are enqueued or being fetched, marks and leases
+    that are expired are not counted
+    """
+    pipe = get_redis_connection("default").pipeline(transaction=False)
+    pipe.zremrangebyscore(IN_FLIGHT_KEY, "-inf", time.time())
+    pipe.zcard(IN_FLIGHT_KEY)
+    return pipe.execute()[1]
+
+
+def lease_ttl(feed_id: int) -> int:
+    """
+    :return: seconds until lease of feed expires, 0 if it is not leased
+    """
+    return max(get_redis_connection("default").ttl(LEASE_KEY.format(feed_id)), 0)
+
+
+def lease_seconds(timeouts: typing.Sequence[int], concurrency: int = 1) -> int:
+    """
+    Lease time of fetching feeds with these request timeouts, by waves of
+    concurrency feeds, and FEED_FETCH_LEASE_MARGIN for parsing and saving
+    """
+    if not timeouts:
+        return settings.FEED_FETCH_LEASE_MARGIN
+    waves = math.ceil(len(timeouts) / concurrency)
+    if waves == len(timeouts):
+        requests_time = sum(timeouts)
+    else:
+        requests_time = waves * max(timeouts)
+    return requests_time + settings.FEED_FETCH_LEASE_MARGIN
@@ -0,0 +1,67 @@
+import hashlib
+from urllib.parse import urlsplit, urlunsplit
+
+
+def hash_link(link: str) -> int:
+    """
+    Signed 64 bit digest of link of an entry, it fits in a BigIntegerField
+
+    it carries unique index of entries instead of link itself, chance of a
+    collision is about n ** 2 / 2 ** 65 for n entries
+    """
+    digest = hashlib.blake2b(link.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+# query parameters that just track source of a visit
+TRACKING_PARAMS = ("fbclid", "gclid", "dclid", "msclkid", "yclid", "mc_cid", "mc_eid")
+TRACKING_PARAM_PREFIXES = ("utm_",)
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Canonical form of link of a feed or an entry, so same resource is saved
+    once
+
+        1. scheme and host are lower case and default port is removed
+
+        2. tracking parameters and empty fragment are removed, other
+        fragments are kept, single page apps route by them, like #!/post/1
+
+        3. path is kept as it is, with or without a trailing slash, it is
+        fetched as it is and servers redirect to their form of it
+
+    links that are not http or https or are malformed are kept as they are
+    """
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        # malformed links, like an unclosed IPv6 host, are kept as they are
+        return url
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return url
+    netloc = parts.hostname
+    if ":" in netloc:
+        netloc = f"[{netloc}]"
+    if port and port != DEFAULT_PORTS[scheme]:
+        netloc = f"{netloc}:{port}"
+    if parts.username:
+        userinfo = parts.username
+        if parts.password:
+            userinfo = f"{userinfo}:{parts.password}"
+        netloc = f"{userinfo}@{netloc}"
+    query = "&".join(
+        param
+        for param in parts.query.split("&")
+        if param and not _is_tracking_param(param.split("=", 1)[0])
+    )
+    return urlunsplit((scheme, netloc, parts.path, query, parts.fragment))
+
+
+def _is_tracking_param(name: str) -> bool:
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PARAM_PREFIXES)
@@ -1,25 +1,284 @@
-from django.db import models
+import typing
+from collections import defaultdict
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import BooleanField, Count, Max, Q
+from django.db.models.expressions import RawSQL
+
+from feed.bitmaps import IdBitmap
+from feed.links import hash_link
 
 
 class FeedManager(models.Manager):
-    def batch_get_feeds(self, priority: int, batch_size: int = 10):
+    def batch_get_feeds(
+        self,
+        priority: int = None,
+        due_at: datetime = None,
+        batch_size: int = None,
+        limit: int = None,
+    ):
         """
-        Will yield batch of ACTIVE feeds
+        Will yield batch of ACTIVE and ERROR feeds
 
         used in periodic fetch_feed_entries
+
+        with priority only feeds of that priority, with due_at only feeds
+        that their next_fetch_at is not after due_at and with limit just
+        limit feeds are yielded
+
+        feeds are yielded in order of next_fetch_at, so the most overdue
+        come first, with limit they are loaded by one query, scheduler always
+        passes its budget as limit, so it is an index scan of at most limit
+        ids, without limit ids are streamed from one query in chunks of
+        batch_size, a server side cursor on postgres, so ids of all feeds
+        are never loaded at once
         """
         from feed.models import Feed
 
+        if batch_size is None:
+            batch_size = settings.FEED_BATCH_SIZE
+
+        filters = {"status__in": Feed.SCHEDULED_STATUSES}
+        if priority is not None:
+            filters["priority"] = priority
+        if due_at is not None:
+            filters["next_fetch_at__lte"] = due_at
+
         queryset = (
             self.get_queryset()
-            .filter(status=Feed.ACTIVE, priority=priority)
+            .filter(**filters)
+            .order_by("next_fetch_at", "id")
             .values_list("id", flat=True)
         )
+        if limit is not None:
+            feed_ids = list(queryset[:limit])
+            for index in range(0, len(feed_ids), batch_size):
+                yield feed_ids[index : index + batch_size]
+            return
 
-        cursor = 0
-        while True:
-            batch = queryset[cursor : cursor + batch_size]
-            if len(batch) == 0:
-                break
+        batch = []
+        for feed_id in queryset.iterator(chunk_size=batch_size):
+            batch.append(feed_id)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
             yield batch
-            cursor = cursor + batch_size
+
+
+class EntryManager(models.Manager):
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        Fill link_hash of entries, save is not called in bulk create
+        """
+        objs = list(objs)
+        for obj in objs:
+            obj.link_hash = hash_link(obj.link)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def timeline(self, user_id: int, before: tuple = None, limit: int = 20) -> list:
+        """
+        Newest entries of feeds that user follows, with their feed
+
+        entries are merged on read from (feed, published_at, id) index of
+        every followed feed, so nothing is written per user when entries are
+        inserted or feeds are followed, on postgres every feed is a LATERAL
+        index range scan of at most limit entries
+
+        :param before: (published_at, id) of last entry of previous page
+        """
+        from feed.models import FollowFeed
+
+        if connection.vendor != "postgresql":
+            queryset = self.filter(
+                feed_id__in=FollowFeed.objects.filter(user_id=user_id).values("feed_id")
+            )
+            if before is not None:
+                published_at, entry_id = before
+                queryset = queryset.filter(
+                    models.Q(published_at__lt=published_at)
+                    | models.Q(published_at=published_at, id__lt=entry_id)
+                )
+            return list(
+                queryset.select_related("feed").order_by("-published_at", "-id")[:limit]
+            )
+
+        before_condition, params = "", []
+        if before is not None:
+            before_condition = "AND (entry.published_at, entry.id) < (%s, %s)"
+            params.extend(before)
+        entries = list(
+            self.raw(
+                f"SELECT timeline.* FROM {FollowFeed._meta.db_table} follow "
+                "CROSS JOIN LATERAL ("
+                f"SELECT entry.* FROM {self.model._meta.db_table} entry "
+                f"WHERE entry.feed_id = follow.feed_id {before_condition} "
+                "ORDER BY entry.published_at DESC, entry.id DESC LIMIT %s"
+                ") timeline WHERE follow.user_id = %s "
+                "ORDER BY timeline.published_at DESC, timeline.id DESC LIMIT %s",
+                [*params, limit, user_id, limit],
+            )
+        )
+        models.prefetch_related_objects(entries, "feed")
+        return entries
+
+
+class ReadStateManager(models.Manager):
+    def mark_read(self, user_id: int, entry_ids: typing.Iterable[int]) -> int:
+        """
+        Mark entries read for user, read state of every feed of entries is
+        updated once
+
+        :return: number of entries that exist
+        """
+        from feed.models import Entry
+
+        entries_by_feed = defaultdict(list)
+        for entry_id, feed_id in Entry.objects.filter(id__in=entry_ids).values_list(
+            "id", "feed_id"
+        ):
+            entries_by_feed[feed_id].append(entry_id)
+        with transaction.atomic():
+            for feed_id, feed_entry_ids in entries_by_feed.items():
+                state = self._locked_state(user_id, feed_id)
+                state.add_reads(feed_entry_ids)
+                state.save()
+        return sum(len(ids) for ids in entries_by_feed.values())
+
+    def mark_feed_read(self, user_id: int, feed_id: int):
+        """
+        Mark all entries of feed that are saved until now read for user
+        """
+        from feed.models import Entry
+
+        read_until = Entry.objects.filter(feed_id=feed_id).aggregate(
+            read_until=Max("id")
+        )["read_until"]
+        with transaction.atomic():
+            state = self._locked_state(user_id, feed_id)
+            state.read_all(read_until or 0)
+            state.save()
+
+    def _locked_state(self, user_id: int, feed_id: int):
+        state, _ = self.select_for_update().get_or_create(
+            user_id=user_id, feed_id=feed_id
+        )
+        return state
+
+    def read_filter(self, user_id: int, feed_id: int = None) -> Q:
+        """
+        Condition of entries that user read, it is on columns of entries,
+        so it does not join any table of reads, ids of bitmaps of a read
+        state are just compared with entries of its feed
+
+        :param feed_id: just read state of this feed
+        """
+        states = self.filter(user_id=user_id)
+        if feed_id is not None:
+            states = states.filter(feed_id=feed_id)
+        read_until, read_ids, unread_ids = [], {}, {}
+        for state_feed_id, state_read_until, reads, unreads in states.values_list(
+            "feed_id", "read_until", "read_ids", "unread_ids"
+        ):
+            reads = list(IdBitmap.from_bytes(reads))
+            if not state_read_until and not reads:
+                continue
+            read_until.append((state_feed_id, state_read_until))
+            read_ids[state_feed_id] = reads
+            unread_ids[state_feed_id] = list(IdBitmap.from_bytes(unreads))
+        return _entry_condition(
+            read_until, "<=", read_ids=read_ids, unread_ids=unread_ids
+        )
+
+    def unread_counts(
+        self, user_id: int, feed_ids: typing.Iterable[int]
+    ) -> typing.Dict[int, int]:
+        """
+        Number of unread entries of feeds for user, entries after
+        read_until of every feed are counted by one query on (feed, id)
+        index, read entries after it are subtracted and unread entries
+        before it are added
+        """
+        from feed.models import Entry
+
+        feed_ids = list(feed_ids)
+        if not feed_ids:
+            return {}
+        states = {
+            state_feed_id: (
+                read_until,
+                len(IdBitmap.from_bytes(unreads)) - len(IdBitmap.from_bytes(reads)),
+            )
+            for state_feed_id, read_until, reads, unreads in self.filter(
+                user_id=user_id, feed_id__in=feed_ids
+            ).values_list("feed_id", "read_until", "read_ids", "unread_ids")
+        }
+        read_until = [(feed_id, states.get(feed_id, (0,))[0]) for feed_id in feed_ids]
+        counts = dict(
+            Entry.objects.filter(_entry_condition(read_until, ">"))
+            .order_by()
+            .values("feed_id")
+            .annotate(count=Count("id"))
+            .values_list("feed_id", "count")
+        )
+        return {
+            feed_id: counts.get(feed_id, 0) + states.get(feed_id, (0, 0))[1]
+            for feed_id in feed_ids
+        }
+
+
+def _entry_condition(
+    read_until: typing.Sequence[typing.Tuple[int, int]],
+    operator: str,
+    read_ids: typing.Mapping[int, typing.Sequence[int]] = None,
+    unread_ids: typing.Mapping[int, typing.Sequence[int]] = None,
+) -> Q:
+    """
+    Condition of entries by id of every feed compared to its read_until
+    and not in unread ids of feed, or id in read ids of feed
+
+    it is one raw expression, an OR of a Q per feed takes longer to build in
+    ORM than to run for users that follow hundreds of feeds
+
+    :param read_ids: ids by feed
+    :param unread_ids: ids by feed
+    """
+    from feed.models import Entry
+
+    table = connection.ops.quote_name(Entry._meta.db_table)
+    feed_column = f"{table}.{connection.ops.quote_name('feed_id')}"
+    id_column = f"{table}.{connection.ops.quote_name('id')}"
+    conditions, params = [], []
+    for feed_id, until in read_until:
+        condition = f"{id_column} {operator} %s"
+        params.extend((feed_id, until))
+        unreads = (unread_ids or {}).get(feed_id)
+        if unreads:
+            sql, ids_params = _id_in(id_column, unreads)
+            condition = f"({condition} AND NOT {sql})"
+            params.extend(ids_params)
+        reads = (read_ids or {}).get(feed_id)
+        if reads:
+            sql, ids_params = _id_in(id_column, reads)
+            condition = f"({condition} OR {sql})"
+            params.extend(ids_params)
+        conditions.append(f"({feed_column} = %s AND {condition})")
+    if not conditions:
+        return Q(pk__in=())
+    return Q(
+        RawSQL(f"({' OR '.join(conditions)})", params, output_field=BooleanField())
+    )
+
+
+def _id_in(column: str, ids: typing.Sequence[int]) -> typing.Tuple[str, list]:
+    """
+    Condition of column in ids, it is one array parameter on postgres, so
+    size of statement does not grow with number of ids
+
+    :return: sql and its params
+    """
+    if connection.vendor == "postgresql":
+        return f"{column} = ANY(%s)", [list(ids)]
+    return f"{column} IN ({', '.join(['%s'] * len(ids))})", list(ids)
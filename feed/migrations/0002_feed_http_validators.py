@@ -0,0 +1,33 @@
+# Generated by Django 3.2.7 on 2026-10-18 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("feed", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="feed",
+            name="http_etag",
+            field=models.CharField(
+                blank=True,
+                help_text="ETag header of last response of feed.",
+                max_length=255,
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="feed",
+            name="http_last_modified",
+            field=models.CharField(
+                blank=True,
+                help_text="Last-Modified header of last response of feed.",
+                max_length=64,
+                null=True,
+            ),
+        ),
+    ]
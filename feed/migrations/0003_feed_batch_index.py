@@ -0,0 +1,19 @@
+# Generated by Django 3.2.7 on 2026-10-18 18:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("feed", "0002_feed_http_validators"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="feed",
+            index=models.Index(
+                fields=["status", "priority", "id"], name="feed_feed_status_045f6f_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 3.2.7 on 2026-10-18 18:14
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("feed", "0003_feed_batch_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="feed",
+            name="consecutive_failures",
+            field=models.PositiveSmallIntegerField(
+                default=0, help_text="Count of last failed fetches."
+            ),
+        ),
+        migrations.AddField(
+            model_name="feed",
+            name="next_fetch_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now,
+                help_text="Time of next fetch of feed.",
+            ),
+        ),
+        migrations.AddField(
+            model_name="feed",
+            name="publish_interval",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Estimated seconds between publishing of entries.",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="feed",
+            name="unchanged_count",
+            field=models.PositiveSmallIntegerField(
+                default=0, help_text="Count of last fetches without new entries."
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="feed",
+            index=models.Index(
+                fields=["status", "next_fetch_at"], name="feed_feed_status_793acd_idx"
+            ),
+        ),
+    ]
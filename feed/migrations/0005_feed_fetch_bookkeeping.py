@@ -0,0 +1,34 @@
+# Generated by Django 3.2.7 on 2026-10-18 18:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("feed", "0004_feed_adaptive_scheduling"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="feed",
+            name="last_fetched_at",
+            field=models.DateTimeField(
+                blank=True, help_text="Time of last fetch of feed.", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="feed",
+            name="last_published_at",
+            field=models.DateTimeField(
+                blank=True, help_text="Publish time of newest entry.", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="feed",
+            name="last_status_code",
+            field=models.PositiveSmallIntegerField(
+                blank=True, help_text="Status code of last response of feed.", null=True
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.7 on 2026-10-18 18:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("feed", "0005_feed_fetch_bookkeeping"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="feed",
+            name="content_digest",
+            field=models.CharField(
+                blank=True,
+                help_text="Digest of body of last response of feed.",
+                max_length=32,
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,65 @@
+import hashlib
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 5000
+
+
+def hash_link(link):
+    # copy of feed.links.hash_link when this migration was written
+    digest = hashlib.blake2b(link.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def fill_link_hash(apps, schema_editor):
+    """
+    Fill link_hash of existing entries in batches of ids, every batch is
+    committed separately because migration is not atomic
+    """
+    Entry = apps.get_model("feed", "Entry")
+    last_id = 0
+    while True:
+        entries = list(
+            Entry.objects.filter(id__gt=last_id, link_hash__isnull=True)
+            .order_by("id")
+            .only("id", "link")[:BATCH_SIZE]
+        )
+        if not entries:
+            break
+        for entry in entries:
+            entry.link_hash = hash_link(entry.link)
+        Entry.objects.bulk_update(entries, ["link_hash"])
+        last_id = entries[-1].id
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("feed", "0006_feed_content_digest"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="entry",
+            name="link_hash",
+            field=models.BigIntegerField(
+                editable=False, help_text="Digest of link of entry.", null=True
+            ),
+        ),
+        migrations.RunPython(fill_link_hash, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="entry",
+            name="link_hash",
+            field=models.BigIntegerField(
+                editable=False, help_text="Digest of link of entry.", unique=True
+            ),
+        ),
+        migrations.AlterField(
+            model_name="entry",
+            name="link",
+            field=models.CharField(help_text="Link of entry.", max_length=500),
+        ),
+    ]
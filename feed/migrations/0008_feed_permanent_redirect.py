@@ -0,0 +1,139 @@
+# Generated by Django 3.2.7 on 2026-10-18 18:44
+
+import hashlib
+from urllib.parse import urlsplit, urlunsplit
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 5000
+
+# copy of feed.links when this migration was written
+TRACKING_PARAMS = ("fbclid", "gclid", "dclid", "msclkid", "yclid", "mc_cid", "mc_eid")
+TRACKING_PARAM_PREFIXES = ("utm_",)
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def hash_link(link):
+    # copy of feed.links.hash_link when this migration was written
+    digest = hashlib.blake2b(link.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def canonicalize_url(url):
+    # copy of feed.links.canonicalize_url when this migration was written
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return url
+    netloc = parts.hostname
+    if ":" in netloc:
+        netloc = f"[{netloc}]"
+    if port and port != DEFAULT_PORTS[scheme]:
+        netloc = f"{netloc}:{port}"
+    if parts.username:
+        userinfo = parts.username
+        if parts.password:
+            userinfo = f"{userinfo}:{parts.password}"
+        netloc = f"{userinfo}@{netloc}"
+    query = "&".join(
+        param
+        for param in parts.query.split("&")
+        if param and not _is_tracking_param(param.split("=", 1)[0])
+    )
+    return urlunsplit((scheme, netloc, parts.path, query, parts.fragment))
+
+
+def _is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PARAM_PREFIXES)
+
+
+def canonicalize_feed_links(apps, schema_editor):
+    """
+    Replace links of existing feeds with their canonical form, links that
+    their canonical form is link of another feed are kept as they are
+    """
+    Feed = apps.get_model("feed", "Feed")
+    links = set(Feed.objects.values_list("link", flat=True))
+    for feed in Feed.objects.only("id", "link").iterator():
+        link = canonicalize_url(feed.link)
+        if link == feed.link or link in links or len(link) > 200:
+            continue
+        Feed.objects.filter(id=feed.id).update(link=link)
+        links.discard(feed.link)
+        links.add(link)
+
+
+def canonicalize_entry_links(apps, schema_editor):
+    """
+    Replace links of existing entries with their canonical form and hash of
+    it, so entries that are fetched again are known by their link_hash
+
+    links that their canonical form is link of another entry are kept as
+    they are, entries are updated in batches of ids and every batch is
+    committed separately because migration is not atomic
+    """
+    Entry = apps.get_model("feed", "Entry")
+    last_id = 0
+    while True:
+        entries = list(
+            Entry.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .only("id", "link", "link_hash")[:BATCH_SIZE]
+        )
+        if not entries:
+            break
+        last_id = entries[-1].id
+        changed = {}
+        for entry in entries:
+            link = canonicalize_url(entry.link)
+            link_hash = hash_link(link)
+            if link == entry.link or len(link) > 500 or link_hash in changed:
+                continue
+            entry.link, entry.link_hash = link, link_hash
+            changed[link_hash] = entry
+        taken = set(
+            Entry.objects.filter(link_hash__in=changed).values_list(
+                "link_hash", flat=True
+            )
+        )
+        entries = [
+            entry for link_hash, entry in changed.items() if link_hash not in taken
+        ]
+        Entry.objects.bulk_update(entries, ["link", "link_hash"])
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("feed", "0007_entry_link_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="feed",
+            name="redirect_count",
+            field=models.PositiveSmallIntegerField(
+                default=0, help_text="Count of last fetches redirected to target."
+            ),
+        ),
+        migrations.AddField(
+            model_name="feed",
+            name="redirect_link",
+            field=models.URLField(
+                blank=True,
+                help_text="Target of permanent redirects of link of feed.",
+                null=True,
+            ),
+        ),
+        migrations.RunPython(canonicalize_feed_links, migrations.RunPython.noop),
+        migrations.RunPython(canonicalize_entry_links, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.7 on 2026-10-18 18:53
+
+from django.db import migrations, models
+
+
+def reopen_demoted_feeds(apps, schema_editor):
+    """
+    Feeds that went to ERROR after fetching successfully before were
+    demoted by two failures, their circuit is opened to retry them
+    """
+    Feed = apps.get_model("feed", "Feed")
+    Feed.objects.filter(status="E", last_published_at__isnull=False).update(
+        status="A", priority=2, circuit_state="O"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("feed", "0008_feed_permanent_redirect"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="feed",
+            name="circuit_state",
+            field=models.CharField(
+                choices=[("C", "CLOSED"), ("O", "OPEN"), ("H", "HALF_OPEN")],
+                default="C",
+                help_text="State of circuit breaker of fetching of feed.",
+                max_length=1,
+            ),
+        ),
+        migrations.RunPython(reopen_demoted_feeds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.7 on 2026-10-18 19:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("feed", "0009_feed_circuit_state"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="entry",
+            index=models.Index(
+                fields=["published_at", "id"], name="feed_entry_publish_9b997f_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="entry",
+            index=models.Index(
+                fields=["feed", "published_at", "id"],
+                name="feed_entry_feed_id_f5316b_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="feed",
+            index=models.Index(
+                fields=["title", "id"], name="feed_feed_title_2f3fe1_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="feed",
+            index=models.Index(
+                fields=["status", "title", "id"], name="feed_feed_status_e31be0_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,162 @@
+# Generated by Django 3.2.7 on 2026-10-18 19:35
+
+import itertools
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# format of bitmaps is stored in database, so it does not change
+from feed.bitmaps import IdBitmap
+
+
+BATCH_SIZE = 5000
+
+
+def copy_entry_reads(apps, schema_editor):
+    """
+    Fold reads of every user into one read state per feed, read_until of a
+    state is the last entry of feed that all entries up to it are read,
+    later reads go to its bitmap, bitmap keeps at most READ_STATE_MAX_IDS
+    newest reads like runtime reads do, so read_until moves over older
+    unread entries and they are read
+
+    users are copied one by one, every user is committed separately because
+    migration is not atomic
+    """
+    Entry = apps.get_model("feed", "Entry")
+    EntryRead = apps.get_model("feed", "EntryRead")
+    ReadState = apps.get_model("feed", "ReadState")
+    max_ids = settings.READ_STATE_MAX_IDS
+    user_ids = list(
+        EntryRead.objects.order_by("user_id")
+        .values_list("user_id", flat=True)
+        .distinct()
+    )
+    for user_id in user_ids:
+        reads = (
+            EntryRead.objects.filter(user_id=user_id)
+            .order_by("entry__feed_id", "entry_id")
+            .values_list("entry__feed_id", "entry_id")
+        )
+        states = []
+        for feed_id, feed_reads in itertools.groupby(reads, key=lambda read: read[0]):
+            bitmap = IdBitmap(entry_id for _, entry_id in feed_reads)
+            read_until = 0
+            entry_ids = (
+                Entry.objects.filter(feed_id=feed_id)
+                .order_by("id")
+                .values_list("id", flat=True)
+            )
+            for entry_id in entry_ids[: len(bitmap)]:
+                if entry_id not in bitmap:
+                    break
+                read_until = entry_id
+            bitmap.discard_until(read_until)
+            if len(bitmap) > max_ids:
+                read_until = list(bitmap)[-max_ids - 1]
+                bitmap.discard_until(read_until)
+            states.append(
+                ReadState(
+                    user_id=user_id,
+                    feed_id=feed_id,
+                    read_until=read_until,
+                    read_ids=bitmap.to_bytes(),
+                )
+            )
+        ReadState.objects.bulk_create(states, batch_size=BATCH_SIZE)
+
+
+def expand_read_states(apps, schema_editor):
+    """
+    Expand read states to one read of every read entry
+    """
+    Entry = apps.get_model("feed", "Entry")
+    EntryRead = apps.get_model("feed", "EntryRead")
+    ReadState = apps.get_model("feed", "ReadState")
+    for state in ReadState.objects.order_by("id").iterator(chunk_size=BATCH_SIZE):
+        entry_ids = itertools.chain(
+            Entry.objects.filter(
+                feed_id=state.feed_id, id__lte=state.read_until
+            ).values_list("id", flat=True),
+            IdBitmap.from_bytes(state.read_ids),
+        )
+        EntryRead.objects.bulk_create(
+            (
+                EntryRead(user_id=state.user_id, entry_id=entry_id)
+                for entry_id in entry_ids
+            ),
+            batch_size=BATCH_SIZE,
+        )
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("feed", "0010_cursor_pagination_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReadState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "read_until",
+                    models.BigIntegerField(
+                        default=0, help_text="Entries of feed up to this id are read."
+                    ),
+                ),
+                (
+                    "read_ids",
+                    models.BinaryField(
+                        default=b"",
+                        help_text="Bitmap of read entries after read_until.",
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "feed",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="feed.feed"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="read_states",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("user", "feed")},
+            },
+        ),
+        migrations.AddIndex(
+            model_name="entry",
+            index=models.Index(
+                fields=["feed", "id"], name="feed_entry_feed_id_01cb43_idx"
+            ),
+        ),
+        migrations.RunPython(copy_entry_reads, expand_read_states),
+        migrations.RemoveField(
+            model_name="entry",
+            name="reads",
+        ),
+        migrations.DeleteModel(
+            name="EntryRead",
+        ),
+    ]
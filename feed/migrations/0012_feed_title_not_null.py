@@ -0,0 +1,30 @@
+# Generated by Django 3.2.7 on 2026-10-18 19:59
+
+from django.db import migrations, models
+
+
+def fill_empty_titles(apps, schema_editor):
+    """
+    Untitled feeds have an empty title instead of NULL, so title can be a
+    key of keyset pagination
+    """
+    Feed = apps.get_model("feed", "Feed")
+    Feed.objects.filter(title__isnull=True).update(title="")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("feed", "0011_read_state"),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_empty_titles, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="feed",
+            name="title",
+            field=models.CharField(
+                blank=True, default="", help_text="Title of feed.", max_length=100
+            ),
+        ),
+    ]
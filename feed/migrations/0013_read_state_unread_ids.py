@@ -0,0 +1,60 @@
+# Generated by Django 3.2.7 on 2026-10-18 20:02
+
+from django.db import migrations, models
+from django.db.models import Max
+
+# format of bitmaps is stored in database, so it does not change
+from feed.bitmaps import IdBitmap
+
+
+BATCH_SIZE = 5000
+
+
+def fold_unread_ids(apps, schema_editor):
+    """
+    Move read_until of read states before their first unread entry, read
+    entries between it and old read_until go to bitmap of reads
+    """
+    Entry = apps.get_model("feed", "Entry")
+    ReadState = apps.get_model("feed", "ReadState")
+    states = ReadState.objects.exclude(unread_ids=b"").order_by("id")
+    for state in states.iterator(chunk_size=BATCH_SIZE):
+        unreads = IdBitmap.from_bytes(state.unread_ids)
+        if not len(unreads):
+            continue
+        entries = Entry.objects.filter(feed_id=state.feed_id)
+        read_until = (
+            entries.filter(id__lt=min(unreads)).aggregate(read_until=Max("id"))[
+                "read_until"
+            ]
+            or 0
+        )
+        reads = IdBitmap.from_bytes(state.read_ids)
+        for entry_id in entries.filter(
+            id__gt=read_until, id__lte=state.read_until
+        ).values_list("id", flat=True):
+            if entry_id not in unreads:
+                reads.add(entry_id)
+        ReadState.objects.filter(id=state.id).update(
+            read_until=read_until, read_ids=reads.to_bytes(), unread_ids=b""
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("feed", "0012_feed_title_not_null"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="readstate",
+            name="unread_ids",
+            field=models.BinaryField(
+                default=b"", help_text="Bitmap of unread entries up to read_until."
+            ),
+        ),
+        # existing read states have no unread entries, reverse folds them
+        # into reads before the field is removed
+        migrations.RunPython(migrations.RunPython.noop, fold_unread_ids),
+    ]
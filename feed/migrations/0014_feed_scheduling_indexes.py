@@ -0,0 +1,35 @@
+# Generated by Django 3.2.7 on 2026-10-18 20:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("feed", "0013_read_state_unread_ids"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="feed",
+            name="feed_feed_status_045f6f_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="feed",
+            name="feed_feed_status_793acd_idx",
+        ),
+        migrations.AddIndex(
+            model_name="feed",
+            index=models.Index(
+                fields=["status", "priority", "next_fetch_at", "id"],
+                name="feed_feed_status_1bbad8_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="feed",
+            index=models.Index(
+                fields=["status", "next_fetch_at", "id"],
+                name="feed_feed_status_33f69c_idx",
+            ),
+        ),
+    ]
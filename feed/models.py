@@ -1,8 +1,16 @@
+import typing
+from datetime import datetime, timedelta
+
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext
 
-from feed.managers import FeedManager
+from feed.bitmaps import IdBitmap
+from feed.links import canonicalize_url, hash_link
+from feed.managers import EntryManager, FeedManager, ReadStateManager
+from feed.scheduling import compute_next_fetch_at, estimate_publish_interval
+from utils.counting import invalidate_counts
 
 
 class Feed(models.Model):
@@ -14,6 +22,8 @@ class Feed(models.Model):
         (PENDING, "PENDING"),
         (ERROR, "ERROR"),
     )
+    # statuses of feeds that periodic fetch schedules
+    SCHEDULED_STATUSES = (ACTIVE, ERROR)
     HIGH = 2
     LOW = 1
     STOP = 0
@@ -22,6 +32,14 @@ class Feed(models.Model):
         (LOW, "LOW"),
         (STOP, "STOP"),
     )
+    CLOSED = "C"
+    OPEN = "O"
+    HALF_OPEN = "H"
+    circuit_state_choices = (
+        (CLOSED, "CLOSED"),
+        (OPEN, "OPEN"),
+        (HALF_OPEN, "HALF_OPEN"),
+    )
     timeout_choices = (
         (1, 1),
         (2, 2),
@@ -36,7 +54,7 @@ class Feed(models.Model):
     )
     creator = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     title = models.CharField(
-        max_length=100, help_text=gettext("Title of feed."), default=None, null=True
+        max_length=100, help_text=gettext("Title of feed."), default="", blank=True
     )
     link = models.URLField(
         max_length=200, unique=True, db_index=True, help_text=gettext("Link of feed.")
@@ -62,37 +80,262 @@ class Feed(models.Model):
     followers = models.ManyToManyField(
         settings.AUTH_USER_MODEL, through="FollowFeed", related_name="feed_followed"
     )
+    http_etag = models.CharField(
+        max_length=255,
+        null=True,
+        blank=True,
+        help_text=gettext("ETag header of last response of feed."),
+    )
+    http_last_modified = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        help_text=gettext("Last-Modified header of last response of feed."),
+    )
+    content_digest = models.CharField(
+        max_length=32,
+        null=True,
+        blank=True,
+        help_text=gettext("Digest of body of last response of feed."),
+    )
+    redirect_link = models.URLField(
+        max_length=200,
+        null=True,
+        blank=True,
+        help_text=gettext("Target of permanent redirects of link of feed."),
+    )
+    redirect_count = models.PositiveSmallIntegerField(
+        default=0, help_text=gettext("Count of last fetches redirected to target.")
+    )
+    next_fetch_at = models.DateTimeField(
+        default=timezone.now, help_text=gettext("Time of next fetch of feed.")
+    )
+    publish_interval = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text=gettext("Estimated seconds between publishing of entries."),
+    )
+    unchanged_count = models.PositiveSmallIntegerField(
+        default=0, help_text=gettext("Count of last fetches without new entries.")
+    )
+    consecutive_failures = models.PositiveSmallIntegerField(
+        default=0, help_text=gettext("Count of last failed fetches.")
+    )
+    circuit_state = models.CharField(
+        max_length=1,
+        choices=circuit_state_choices,
+        default=CLOSED,
+        help_text=gettext("State of circuit breaker of fetching of feed."),
+    )
+    last_published_at = models.DateTimeField(
+        null=True, blank=True, help_text=gettext("Publish time of newest entry.")
+    )
+    last_fetched_at = models.DateTimeField(
+        null=True, blank=True, help_text=gettext("Time of last fetch of feed.")
+    )
+    last_status_code = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        help_text=gettext("Status code of last response of feed."),
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
     class Meta:
         ordering = ("title",)
+        indexes = (
+            # due feeds of schedule_fetch_feed_batch in order of next_fetch_at
+            models.Index(fields=("status", "priority", "next_fetch_at", "id")),
+            models.Index(fields=("status", "next_fetch_at", "id")),
+            # cursor pagination of feed lists
+            models.Index(fields=("title", "id")),
+            models.Index(fields=("status", "title", "id")),
+        )
 
     objects = FeedManager()
 
+    # fields changed by fetching of feed
+    fetch_state_fields = (
+        "title",
+        "link",
+        "redirect_link",
+        "redirect_count",
+        "status",
+        "priority",
+        "http_etag",
+        "http_last_modified",
+        "content_digest",
+        "next_fetch_at",
+        "publish_interval",
+        "unchanged_count",
+        "consecutive_failures",
+        "circuit_state",
+        "last_published_at",
+        "last_fetched_at",
+        "last_status_code",
+    )
+
     def __str__(self):
         return "Feed: {}".format(self.title)
 
-    def feed_success(self):
+    def feed_success(
+        self,
+        published_dates: typing.Sequence[datetime] = (),
+        followers_count: int = 0,
+        status_code: int = None,
+        save: bool = True,
+    ):
         """
         it happen when fetching feed succeed
 
+        next fetch is scheduled based on publish cadence of feed
+
+        :param published_dates: publish time of new entries
+        :param followers_count:
+        :param status_code: status code of response
+        :param save: False to save it later, for example with bulk update
         :return:
         """
-        increase_done = self._increase_priority()
-        status_change_done = self._check_feed_status_success()
-        if increase_done or status_change_done:
+        self._increase_priority()
+        status_changed = self._check_feed_status_success()
+        self.publish_interval = estimate_publish_interval(
+            published_dates, self.last_published_at, self.publish_interval
+        )
+        if published_dates:
+            self.last_published_at = max(
+                filter(None, (*published_dates, self.last_published_at))
+            )
+        self.unchanged_count = 0 if published_dates else self.unchanged_count + 1
+        self.consecutive_failures = 0
+        self.circuit_state = self.CLOSED
+        self.last_fetched_at = timezone.now()
+        self.last_status_code = status_code
+        self.next_fetch_at = compute_next_fetch_at(self, followers_count)
+        if save:
             self.save()
+            if status_changed:
+                invalidate_counts(Feed)
 
-    def feed_fail(self):
+    def feed_fail(self, status_code: int = None, save: bool = True):
         """
         it happen when fetching feed face an error
+
+        circuit of feed opens after FEED_CIRCUIT_FAILURE_THRESHOLD failures
+        and a failed trial fetch of a HALF_OPEN circuit opens it again,
+        next fetch is backed off exponentially with jitter and priority is
+        not changed, so flaky feeds recover with their first success
+
+        it uses queryset update to not trigger update_feed signal, a failed
+        PENDING feed is retried after its backoff by fetch_feed_entries
+        :param status_code: status code of response, None if there was not any
+        :param save: False to save it later, for example with bulk update
         :return:
         """
-        decrease_done = self._decrease_priority()
-        status_change_done = self._check_feed_status_fail()
-        if decrease_done or status_change_done:
-            self.save()
+        self.consecutive_failures += 1
+        if (
+            self.circuit_state == self.HALF_OPEN
+            or self.consecutive_failures >= settings.FEED_CIRCUIT_FAILURE_THRESHOLD
+        ):
+            self.circuit_state = self.OPEN
+        status_changed = self._check_feed_status_fail()
+        self.last_fetched_at = timezone.now()
+        self.last_status_code = status_code
+        self.next_fetch_at = compute_next_fetch_at(self)
+        if save:
+            Feed.objects.filter(id=self.id).update(
+                **{field: getattr(self, field) for field in self.fetch_state_fields}
+            )
+            if status_changed:
+                invalidate_counts(Feed)
+
+    def feed_throttled(self, delay: float, status_code: int = None, save: bool = True):
+        """
+        it happen when host of feed is rate limited, by our limiter or by
+        server with 429
+
+        it is not a failure, so priority and failures are not changed and
+        feed is fetched again after delay
+
+        it uses queryset update to not trigger update_feed signal
+        :param delay: seconds to wait before next fetch
+        :param status_code: status code of response, None if not requested
+        :param save: False to save it later, for example with bulk update
+        :return:
+        """
+        self.next_fetch_at = timezone.now() + timedelta(seconds=delay)
+        if status_code is not None:
+            self.last_status_code = status_code
+        if save:
+            Feed.objects.filter(id=self.id).update(
+                next_fetch_at=self.next_fetch_at,
+                last_status_code=self.last_status_code,
+            )
+
+    def update_http_validators(
+        self, etag: str, modified: str, content_digest: str = None, save: bool = True
+    ):
+        """
+        Keep ETag and Last-Modified of last response to replay them in
+        next conditional request of feed, and digest of its body to skip
+        parsing of same body in next fetch
+
+        it uses queryset update to not trigger update_feed signal
+
+        validators longer than their field are dropped, a truncated one
+        never matches in a conditional request
+
+        :param save: False to save it later, for example with bulk update
+        :return: True if validators changed else if not changed
+        """
+        if etag and len(etag) > self._meta.get_field("http_etag").max_length:
+            etag = None
+        if (
+            modified
+            and len(modified) > self._meta.get_field("http_last_modified").max_length
+        ):
+            modified = None
+        if (
+            self.http_etag == etag
+            and self.http_last_modified == modified
+            and self.content_digest == content_digest
+        ):
+            return False
+        self.http_etag = etag
+        self.http_last_modified = modified
+        self.content_digest = content_digest
+        if save:
+            Feed.objects.filter(id=self.id).update(
+                http_etag=etag,
+                http_last_modified=modified,
+                content_digest=content_digest,
+            )
+        return True
+
+    def track_permanent_redirect(self, url: typing.Optional[str]):
+        """
+        Count fetches that are permanently redirected to same url, link is
+        replaced by it after FEED_PERMANENT_REDIRECT_THRESHOLD fetches
+
+        it does not save feed, feed_success saves it
+
+        :param url: final url of permanent redirects, None if not redirected
+        :return: True if link is replaced else if not replaced
+        """
+        url = canonicalize_url(url) if url else None
+        if url is None or url == canonicalize_url(self.link) or len(url) > 200:
+            self.redirect_link, self.redirect_count = None, 0
+            return False
+        if url != self.redirect_link:
+            self.redirect_link, self.redirect_count = url, 0
+        self.redirect_count += 1
+        if self.redirect_count < settings.FEED_PERMANENT_REDIRECT_THRESHOLD:
+            return False
+        self.redirect_link, self.redirect_count = None, 0
+        if Feed.objects.filter(link=url).exists():
+            # another feed has this link already
+            return False
+        self.link = url
+        return True
 
     def _increase_priority(self):
         """
@@ -112,37 +355,28 @@ class Feed(models.Model):
 
             2. after update by creator or admin (update link or force_update)
 
-        so we check status and change it to ACTIVE to participate in periodic task
+        so we check status and change it to ACTIVE to participate in periodic task,
+        an ERROR feed that is fetched again by its probe is ACTIVE again too
         :return: True if status changed else if not increased
         """
-        if self.status == self.PENDING:
+        if self.status in (self.PENDING, self.ERROR):
             self.status = self.ACTIVE
             return True
 
-    def _decrease_priority(self):
-        """
-        Decrease feed priority
-
-        if priority rich STOP (zero) status will update to ERROR
-
-        :return: True if status decreased else if not decreased
-        """
-        if self.priority > self.STOP:
-            self.priority -= 1
-            if self.priority == self.STOP:
-                self.status = self.ERROR
-            return True
-
     def _check_feed_status_fail(self):
         """
-        Decrease feed priority
+        Mark feed ERROR after FEED_CIRCUIT_ERROR_FAILURES failures
 
         it happen when fetching feed face an error
 
-        if priority rich STOP (zero) status will update to ERROR
-        :return:
+        status will update to ERROR and an admin should check the logs,
+        ERROR feeds are still probed once per FEED_MAX_FETCH_INTERVAL
+        :return: True if status changed else if not changed
         """
-        if self.status == self.PENDING:
+        if (
+            self.status != self.ERROR
+            and self.consecutive_failures >= settings.FEED_CIRCUIT_ERROR_FAILURES
+        ):
             self.status = self.ERROR
             return True
 
@@ -159,30 +393,139 @@ class FollowFeed(models.Model):
 class Entry(models.Model):
     feed = models.ForeignKey(Feed, on_delete=models.CASCADE)
     title = models.CharField(max_length=200, help_text=gettext("Title of entry."))
-    link = models.CharField(
-        max_length=500, unique=True, help_text=gettext("Link of entry.")
+    link = models.CharField(max_length=500, help_text=gettext("Link of entry."))
+    link_hash = models.BigIntegerField(
+        unique=True, editable=False, help_text=gettext("Digest of link of entry.")
     )
     summary = models.CharField(max_length=2000, help_text=gettext("Summary of entry."))
     created_at = models.DateTimeField(
         auto_now_add=True, help_text=gettext("Creation time of entry.")
     )
     published_at = models.DateTimeField(help_text=gettext("Publish Time of entry."))
-    reads = models.ManyToManyField(
-        settings.AUTH_USER_MODEL, through="EntryRead", related_name="entries_read"
-    )
 
     class Meta:
         verbose_name_plural = "entries"
         ordering = ("-published_at",)
+        indexes = (
+            # cursor pagination of entries and entries of a feed
+            models.Index(fields=("published_at", "id")),
+            models.Index(fields=("feed", "published_at", "id")),
+            # entries of a feed after read_until of a read state
+            models.Index(fields=("feed", "id")),
+        )
+
+    objects = EntryManager()
 
     def __str__(self):
         return "Feed entry: {}".format(self.title)
 
+    def save(self, *args, **kwargs):
+        self.link_hash = hash_link(self.link)
+        super().save(*args, **kwargs)
 
-class EntryRead(models.Model):
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    entry = models.ForeignKey(Entry, on_delete=models.CASCADE)
-    created_at = models.DateTimeField(auto_now_add=True)
+
+class ReadState(models.Model):
+    """
+    Read entries of a feed for a user
+
+    entries of feed up to read_until are read except ones in unread_ids
+    bitmap, entries after it are unread except ones in read_ids bitmap, so
+    a user has one row per feed instead of one per read entry
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="read_states"
+    )
+    feed = models.ForeignKey(Feed, on_delete=models.CASCADE)
+    read_until = models.BigIntegerField(
+        default=0, help_text=gettext("Entries of feed up to this id are read.")
+    )
+    read_ids = models.BinaryField(
+        default=b"", help_text=gettext("Bitmap of read entries after read_until.")
+    )
+    unread_ids = models.BinaryField(
+        default=b"", help_text=gettext("Bitmap of unread entries up to read_until.")
+    )
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        unique_together = ("user", "entry")
+        unique_together = ("user", "feed")
+
+    objects = ReadStateManager()
+
+    def __str__(self):
+        return "Read state: {} of {}".format(self.feed_id, self.user_id)
+
+    def read_entry_ids(self) -> IdBitmap:
+        return IdBitmap.from_bytes(self.read_ids)
+
+    def unread_entry_ids(self) -> IdBitmap:
+        return IdBitmap.from_bytes(self.unread_ids)
+
+    def add_reads(self, entry_ids: typing.Iterable[int]):
+        """
+        Add read entries of feed, read_until moves to the entry that keeps
+        fewest ids in bitmaps, so reads in order keep none and reads of
+        newest entries first keep older unread entries instead of reads
+
+        bitmaps keep at most READ_STATE_MAX_IDS ids, when there are more
+        read_until moves further and oldest unread entries are marked read
+        """
+        reads, unreads = self.read_entry_ids(), self.unread_entry_ids()
+        for entry_id in entry_ids:
+            if entry_id > self.read_until:
+                reads.add(entry_id)
+            else:
+                unreads.discard(entry_id)
+        if len(reads):
+            self._move_read_until(reads, unreads)
+        max_ids = settings.READ_STATE_MAX_IDS
+        if len(unreads) > max_ids:
+            unreads = IdBitmap(list(unreads)[-max_ids:])
+        self.read_ids = reads.to_bytes()
+        self.unread_ids = unreads.to_bytes()
+
+    def _move_read_until(self, reads: IdBitmap, unreads: IdBitmap):
+        """
+        Move read_until over entries up to last read, to the first position
+        with fewest read entries after it plus unread entries before it of
+        positions that keep at most READ_STATE_MAX_IDS reads
+        """
+        max_ids = settings.READ_STATE_MAX_IDS
+        read_count = len(reads)
+        next_ids = Entry.objects.filter(
+            feed_id=self.feed_id, id__gt=self.read_until, id__lte=max(reads)
+        ).order_by("id")
+        if read_count <= max_ids:
+            # after more unread entries than reads, positions keep more ids
+            # than read_until keeps now
+            next_ids = next_ids[: 2 * read_count]
+        best = self.read_until if read_count <= max_ids else None
+        best_cost = cost = 0
+        passed_unreads, best_unreads = [], 0
+        for entry_id in next_ids.values_list("id", flat=True):
+            if entry_id in reads:
+                cost -= 1
+                read_count -= 1
+            else:
+                cost += 1
+                passed_unreads.append(entry_id)
+            if read_count <= max_ids and (best is None or cost < best_cost):
+                best, best_cost, best_unreads = entry_id, cost, len(passed_unreads)
+        if best is None or best == self.read_until:
+            return
+        self.read_until = best
+        reads.discard_until(best)
+        for entry_id in passed_unreads[:best_unreads]:
+            unreads.add(entry_id)
+
+    def read_all(self, read_until: int):
+        """
+        Mark all entries of feed up to read_until read
+        """
+        reads, unreads = self.read_entry_ids(), self.unread_entry_ids()
+        self.read_until = max(self.read_until, read_until)
+        reads.discard_until(self.read_until)
+        unreads.discard_until(read_until)
+        self.read_ids = reads.to_bytes()
+        self.unread_ids = unreads.to_bytes()
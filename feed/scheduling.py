@@ -0,0 +1,126 @@
+import math
+import random
+import typing
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+
+def estimate_publish_interval(
+    published_dates: typing.Iterable[datetime],
+    last_published_at: typing.Optional[datetime],
+    previous_interval: typing.Optional[int],
+) -> typing.Optional[int]:
+    """
+    Estimate seconds between publishing of entries of a feed
+
+    observed interval of new entries is smoothed with previous estimation
+    by an exponentially weighted moving average
+
+    :param published_dates: publish time of new entries
+    :param last_published_at: publish time of newest entry before new entries
+    :param previous_interval: previous estimation
+    :return: new estimation, previous one if new entries are not enough
+    """
+    published_dates = sorted(published_dates)
+    if last_published_at and published_dates:
+        span = published_dates[-1] - last_published_at
+        count = len(published_dates)
+    elif len(published_dates) > 1:
+        span = published_dates[-1] - published_dates[0]
+        count = len(published_dates) - 1
+    else:
+        return previous_interval
+    observed = max(span.total_seconds() / count, 0)
+    if previous_interval is None:
+        return int(observed)
+    weight = settings.FEED_PUBLISH_INTERVAL_WEIGHT
+    return int(weight * observed + (1 - weight) * previous_interval)
+
+
+def compute_fetch_interval(
+    publish_interval: typing.Optional[int],
+    unchanged_count: int = 0,
+    consecutive_failures: int = 0,
+    followers_count: int = 0,
+) -> int:
+    """
+    Seconds to wait before next fetch of a feed
+
+        1. failing feeds back off exponentially
+
+        2. otherwise feed is polled twice per publish interval (or default
+        interval if it is unknown), every fetch without new entries makes
+        it longer and followers make it shorter
+
+    result is bounded by FEED_MIN_FETCH_INTERVAL and FEED_MAX_FETCH_INTERVAL
+    """
+    if consecutive_failures:
+        interval = settings.FEED_ERROR_BACKOFF * 2 ** min(consecutive_failures - 1, 16)
+    else:
+        if publish_interval:
+            interval = publish_interval / 2
+        else:
+            interval = settings.FEED_DEFAULT_FETCH_INTERVAL
+        interval *= settings.FEED_UNCHANGED_BACKOFF ** min(unchanged_count, 16)
+        interval /= 1 + math.log10(1 + followers_count)
+    return int(
+        min(
+            max(interval, settings.FEED_MIN_FETCH_INTERVAL),
+            settings.FEED_MAX_FETCH_INTERVAL,
+        )
+    )
+
+
+def compute_next_fetch_at(feed, followers_count: int = 0) -> datetime:
+    interval = compute_fetch_interval(
+        feed.publish_interval,
+        unchanged_count=feed.unchanged_count,
+        consecutive_failures=feed.consecutive_failures,
+        followers_count=followers_count,
+    )
+    if feed.status == feed.ERROR:
+        # broken feeds are just probed, so they recover when they are fixed
+        interval = settings.FEED_MAX_FETCH_INTERVAL
+    if feed.consecutive_failures:
+        interval = jitter(interval)
+    next_fetch_at = timezone.now() + timedelta(seconds=interval)
+    if feed.id is None:
+        return next_fetch_at
+    # feeds are due at their phase, so ticks of scheduler enqueue a steady
+    # share of them instead of cohorts of feeds that were fetched together
+    return next_fetch_at + timedelta(
+        seconds=fetch_countdown(feed.id, next_fetch_at, settings.FEED_SCHEDULE_WINDOW)
+    )
+
+
+def jitter(interval: float) -> float:
+    """
+    Random interval between half of interval and interval
+
+    retries of feeds that failed together, like feeds of a host that was
+    down, are spread instead of hitting it together again
+    """
+    return random.uniform(interval / 2, interval)
+
+
+def fetch_phase(feed_id: int, window: int) -> float:
+    """
+    Stable offset of a feed in a scheduling window of seconds
+
+    ids are scattered by a multiplicative hash, so feeds with consecutive
+    ids are spread over window too
+    """
+    return (feed_id * 2654435761 % 2 ** 32) / 2 ** 32 * window
+
+
+def fetch_countdown(feed_id: int, now: datetime, window: int) -> float:
+    """
+    Seconds from now until phase of a feed in window, 0 without window
+
+    next_fetch_at of feeds is moved to their phase by it
+    """
+    if not window:
+        return 0.0
+    return (fetch_phase(feed_id, window) - now.timestamp()) % window
@@ -2,6 +2,7 @@ from django.db import transaction
 from rest_framework import serializers
 
 from authnz.serializers import NestedUserSerializer
+from feed.links import canonicalize_url
 from feed.models import Feed
 
 
@@ -19,6 +20,10 @@ class FeedSerializers(serializers.Serializer):
     created_at = serializers.DateTimeField(read_only=True)
     updated_at = serializers.DateTimeField(read_only=True)
 
+    def validate_link(self, value):
+        # same feed with another form of link is a duplicate
+        return canonicalize_url(value)
+
     def to_internal_value(self, data):
         data = super().to_internal_value(data)
         if not self.instance:  # check for update or create
@@ -1,14 +1,15 @@
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 
-from feed.tasks import fetch_feed_entries
-from feed.models import Feed
+from feed.tasks import enqueue_fetch_feed
+from feed.models import Entry, Feed, FollowFeed
+from utils.counting import invalidate_counts
 
 
 @receiver(post_save, sender=Feed, dispatch_uid="update_feed")
 def update_feed(sender, instance, **kwargs):
     """
-    Run fetch_feed_entries background task
+    Run fetch_feed_entries background task, unless it is enqueued already
 
     it happen in 2 case
 
@@ -22,4 +23,45 @@ def update_feed(sender, instance, **kwargs):
     :return:
     """
     if instance.status == Feed.PENDING:
-        fetch_feed_entries.apply_async((instance.id,))
+        enqueue_fetch_feed(instance.id)
+
+
+@receiver(post_save, sender=Feed, dispatch_uid="invalidate_feed_counts")
+def invalidate_feed_counts(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Drop cached counts of feed lists after creation and edits of a feed
+
+    fetches save feeds without update_fields, they drop counts by
+    themselves when status of feed is changed
+    """
+    if created or update_fields:
+        invalidate_counts(Feed)
+
+
+@receiver(post_delete, sender=Feed, dispatch_uid="invalidate_deleted_feed_counts")
+def invalidate_deleted_feed_counts(sender, **kwargs):
+    """
+    Drop cached counts of lists after a feed and its cascades are deleted
+
+    models of cascades do not have delete receivers, so their rows are
+    deleted without loading them
+    """
+    invalidate_counts(Feed, FollowFeed, Entry)
+
+
+@receiver(post_save, sender=FollowFeed, dispatch_uid="invalidate_follow_counts")
+def invalidate_model_counts(sender, **kwargs):
+    """
+    Drop cached counts of lists that read table of sender
+    """
+    invalidate_counts(sender)
+
+
+@receiver(m2m_changed, sender=FollowFeed, dispatch_uid="invalidate_follows_counts")
+def invalidate_relation_counts(sender, action, **kwargs):
+    """
+    Drop cached counts of lists that read a relation after add, remove or
+    clear of it, they do not send post_save and post_delete
+    """
+    if action.startswith("post_"):
+        invalidate_counts(sender)
@@ -1,67 +1,316 @@
 import logging
+import typing
+
+from datetime import timedelta
 
 from celery import group
-from django.db.models import OuterRef, Subquery
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, Value, When
 from django.db.utils import DataError
+from django.utils import timezone
 
-from feed.models import Feed, Entry
-from feedcloud.celery import app
-from feedreader.exceptions import FeedReaderBaseException
+from feed.backpressure import measure_pipeline, record_metrics
+from feed.ingest import (
+    build_entries,
+    fetch_feeds,
+    fetch_feeds_async,
+    get_parser_agent,
+    get_request_agent,
+    persist_fetch_results,
+    save_entries,
+)
+from feed.leases import (
+    acquire_leases,
+    claim_enqueue,
+    lease_seconds,
+    lease_ttl,
+    release_leases,
+)
+from feed.models import Feed
+from feed.throttle import acquire_host, block_host, track_host
+from feedcloud.celery import INTERACTIVE_QUEUE, app
+from feedreader.exceptions import FeedReaderBaseException, RateLimitedException
 from feedreader.feedreader import FeedReader
 
 
 logger = logging.getLogger(__name__)
 
 
+def _feeds_to_fetch():
+    """
+    Feeds annotated with followers_count that scheduling needs
+    """
+    return Feed.objects.annotate(followers_count=Count("followers"))
+
+
+def enqueue_fetch_feed(feed_id: int, countdown: float = 0):
+    """
+    Enqueue fetch of a feed unless it is enqueued already
+
+    it is a fetch that a user waits for, so it goes to interactive queue,
+    it is not collapsed into a periodic fetch of feed that waits in
+    background queue
+
+    it is claimed and published after commit of current transaction, so
+    the fetch reads the saved feed and a rolled back save does not leave
+    feed marked enqueued
+    """
+
+    def enqueue():
+        if claim_enqueue(
+            (feed_id,), ttl=countdown + settings.FEED_FETCH_LEASE, interactive=True
+        ):
+            fetch_feed_entries.apply_async(
+                (feed_id,), countdown=countdown, queue=INTERACTIVE_QUEUE
+            )
+
+    transaction.on_commit(enqueue)
+
+
+def _message_priorities(
+    feed_ids: typing.List[int], priority: int = None
+) -> typing.Dict[int, int]:
+    """
+    Message priority of background fetch of feeds by id of feed, based on
+    FEED_FETCH_MESSAGE_PRIORITY
+
+    :param priority: priority of all feeds if it is known
+    """
+    if priority is None:
+        priorities = dict(
+            Feed.objects.filter(id__in=feed_ids).values_list("id", "priority")
+        )
+    else:
+        priorities = dict.fromkeys(feed_ids, priority)
+    return {
+        feed_id: settings.FEED_FETCH_MESSAGE_PRIORITY.get(priorities.get(feed_id), 0)
+        for feed_id in feed_ids
+    }
+
+
 @app.task(name="schedule_fetch_feed_batch")
-def schedule_fetch_feed_batch(priority: int):
-    for feed_batch in Feed.objects.batch_get_feeds(priority=priority):
-        group(fetch_feed_entries.s(feed_id) for feed_id in feed_batch).delay()
+def schedule_fetch_feed_batch(priority: int = None):
+    """
+    Enqueue fetch of ACTIVE and ERROR feeds that their next_fetch_at is passed
+
+    dispatched feeds are leased for FEED_FETCH_LEASE seconds to not be
+    enqueued again by next runs before their fetch schedule them, open
+    circuits of them become half open, their fetch is a trial
+
+    feeds that are enqueued or being fetched already are not enqueued
+
+    a tick is skipped when fetch queue is saturated, otherwise the most
+    overdue feeds are enqueued up to budget of pipeline, others stay due
+    for next ticks, metrics of tick are recorded
+
+    messages are prioritized by priority of their feeds in background queue
+    and are published when their feeds are due, without countdown, workers
+    reserve messages with an ETA at once, so priority and prefetch limit
+    would not apply to them and queue depth would not count them, fetches
+    are spread by next_fetch_at of feeds that is at their stable phase in
+    FEED_SCHEDULE_WINDOW and by ticks every FEED_SCHEDULE_TICK seconds
+
+    :param priority: just feeds of this priority
+    :return:
+    """
+    now = timezone.now()
+    engine = settings.FEED_FETCH_ENGINE
+    metrics = measure_pipeline(now, priority=priority)
+    metrics["enqueued"] = 0
+    if not metrics["budget"]:
+        logger.warning("Schedule tick is skipped, fetch pipeline is saturated.")
+        record_metrics(metrics)
+        return
+    for feed_batch in Feed.objects.batch_get_feeds(
+        priority=priority,
+        due_at=now,
+        batch_size=settings.FEED_ASYNC_BATCH_SIZE if engine == "asyncio" else None,
+        limit=metrics["budget"],
+    ):
+        feed_batch = claim_enqueue(
+            feed_batch, ttl=settings.FEED_FETCH_LEASE, in_flight=True
+        )
+        if not feed_batch:
+            continue
+        metrics["enqueued"] += len(feed_batch)
+        Feed.objects.filter(id__in=feed_batch).update(
+            next_fetch_at=now + timedelta(seconds=settings.FEED_FETCH_LEASE),
+            circuit_state=Case(
+                When(circuit_state=Feed.OPEN, then=Value(Feed.HALF_OPEN)),
+                default=F("circuit_state"),
+            ),
+        )
+        message_priorities = _message_priorities(feed_batch, priority=priority)
+        if engine in ("batch", "asyncio"):
+            priority_batches = {}
+            for feed_id in feed_batch:
+                priority_batches.setdefault(message_priorities[feed_id], []).append(
+                    feed_id
+                )
+            for message_priority, priority_batch in sorted(
+                priority_batches.items(), reverse=True
+            ):
+                fetch_feed_batch_entries.apply_async(
+                    (priority_batch,), priority=message_priority
+                )
+        else:
+            group(
+                fetch_feed_entries.signature(
+                    (feed_id,), priority=message_priorities[feed_id]
+                )
+                for feed_id in feed_batch
+            ).delay()
+    record_metrics(metrics)
+
+
+@app.task(name="fetch_feed_batch_entries")
+def fetch_feed_batch_entries(feed_ids: typing.List[int]):
+    """
+    Fetch a batch of feeds and save their entries and changes in bulk
+
+    feeds are loaded by one query, fetched one by one or concurrently on an
+    event loop based on FEED_FETCH_ENGINE and saved by one bulk insert and
+    one bulk update
+
+    feeds that are being fetched by another task are skipped
+    """
+    feeds = list(_feeds_to_fetch().filter(id__in=feed_ids))
+    asyncio_engine = settings.FEED_FETCH_ENGINE == "asyncio"
+    leases = acquire_leases(
+        [feed.id for feed in feeds],
+        lease_seconds(
+            [feed.timeout for feed in feeds],
+            concurrency=settings.FEED_ASYNC_CONCURRENCY if asyncio_engine else 1,
+        ),
+    )
+    if len(leases) < len(feeds):
+        logger.info(f"{len(feeds) - len(leases)} feeds are being fetched.")
+        feeds = [feed for feed in feeds if feed.id in leases]
+    try:
+        if asyncio_engine:
+            results = fetch_feeds_async(feeds)
+        else:
+            results = fetch_feeds(feeds)
+        persist_fetch_results(results)
+    finally:
+        release_leases(leases)
+
+
+def _fetch_failed(feed: Feed, error: Exception, status_code: typing.Optional[int]):
+    """
+    Count failure in circuits of feed and its host
+
+    :return: seconds to retry a PENDING feed after, None for other feeds
+    """
+    track_host(feed.link, error, status_code)
+    feed.feed_fail(status_code=status_code)
+    if feed.status == Feed.PENDING:
+        return max((feed.next_fetch_at - timezone.now()).total_seconds(), 0)
+    return None
 
 
 @app.task(name="fetch_feed_entries")
 def fetch_feed_entries(feed_id: int):
-    last_entry = (
-        Entry.objects.filter(feed=OuterRef("pk"))
-        .values("published_at")
-        .order_by("-published_at")[:1]
-    )
+    """
+    Fetch a feed and save its entries
+
+    at most one fetch of a feed is in flight, its lease expires after
+    timeout of feed and FEED_FETCH_LEASE_MARGIN, scheduler does not fetch
+    PENDING feeds, so their retry is enqueued after their lease is released
+
+    errors other than FeedReaderBaseException are raised after they are
+    counted as failure
+    """
     try:
-        feed = Feed.objects.annotate(last_modified=Subquery(last_entry)).get(id=feed_id)
+        feed = _feeds_to_fetch().get(id=feed_id)
     except Feed.DoesNotExist as e:
         logger.error(f"Feed {feed_id} does not exist.")
         return
-    fr = FeedReader(feed.link, timeout=feed.timeout, last_modified=feed.last_modified)
-    try:
-        entries = fr.get_entries()
-    except FeedReaderBaseException as e:
-        logger.error(f"Feed {feed_id} got error {e}.")
-        feed.feed_fail()
+    leases = acquire_leases((feed_id,), lease_seconds((feed.timeout,)))
+    if not leases:
+        logger.info(f"Feed {feed_id} is being fetched.")
+        if feed.status == Feed.PENDING:
+            # changes of link or force update are fetched after current fetch
+            enqueue_fetch_feed(feed_id, countdown=lease_ttl(feed_id))
         return
+    fr = FeedReader(
+        feed.link,
+        request_agent=get_request_agent(),
+        parser_agent=get_parser_agent(),
+        timeout=feed.timeout,
+        last_modified=feed.last_published_at,
+        etag=feed.http_etag,
+        modified=feed.http_last_modified,
+        content_digest=feed.content_digest,
+        stream=settings.FEED_STREAM_RESPONSE,
+        max_bytes=settings.FEED_MAX_RESPONSE_BYTES,
+    )
+    retry_after = None
+    try:
+        retry_after = _fetch_feed_entries(feed, fr)
     except Exception as e:
         logger.error(f"Feed {feed_id} got error {e}.")
-        feed.feed_fail()
+        retry_after = _fetch_failed(feed, e, fr.status_code)
         raise
+    finally:
+        release_leases(leases)
+        if retry_after is not None:
+            enqueue_fetch_feed(feed_id, countdown=retry_after)
+
+
+def _fetch_feed_entries(feed: Feed, fr: FeedReader) -> typing.Optional[float]:
+    """
+    :return: seconds to retry a PENDING feed after, None if not needed
+    """
+    feed_id = feed.id
+    # first fetch of a feed is requested by a user, so it is not deferred
+    if feed.status in Feed.SCHEDULED_STATUSES:
+        wait = acquire_host(feed.link)
+        if wait:
+            logger.info(f"Feed {feed_id} deferred {wait:.1f}s by rate of its host.")
+            feed.feed_throttled(wait)
+            return None
     try:
-        Entry.objects.bulk_create(
-            [
-                Entry(
-                    feed=feed,
-                    title=entry.title[:200],
-                    link=entry.url,
-                    summary=entry.summary[:2000],
-                    published_at=entry.published_at,
-                )
-                for entry in entries
-            ],
-            ignore_conflicts=True,
+        entries = fr.get_entries()
+    except RateLimitedException as e:
+        delay = block_host(feed.link, e.retry_after)
+        logger.warning(f"Feed {feed_id} got error {e}, retry after {delay}s.")
+        if feed.status == Feed.PENDING:
+            return delay
+        feed.feed_throttled(delay, status_code=fr.status_code)
+        return None
+    except FeedReaderBaseException as e:
+        logger.error(f"Feed {feed_id} got error {e}.")
+        return _fetch_failed(feed, e, fr.status_code)
+    track_host(feed.link, status_code=fr.status_code)
+    if fr.not_modified:
+        logger.info(f"Feed {feed_id} not modified.")
+        feed.update_http_validators(fr.etag, fr.modified, fr.content_digest)
+        feed.track_permanent_redirect(fr.permanent_redirect)
+        feed.feed_success(
+            followers_count=feed.followers_count, status_code=fr.status_code
         )
+        return None
+    try:
+        save_entries(build_entries(feed, entries))
     except DataError as e:
         logger.error(f"Feed {feed_id} got error {e}.")
-        return
+        return None
+    # validators are kept after saving entries, otherwise entries that
+    # are not saved will not be fetched again, buffered entries are saved
+    # later, so flusher drops validators of feeds of entries it drops
+    feed.update_http_validators(fr.etag, fr.modified, fr.content_digest)
+    feed.track_permanent_redirect(fr.permanent_redirect)
 
     if not feed.title:
+        # it is saved by feed_success, saving a PENDING feed here would
+        # enqueue its fetch again by update_feed signal
         feed_info = fr.get_feed_info()
         feed.title = feed_info.title if feed_info else ""
-        feed.save()
-    feed.feed_success()
+    feed.feed_success(
+        published_dates=[entry.published_at for entry in entries],
+        followers_count=feed.followers_count,
+        status_code=fr.status_code,
+    )
+    return None
@@ -0,0 +1,29 @@
+import pytest
+from django.core.cache import cache
+
+from feed import buffer, throttle
+
+
+@pytest.fixture(autouse=True)
+def host_limiter(monkeypatch):
+    """
+    Every test starts with full token buckets of hosts
+    """
+    monkeypatch.setattr(throttle, "_limiter", None)
+
+
+@pytest.fixture(autouse=True)
+def entry_buffer(monkeypatch):
+    """
+    Every test starts with an empty local entry buffer
+    """
+    monkeypatch.setattr(buffer, "_buffer", None)
+
+
+@pytest.fixture(autouse=True)
+def fetch_leases():
+    """
+    Ids of feeds are same in every test, so enqueue marks and leases of
+    fetches of previous tests are flushed
+    """
+    cache.clear()
@@ -1,18 +1,50 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from math import ceil
 from typing import Iterable
 from unittest.mock import patch
 from uuid import uuid4
 
 import pytest
+import requests
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import DataError, connection, transaction
 from django.urls import reverse
+from django.utils import timezone
+from django_redis import get_redis_connection
 
 from authnz.models import User
 from authnz.utils import generate_token
-from feed.models import Feed, FollowFeed, Entry, EntryRead
+from feed.models import Feed, FollowFeed, Entry, ReadState
 from feed import tasks
+from feed.backpressure import get_metrics, queue_depth
+from feed.buffer import (
+    RedisEntryBuffer,
+    entry_rows,
+    flush_entry_buffer,
+    get_entry_buffer,
+    insert_entry_rows,
+)
+from feed import dedup
+from feed.dedup import (
+    EntryDeduplicator,
+    LocalLinkFilter,
+    RedisLinkFilter,
+    get_entry_deduplicator,
+)
+from feed.ingest import FetchResult, fetch_feeds, persist_fetch_results
+from feed.leases import (
+    acquire_leases,
+    claim_enqueue,
+    in_flight_count,
+    lease_ttl,
+    release_leases,
+)
+from feed.links import hash_link
+from feed.throttle import RedisHostLimiter, get_host_limiter
 from feedreader.entities import Entry as EntryEntity, Feed as FeedEntry
-from feedreader.exceptions import FeedReaderBaseException
+from feedreader.exceptions import FeedReaderBaseException, RateLimitedException
+from utils.utils import encode_cursor
 
 
 @pytest.fixture
@@ -230,25 +262,84 @@ class TestFeed:
         assert "last" in resp_json["data"][0]["title"].lower()
 
     @pytest.mark.django_db
-    def test_feed_priority(self, feeds):
+    def test_feed_circuit_breaker(self, feeds, settings):
+        settings.FEED_CIRCUIT_FAILURE_THRESHOLD = 2
+        settings.FEED_CIRCUIT_ERROR_FAILURES = 4
         feed = Feed.objects.first()
-        assert feed.priority == Feed.HIGH
-        feed.feed_fail()
-        assert feed.priority == Feed.LOW
-        feed.feed_success()
-        assert feed.priority == Feed.HIGH
         feed.feed_success()
+        assert feed.circuit_state == Feed.CLOSED
+        feed.feed_fail()
+        assert feed.circuit_state == Feed.CLOSED
+        feed.feed_fail()
+        assert feed.circuit_state == Feed.OPEN
+        # failures do not demote feed
         assert feed.priority == Feed.HIGH
+        assert feed.status == Feed.ACTIVE
+
+        # trial fetch after backoff
+        feed.circuit_state = Feed.HALF_OPEN
         feed.feed_success()
-        assert feed.priority == Feed.HIGH
-        feed.feed_fail()
-        assert feed.priority == Feed.LOW
+        assert feed.circuit_state == Feed.CLOSED
+        assert feed.consecutive_failures == 0
+
+        feed.circuit_state = Feed.HALF_OPEN
         feed.feed_fail()
-        assert feed.priority == Feed.STOP
+        assert feed.circuit_state == Feed.OPEN
+        for _ in range(3):
+            feed.feed_fail()
         assert feed.status == Feed.ERROR
+        feed.refresh_from_db()
+        assert feed.circuit_state == Feed.OPEN
+        assert feed.consecutive_failures == 4
+
+        # ERROR feeds are probed at max interval and recover by a success
+        now = timezone.now()
+        assert feed.next_fetch_at <= now + timedelta(
+            seconds=settings.FEED_MAX_FETCH_INTERVAL + settings.FEED_SCHEDULE_WINDOW
+        )
+        feed_ids = [
+            feed_id
+            for batch in Feed.objects.batch_get_feeds(
+                due_at=now
+                + timedelta(
+                    seconds=settings.FEED_MAX_FETCH_INTERVAL
+                    + settings.FEED_SCHEDULE_WINDOW
+                )
+            )
+            for feed_id in batch
+        ]
+        assert feed.id in feed_ids
+        feed.feed_success()
+        feed.refresh_from_db()
+        assert feed.status == Feed.ACTIVE
+        assert feed.circuit_state == Feed.CLOSED
+
+    @pytest.mark.django_db
+    def test_feed_next_fetch_at(self, feeds, settings):
+        settings.FEED_SCHEDULE_WINDOW = 0
+        settings.FEED_MIN_FETCH_INTERVAL = 60
+        settings.FEED_DEFAULT_FETCH_INTERVAL = 300
+        settings.FEED_ERROR_BACKOFF = 300
+        now = timezone.now()
+        feed = Feed.objects.first()
+        feed.feed_success()
+        assert feed.unchanged_count == 1
+        assert feed.next_fetch_at > now
+
+        feed.feed_success(
+            published_dates=[now - timedelta(hours=2), now - timedelta(hours=1)]
+        )
+        assert feed.unchanged_count == 0
+        assert feed.publish_interval == 3600
+        assert feed.next_fetch_at >= now + timedelta(minutes=30)
+
         feed.feed_fail()
-        assert feed.priority == Feed.STOP
-        assert feed.status == Feed.ERROR
+        feed.feed_fail()
+        feed.refresh_from_db()
+        assert feed.consecutive_failures == 2
+        # backoff of 10 minutes with jitter
+        assert feed.next_fetch_at >= now + timedelta(minutes=5)
+        assert feed.next_fetch_at <= timezone.now() + timedelta(minutes=10)
 
     @pytest.mark.django_db
     def test_admin_list_feed_functionality(
@@ -376,6 +467,72 @@ class TestFeed:
             batch_count += 1
         assert batch_count == ceil(feed_number / feed_batch_size)
 
+    @pytest.mark.django_db
+    def test_batch_get_feeds_order(self, user_sample, django_assert_num_queries):
+        feed_number = 27
+        feed_batch_size = 5
+        now = timezone.now()
+        Feed.objects.bulk_create(
+            [
+                Feed(
+                    title=f"Title {i}",
+                    link=f"feed.io{i}",
+                    creator=user_sample,
+                    status=Feed.ACTIVE,
+                    # every 3 feeds are due at same time
+                    next_fetch_at=now - timedelta(minutes=feed_number - i // 3),
+                )
+                for i in range(feed_number)
+            ]
+        )
+        due_feed_ids = list(
+            Feed.objects.order_by("next_fetch_at", "id").values_list("id", flat=True)
+        )
+        feed_ids = []
+        for batch_feed in Feed.objects.batch_get_feeds(
+            priority=2, due_at=now, batch_size=feed_batch_size
+        ):
+            assert len(batch_feed) <= feed_batch_size
+            feed_ids.extend(batch_feed)
+            # feeds are leased during iteration by scheduler
+            Feed.objects.filter(id__in=batch_feed).update(
+                next_fetch_at=now + timedelta(minutes=10)
+            )
+        assert feed_ids == due_feed_ids
+
+        # without limit ids are streamed from one query
+        batches = Feed.objects.batch_get_feeds(batch_size=feed_batch_size)
+        with django_assert_num_queries(1):
+            assert len(next(batches)) == feed_batch_size
+        assert [feed_id for batch in batches for feed_id in batch] == list(
+            Feed.objects.order_by("next_fetch_at", "id").values_list("id", flat=True)
+        )[feed_batch_size:]
+
+    @pytest.mark.django_db
+    def test_batch_get_feeds_limit(self, user_sample):
+        now = timezone.now()
+        Feed.objects.bulk_create(
+            [
+                Feed(
+                    title=f"Title {i}",
+                    link=f"feed.io{i}",
+                    creator=user_sample,
+                    status=Feed.ACTIVE,
+                    next_fetch_at=now - timedelta(minutes=i),
+                )
+                for i in range(27)
+            ]
+        )
+        batches = list(Feed.objects.batch_get_feeds(due_at=now, batch_size=5, limit=12))
+        assert [len(batch) for batch in batches] == [5, 5, 2]
+        # the most overdue feeds first
+        assert [feed_id for batch in batches for feed_id in batch] == list(
+            Feed.objects.order_by("next_fetch_at", "id").values_list("id", flat=True)[
+                :12
+            ]
+        )
+        assert list(Feed.objects.batch_get_feeds(limit=0)) == []
+
 
 class TestEntry:
     @pytest.mark.django_db
@@ -421,7 +578,7 @@ class TestEntry:
     @pytest.mark.django_db
     def test_entries_read_functionality(self, client, user_authorize_header, entries):
         assert Entry.objects.count() == 2
-        assert EntryRead.objects.count() == 0
+        assert ReadState.objects.count() == 0
         url = reverse("entry_read")
         data = {"id": 1}
         resp = client.post(
@@ -429,7 +586,8 @@ class TestEntry:
         )
         assert resp.status_code == 200
 
-        assert EntryRead.objects.count() == 1
+        state = ReadState.objects.get()
+        assert (state.feed_id, state.read_until) == (1, 1)
 
         # filter read
         url = reverse("entries")
@@ -458,8 +616,417 @@ class TestEntry:
         assert resp_json["data"][0]["id"] != data["id"]
 
 
+class TestCursorPagination:
+    @pytest.mark.django_db
+    def test_entries_cursor_pagination(self, client, user_authorize_header, feeds):
+        published_at = timezone.now()
+        Entry.objects.bulk_create(
+            Entry(
+                feed_id=1 + i % 2,
+                title=f"Entry {i}",
+                link=f"https://feed.io/{i}",
+                summary="Summary",
+                # entries share publish time, so id breaks ties
+                published_at=published_at - timedelta(hours=i // 3),
+            )
+            for i in range(11)
+        )
+        url = reverse("entries")
+        for order_by, ordering in (
+            ("NEWEST", ("-published_at", "-id")),
+            ("OLDEST", ("published_at", "id")),
+        ):
+            ids, cursor = [], ""
+            while cursor is not None:
+                resp = client.get(
+                    url,
+                    {"cursor": cursor, "size": 4, "order_by": order_by},
+                    **user_authorize_header,
+                )
+                assert resp.status_code == 200
+                resp_json = resp.json()
+                assert resp_json["total"] == 11
+                assert len(resp_json["data"]) <= 4
+                ids.extend(entry["id"] for entry in resp_json["data"])
+                cursor = resp_json["next_cursor"]
+            assert ids == list(
+                Entry.objects.order_by(*ordering).values_list("id", flat=True)
+            )
+
+        # index mode is kept, and OLDEST works in it too
+        resp = client.get(
+            url, {"index": 9, "size": 4, "order_by": "OLDEST"}, **user_authorize_header
+        )
+        resp_json = resp.json()
+        assert resp_json["index"] == 9
+        assert "next_cursor" not in resp_json
+        assert [entry["id"] for entry in resp_json["data"]] == [2, 3]
+
+        # entries of a feed
+        resp = client.get(
+            reverse("feed_entries", args=(2,)),
+            {"cursor": "", "size": 20},
+            **user_authorize_header,
+        )
+        resp_json = resp.json()
+        assert resp_json["next_cursor"] is None
+        assert [entry["id"] for entry in resp_json["data"]] == [2, 6, 4, 8, 10]
+
+    @pytest.mark.django_db
+    def test_invalid_cursor(self, client, user_authorize_header, entries):
+        url = reverse("entries")
+        resp = client.get(url, {"cursor": "", "size": 1}, **user_authorize_header)
+        cursor = resp.json()["next_cursor"]
+        for params in (
+            {"cursor": "not-a-cursor"},
+            {"cursor": cursor[:-2]},
+            # cursor of another ordering
+            {"cursor": cursor, "order_by": "OLDEST"},
+            {"cursor": "", "size": 0},
+        ):
+            resp = client.get(url, params, **user_authorize_header)
+            assert resp.status_code == 400
+
+    @pytest.mark.django_db
+    def test_feeds_cursor_pagination(
+        self, client, user_authorize_header, user_sample_with_approved_email
+    ):
+        Feed.objects.bulk_create(
+            Feed(
+                link=f"https://feed{i}.io",
+                creator=user_sample_with_approved_email,
+                status=Feed.ACTIVE,
+                # untitled feeds are ordered first
+                **({"title": f"Feed {i % 4}"} if i % 3 else {}),
+            )
+            for i in range(10)
+        )
+        assert Feed.objects.filter(title="").count() == 4
+        user_sample_with_approved_email.feed_followed.add(
+            *Feed.objects.values_list("id", flat=True)
+        )
+        expected = list(
+            Feed.objects.order_by("title", "id").values_list("id", flat=True)
+        )
+        for name in ("feeds", "my_feeds", "feed_follow"):
+            ids, cursor = [], ""
+            while cursor is not None:
+                resp = client.get(
+                    reverse(name),
+                    {"cursor": cursor, "size": 3},
+                    **user_authorize_header,
+                )
+                assert resp.status_code == 200
+                ids.extend(feed["id"] for feed in resp.json()["data"])
+                cursor = resp.json()["next_cursor"]
+            assert ids == expected
+
+        # cursor with NULL of a non-null field is invalid
+        resp = client.get(
+            reverse("feeds"),
+            {"cursor": encode_cursor(("title", "id"), [None, 1])},
+            **user_authorize_header,
+        )
+        assert resp.status_code == 400
+
+
+class TestTimeline:
+    @pytest.mark.django_db
+    def test_timeline(
+        self, client, user_authorize_header, user_sample_with_approved_email, feeds
+    ):
+        published_at = timezone.now()
+        Entry.objects.bulk_create(
+            Entry(
+                feed_id=1 + i % 3,
+                title=f"Entry {i}",
+                link=f"https://feed.io/{i}",
+                summary="Summary",
+                published_at=published_at - timedelta(hours=i // 2),
+            )
+            for i in range(12)
+        )
+        url = reverse("timeline")
+        resp = client.get(url, **user_authorize_header)
+        assert resp.status_code == 200
+        assert resp.json()["data"] == []
+        assert resp.json()["has_more"] is False
+
+        user_sample_with_approved_email.feed_followed.add(1, 3)
+        ids, cursor = [], ""
+        while cursor is not None:
+            resp = client.get(
+                url, {"cursor": cursor, "size": 3}, **user_authorize_header
+            )
+            assert resp.status_code == 200
+            resp_json = resp.json()
+            assert resp_json["has_more"] is (resp_json["next_cursor"] is not None)
+            assert {entry["feed"]["id"] for entry in resp_json["data"]} <= {1, 3}
+            ids.extend(entry["id"] for entry in resp_json["data"])
+            cursor = resp_json["next_cursor"]
+        assert ids == list(
+            Entry.objects.filter(feed_id__in=(1, 3))
+            .order_by("-published_at", "-id")
+            .values_list("id", flat=True)
+        )
+
+        resp = client.get(url, {"count": "exact"}, **user_authorize_header)
+        assert resp.json()["total"] == 8
+        resp = client.get(url, {"cursor": "not-a-cursor"}, **user_authorize_header)
+        assert resp.status_code == 400
+
+
+class TestReadState:
+    @pytest.mark.django_db
+    def test_reads_are_per_user(self, client, user_authorize_header, entries):
+        other_user = User.register_user(email="other@test.com", password="Str0n5Pass")
+        other_user.confirm_email()
+        other_header = {"HTTP_AUTHORIZATION": f"JWT {generate_token(other_user)}"}
+        ReadState.objects.mark_read(other_user.id, (1,))
+
+        url = reverse("entries")
+        resp = client.get(url, {"read": "true"}, **user_authorize_header)
+        assert resp.json()["total"] == 0
+        resp = client.get(url, {"read": "false"}, **user_authorize_header)
+        assert resp.json()["total"] == 2
+        resp = client.get(url, {"read": "true"}, **other_header)
+        assert [entry["id"] for entry in resp.json()["data"]] == [1]
+        resp = client.get(
+            reverse("feed_entries", args=(1,)), {"read": "false"}, **other_header
+        )
+        assert [entry["id"] for entry in resp.json()["data"]] == [2]
+
+    @pytest.mark.django_db
+    def test_read_until_and_unread_counts(
+        self, client, user_authorize_header, user_sample_with_approved_email, feeds
+    ):
+        user = user_sample_with_approved_email
+        published_at = timezone.now()
+        Entry.objects.bulk_create(
+            Entry(
+                feed_id=1 + i % 2,
+                title=f"Entry {i}",
+                link=f"https://feed.io/{i}",
+                summary="Summary",
+                published_at=published_at - timedelta(hours=i),
+            )
+            for i in range(10)
+        )
+        user.feed_followed.add(1, 2)
+        feed_entry_ids = list(
+            Entry.objects.filter(feed_id=1).order_by("id").values_list("id", flat=True)
+        )
+
+        # out of order reads are kept in bitmap until entries before them are read
+        ReadState.objects.mark_read(user.id, feed_entry_ids[2:4])
+        state = ReadState.objects.get(user=user, feed_id=1)
+        assert state.read_until == 0
+        assert list(state.read_entry_ids()) == feed_entry_ids[2:4]
+        ReadState.objects.mark_read(user.id, feed_entry_ids[:2])
+        state.refresh_from_db()
+        assert state.read_until == feed_entry_ids[3]
+        assert len(state.read_entry_ids()) == 0
+
+        ReadState.objects.mark_read(user.id, (feed_entry_ids[-1],))
+        resp = client.get(reverse("feed_unread_counts"), **user_authorize_header)
+        assert resp.status_code == 200
+        assert resp.json()["data"] == [{"id": 1, "unread": 0}, {"id": 2, "unread": 5}]
+
+        resp = client.post(reverse("feed_read", args=(2,)), **user_authorize_header)
+        assert resp.status_code == 200
+        Entry.objects.create(
+            feed_id=2,
+            title="New entry",
+            link="https://feed.io/new",
+            summary="Summary",
+            published_at=published_at,
+        )
+        assert ReadState.objects.unread_counts(user.id, (1, 2)) == {1: 0, 2: 1}
+        resp = client.get(
+            reverse("entries"), {"read": "false"}, **user_authorize_header
+        )
+        assert [entry["title"] for entry in resp.json()["data"]] == ["New entry"]
+
+    @pytest.mark.django_db
+    def test_newest_first_reads(self, user_sample, feeds, settings):
+        Entry.objects.bulk_create(
+            Entry(
+                feed_id=1,
+                title=f"Entry {i}",
+                link=f"https://feed.io/{i}",
+                summary="Summary",
+                published_at=timezone.now(),
+            )
+            for i in range(10)
+        )
+        ids = list(Entry.objects.order_by("id").values_list("id", flat=True))
+
+        def read_ids():
+            return list(
+                Entry.objects.filter(ReadState.objects.read_filter(user_sample.id))
+                .order_by("id")
+                .values_list("id", flat=True)
+            )
+
+        for entry_id in reversed(ids[4:]):
+            ReadState.objects.mark_read(user_sample.id, (entry_id,))
+        # read_until moves to newest entry and unread entries are kept
+        # instead of reads
+        state = ReadState.objects.get(user=user_sample, feed_id=1)
+        assert state.read_until == ids[-1]
+        assert len(state.read_entry_ids()) == 0
+        assert list(state.unread_entry_ids()) == ids[:4]
+        assert read_ids() == ids[4:]
+        assert ReadState.objects.unread_counts(user_sample.id, (1,)) == {1: 4}
+
+        # oldest unread entries are marked read when there are too many
+        settings.READ_STATE_MAX_IDS = 2
+        ReadState.objects.mark_read(user_sample.id, (ids[2],))
+        state.refresh_from_db()
+        assert list(state.unread_entry_ids()) == [ids[1], ids[3]]
+        assert read_ids() == [ids[0], ids[2], *ids[4:]]
+        assert ReadState.objects.unread_counts(user_sample.id, (1,)) == {1: 2}
+
+        ReadState.objects.mark_feed_read(user_sample.id, 1)
+        assert read_ids() == ids
+
+    @pytest.mark.django_db
+    def test_read_filter_by_feed(self, user_sample, feeds, monkeypatch):
+        Entry.objects.bulk_create(
+            Entry(
+                feed_id=1 + i % 2,
+                title=f"Entry {i}",
+                link=f"https://feed.io/{i}",
+                summary="Summary",
+                published_at=timezone.now(),
+            )
+            for i in range(8)
+        )
+        ids = {
+            feed_id: list(
+                Entry.objects.filter(feed_id=feed_id)
+                .order_by("id")
+                .values_list("id", flat=True)
+            )
+            for feed_id in (1, 2)
+        }
+        ReadState.objects.mark_read(user_sample.id, ids[1][2:])
+        ReadState.objects.mark_read(user_sample.id, ids[2][1:])
+        read = Entry.objects.filter(ReadState.objects.read_filter(user_sample.id))
+        assert sorted(read.values_list("id", flat=True)) == sorted(
+            ids[1][2:] + ids[2][1:]
+        )
+
+        # ids of bitmaps are one array per feed on postgres
+        monkeypatch.setattr(connection, "vendor", "postgresql")
+        condition = ReadState.objects.read_filter(user_sample.id).children[0]
+        first, second = [1, 0, ids[1][2:]], [2, ids[2][-1], ids[2][:1]]
+        assert condition.params in (first + second, second + first)
+
+    @pytest.mark.django_db
+    def test_read_not_existing(self, client, user_authorize_header, feeds):
+        resp = client.post(
+            reverse("entry_read"),
+            {"id": 100},
+            content_type="application/json",
+            **user_authorize_header,
+        )
+        assert resp.status_code == 404
+        resp = client.post(reverse("feed_read", args=(100,)), **user_authorize_header)
+        assert resp.status_code == 404
+        assert ReadState.objects.count() == 0
+
+
+class TestListCount:
+    @pytest.mark.django_db
+    def test_cached_count(self, client, user_authorize_header, entries):
+        url = reverse("entries")
+        resp = client.get(url, **user_authorize_header)
+        assert resp.json()["total"] == 2
+
+        # inserted entries reach cached counts after their ttl
+        Entry.objects.create(
+            feed_id=1,
+            title="Third entry",
+            link="my-link3.io",
+            summary="entry summary",
+            published_at=timezone.now(),
+        )
+        resp = client.get(url, **user_authorize_header)
+        assert resp.json()["total"] == 2
+        assert len(resp.json()["data"]) == 3
+        resp = client.get(url, {"count": "exact"}, **user_authorize_header)
+        assert resp.json()["total"] == 3
+
+        # reads of users drop cached counts
+        resp = client.get(url, {"read": "true"}, **user_authorize_header)
+        assert resp.json()["total"] == 0
+        client.post(
+            reverse("entry_read"),
+            {"id": 1},
+            content_type="application/json",
+            **user_authorize_header,
+        )
+        resp = client.get(url, {"read": "true"}, **user_authorize_header)
+        assert resp.json()["total"] == 1
+
+    @pytest.mark.django_db
+    def test_cached_count_of_feed_status(
+        self, client, user_authorize_header, feeds, settings
+    ):
+        Feed.objects.update(status=Feed.ACTIVE)
+        url = reverse("feeds")
+        resp = client.get(url, {"count": "cached"}, **user_authorize_header)
+        assert resp.json()["total"] == 3
+
+        feed = Feed.objects.get(id=1)
+        feed.consecutive_failures = settings.FEED_CIRCUIT_ERROR_FAILURES - 1
+        feed.feed_fail()
+        assert feed.status == Feed.ERROR
+        resp = client.get(url, {"count": "cached"}, **user_authorize_header)
+        assert resp.json()["total"] == 2
+
+    @pytest.mark.django_db
+    def test_count_none(self, client, user_authorize_header, entries):
+        url = reverse("entries")
+        for params, has_more in (
+            ({"size": 1}, True),
+            ({"index": 1, "size": 1}, False),
+            ({"cursor": "", "size": 1}, True),
+            ({"cursor": "", "size": 2}, False),
+        ):
+            resp = client.get(url, {"count": "none", **params}, **user_authorize_header)
+            assert resp.status_code == 200
+            resp_json = resp.json()
+            assert resp_json["total"] is None
+            assert resp_json["has_more"] is has_more
+            assert len(resp_json["data"]) == params["size"]
+
+        resp = client.get(url, **user_authorize_header)
+        assert "has_more" not in resp.json()
+
+    @pytest.mark.django_db
+    def test_count_estimated_and_invalid(self, client, user_authorize_header, entries):
+        url = reverse("entries")
+        # databases other than postgres count exactly
+        resp = client.get(url, {"count": "estimated"}, **user_authorize_header)
+        assert resp.json()["total"] == 2
+
+        resp = client.get(url, {"count": "all"}, **user_authorize_header)
+        assert resp.status_code == 400
+
+
 class MockFeedReader:
+    etag = '"feed-etag"'
+    modified = "Wed, 22 Sep 2021 08:52:00 GMT"
+    content_digest = "b8d1b43eae73587ba56baef574709ecb"
+    permanent_redirect = None
+
     def __init__(self, *args, **kwargs):
+        self.not_modified = False
+        self.status_code = 200
+
+    def fetch(self):
         pass
 
     def get_feed_info(self):
@@ -469,6 +1036,27 @@ class MockFeedReader:
         return feed_reader_entries()
 
 
+def mock_fetch_feeds_async(feeds):
+    results = []
+    for feed in feeds:
+        reader = MockFeedReader()
+        if feed.id == 2:
+            reader = MockNotModifiedFeedReader()
+        error = FeedReaderBaseException() if feed.id == 3 else None
+        results.append(FetchResult(feed=feed, reader=reader, error=error))
+    return results
+
+
+class MockNotModifiedFeedReader(MockFeedReader):
+    def get_feed_info(self):
+        return None
+
+    def get_entries(self):
+        self.not_modified = True
+        self.status_code = 304
+        return []
+
+
 class TestTasks:
     @pytest.mark.django_db
     @patch("feed.tasks.FeedReader", MockFeedReader)
@@ -485,31 +1073,105 @@ class TestTasks:
         assert feed.status == Feed.ACTIVE
 
     @pytest.mark.django_db
+    @patch("feed.tasks.FeedReader", MockFeedReader)
+    def test_fetch_feed_entries_store_http_validators(self, feeds):
+        feed_id = 1
+        tasks.fetch_feed_entries(feed_id)
+        feed = Feed.objects.get(id=feed_id)
+        assert feed.http_etag == MockFeedReader.etag
+        assert feed.http_last_modified == MockFeedReader.modified
+        assert feed.content_digest == MockFeedReader.content_digest
+
+    @pytest.mark.django_db
+    def test_update_http_validators_drops_long_validators(self, feeds):
+        feed = Feed.objects.get(id=1)
+        feed.update_http_validators(
+            '"' + "a" * 300 + '"', "Wed, " + "a" * 64, MockFeedReader.content_digest
+        )
+        feed = Feed.objects.get(id=1)
+        assert feed.http_etag is None
+        assert feed.http_last_modified is None
+        assert feed.content_digest == MockFeedReader.content_digest
+
+        feed.update_http_validators(MockFeedReader.etag, MockFeedReader.modified)
+        feed = Feed.objects.get(id=1)
+        assert feed.http_etag == MockFeedReader.etag
+        assert feed.http_last_modified == MockFeedReader.modified
+
+    @pytest.mark.django_db
+    @patch("feed.tasks.FeedReader", MockFeedReader)
+    def test_fetch_feed_entries_bookkeeping(self, feeds):
+        feed_id = 1
+        tasks.fetch_feed_entries(feed_id)
+        feed = Feed.objects.get(id=feed_id)
+        assert feed.last_published_at == max(
+            Entry.objects.filter(feed_id=feed_id).values_list("published_at", flat=True)
+        )
+        assert feed.last_fetched_at is not None
+        assert feed.last_status_code == 200
+        assert feed.consecutive_failures == 0
+
+    @pytest.mark.django_db
+    def test_backfill_feeds_command(self, entries):
+        assert Feed.objects.filter(last_published_at__isnull=False).exists() is False
+        call_command("backfill_feeds", batch_size=2)
+        feed = Feed.objects.get(id=1)
+        assert feed.last_published_at == Entry.objects.first().published_at
+        assert Feed.objects.filter(last_published_at__isnull=True).count() == 2
+
+    @pytest.mark.django_db
+    @patch("feed.tasks.FeedReader", MockNotModifiedFeedReader)
+    def test_fetch_feed_entries_not_modified(self, feeds):
+        feed_id = 1
+        tasks.fetch_feed_entries(feed_id)
+        assert Entry.objects.exists() is False
+
+        feed = Feed.objects.get(id=feed_id)
+        assert feed.status == Feed.ACTIVE
+        assert feed.http_etag == MockNotModifiedFeedReader.etag
+
+    @pytest.mark.django_db
+    @patch("feed.tasks.fetch_feed_entries.apply_async")
     @patch("feed.tasks.FeedReader.get_entries", side_effect=Exception)
-    def test_fetch_feed_entries_with_exception(self, mock_get_entries, feeds):
+    def test_fetch_feed_entries_with_exception(
+        self,
+        mock_get_entries,
+        mock_apply_async,
+        feeds,
+        django_capture_on_commit_callbacks,
+    ):
         feed_id = 1
-        with pytest.raises(Exception):
-            tasks.fetch_feed_entries(feed_id)
+        with django_capture_on_commit_callbacks(execute=True):
+            with pytest.raises(Exception):
+                tasks.fetch_feed_entries(feed_id)
 
         assert Entry.objects.exists() is False
 
         feed = Feed.objects.get(id=feed_id)
-        assert feed.priority == Feed.LOW
-        assert feed.status == Feed.ERROR
+        assert feed.priority == Feed.HIGH
+        assert feed.status == Feed.PENDING
+        assert feed.consecutive_failures == 1
+        # PENDING feeds are retried after backoff
+        mock_apply_async.assert_called_once()
 
     @pytest.mark.django_db
+    @patch("feed.tasks.fetch_feed_entries.apply_async")
     @patch("feed.tasks.FeedReader.get_entries", side_effect=FeedReaderBaseException)
     def test_fetch_feed_entries_with_feed_reader_base_exception(
-        self, mock_get_entries, feeds
+        self, mock_get_entries, mock_apply_async, feeds
     ):
         feed_id = 1
+        Feed.objects.filter(id=feed_id).update(status=Feed.ACTIVE)
         tasks.fetch_feed_entries(feed_id)
 
         assert Entry.objects.exists() is False
 
         feed = Feed.objects.get(id=feed_id)
-        assert feed.priority == Feed.LOW
-        assert feed.status == Feed.ERROR
+        assert feed.priority == Feed.HIGH
+        assert feed.status == Feed.ACTIVE
+        assert feed.consecutive_failures == 1
+        assert feed.next_fetch_at > timezone.now()
+        mock_apply_async.assert_not_called()
 
     @pytest.mark.django_db
     @patch("feed.tasks.FeedReader", MockFeedReader)
@@ -531,3 +1193,741 @@ class TestTasks:
         assert Entry.objects.count() == Feed.objects.count() * len(
             feed_reader_entries()
         )
+
+    @pytest.mark.django_db
+    @patch("feed.tasks.fetch_feeds_async", side_effect=mock_fetch_feeds_async)
+    def test_fetch_feed_batch_entries(self, mock_fetch, feeds, settings):
+        settings.FEED_FETCH_ENGINE = "asyncio"
+        tasks.fetch_feed_batch_entries([1, 2, 3])
+        assert mock_fetch.call_count == 1
+        assert Entry.objects.count() == len(feed_reader_entries())
+        assert Entry.objects.filter(feed_id=1).count() == len(feed_reader_entries())
+
+        assert Feed.objects.get(id=1).status == Feed.ACTIVE
+        assert Feed.objects.get(id=2).status == Feed.ACTIVE
+        assert Feed.objects.get(id=1).http_etag == MockFeedReader.etag
+        feed = Feed.objects.get(id=3)
+        assert feed.priority == Feed.HIGH
+        assert feed.consecutive_failures == 1
+
+    @pytest.mark.django_db
+    @patch("feed.tasks.fetch_feeds_async", side_effect=mock_fetch_feeds_async)
+    def test_schedule_fetch_feed_batch_asyncio_engine(
+        self, mock_fetch, feeds, settings
+    ):
+        settings.FEED_FETCH_ENGINE = "asyncio"
+        Feed.objects.update(status=Feed.ACTIVE)
+        tasks.schedule_fetch_feed_batch(Feed.HIGH)
+        assert mock_fetch.call_count == 1
+        assert Entry.objects.count() == len(feed_reader_entries())
+
+    @pytest.mark.django_db
+    @patch("feed.tasks.group")
+    def test_schedule_fetch_feed_message_priority(self, mock_group, feeds, settings):
+        settings.FEED_FETCH_MESSAGE_PRIORITY = {2: 6, 1: 3, 0: 0}
+        Feed.objects.update(status=Feed.ACTIVE)
+        Feed.objects.filter(id=2).update(priority=Feed.LOW)
+        tasks.schedule_fetch_feed_batch()
+        signatures = list(mock_group.call_args[0][0])
+        assert {
+            signature.args[0]: signature.options["priority"] for signature in signatures
+        } == {1: 6, 2: 3, 3: 6}
+
+        # periodic fetches go to background queue, first fetches of users
+        # go to interactive queue
+        router = tasks.app.amqp.router
+        assert router.route({}, "fetch_feed_entries")["queue"].name == (
+            "feeds_background"
+        )
+        assert router.route({}, "schedule_fetch_feed_batch")["queue"].name == (
+            "feeds_background"
+        )
+        background = tasks.app.amqp.queues["feeds_background"]
+        assert background.queue_arguments == {"x-max-priority": 9}
+
+    @pytest.mark.django_db
+    @patch("feed.tasks.fetch_feed_batch_entries.apply_async")
+    def test_schedule_fetch_feed_batch_message_priority(
+        self, mock_apply_async, feeds, settings
+    ):
+        settings.FEED_FETCH_ENGINE = "batch"
+        Feed.objects.update(status=Feed.ACTIVE)
+        Feed.objects.filter(id=2).update(priority=Feed.LOW)
+        tasks.schedule_fetch_feed_batch()
+        # a batch per message priority, higher first, published when due
+        assert [
+            (call.args[0][0], call.kwargs) for call in mock_apply_async.call_args_list
+        ] == [([1, 3], {"priority": 6}), ([2], {"priority": 3})]
+
+    @pytest.mark.django_db
+    @patch("feed.tasks.fetch_feed_entries.apply_async")
+    @patch("feed.tasks.group")
+    def test_interactive_fetch_overtakes_background(
+        self, mock_group, mock_apply_async, feeds, django_capture_on_commit_callbacks
+    ):
+        Feed.objects.update(status=Feed.ACTIVE)
+        tasks.schedule_fetch_feed_batch()
+        # periodic fetches are published when they are due, so they wait in
+        # broker by their priority instead of being reserved with an ETA
+        signatures = list(mock_group.call_args[0][0])
+        assert [signature.args for signature in signatures] == [(1,), (2,), (3,)]
+        for signature in signatures:
+            assert "countdown" not in signature.options
+            assert "eta" not in signature.options
+
+        # force update of a user is not collapsed into its periodic fetch
+        # that waits in background queue
+        with django_capture_on_commit_callbacks(execute=True):
+            tasks.enqueue_fetch_feed(1)
+            tasks.enqueue_fetch_feed(1)
+        mock_apply_async.assert_called_once_with(
+            (1,), countdown=0, queue="feeds_interactive"
+        )
+        # whichever message is consumed first fetches feed
+        leases = acquire_leases([1], seconds=60)
+        release_leases(leases)
+        with django_capture_on_commit_callbacks(execute=True):
+            tasks.enqueue_fetch_feed(1)
+        assert mock_apply_async.call_count == 2
+
+    @pytest.mark.django_db
+    @patch("feed.tasks.group")
+    def test_schedule_fetch_feed_batch_half_open(self, mock_group, feeds):
+        Feed.objects.update(status=Feed.ACTIVE)
+        Feed.objects.filter(id=1).update(circuit_state=Feed.OPEN)
+        Feed.objects.filter(id=2).update(
+            circuit_state=Feed.OPEN, next_fetch_at=timezone.now() + timedelta(hours=1)
+        )
+        tasks.schedule_fetch_feed_batch()
+        # due open circuits become half open, their fetch is a trial
+        assert Feed.objects.get(id=1).circuit_state == Feed.HALF_OPEN
+        assert Feed.objects.get(id=2).circuit_state == Feed.OPEN
+        assert Feed.objects.get(id=3).circuit_state == Feed.CLOSED
+
+    @pytest.mark.django_db
+    @patch("feed.tasks.FeedReader", MockFeedReader)
+    def test_schedule_fetch_feed_batch_due_feeds(self, feeds, settings):
+        Feed.objects.update(status=Feed.ACTIVE)
+        Feed.objects.filter(id=1).update(
+            next_fetch_at=timezone.now() + timedelta(hours=1)
+        )
+        tasks.schedule_fetch_feed_batch()
+        assert Entry.objects.filter(feed_id=1).exists() is False
+        assert Entry.objects.count() == 2 * len(feed_reader_entries())
+        for feed in Feed.objects.exclude(id=1):
+            assert feed.next_fetch_at > timezone.now()
+
+    @pytest.mark.django_db
+    def test_schedule_fetch_feed_batch_lease(self, feeds, settings):
+        settings.FEED_FETCH_LEASE = 600
+        Feed.objects.update(status=Feed.ACTIVE)
+        with patch("feed.tasks.group") as mock_group:
+            tasks.schedule_fetch_feed_batch()
+            tasks.schedule_fetch_feed_batch()
+        # second run does not enqueue leased feeds
+        assert mock_group.call_count == 1
+        for feed in Feed.objects.all():
+            assert feed.next_fetch_at > timezone.now() + timedelta(minutes=9)
+
+    @pytest.mark.django_db
+    @patch("feed.tasks.fetch_feeds", side_effect=mock_fetch_feeds_async)
+    def test_fetch_feed_batch_entries_batch_engine(
+        self, mock_fetch, feeds, settings, django_assert_max_num_queries
+    ):
+        settings.FEED_FETCH_ENGINE = "batch"
+        # load feeds, insert entries and update feeds, transactions of
+        # bulk update and bulk insert on sqlite are counted too
+        with django_assert_max_num_queries(7):
+            tasks.fetch_feed_batch_entries([1, 2, 3])
+        assert mock_fetch.call_count == 1
+        assert Entry.objects.filter(feed_id=1).count() == len(feed_reader_entries())
+
+        feed = Feed.objects.get(id=1)
+        assert feed.status == Feed.ACTIVE
+        assert feed.http_etag == MockFeedReader.etag
+        assert feed.unchanged_count == 0
+        feed = Feed.objects.get(id=2)
+        assert feed.status == Feed.ACTIVE
+        assert feed.unchanged_count == 1
+        feed = Feed.objects.get(id=3)
+        assert feed.status == Feed.PENDING
+        assert feed.consecutive_failures == 1
+
+    @pytest.mark.django_db
+    @patch("feed.ingest.FeedReader.get_entries", side_effect=feed_reader_entries)
+    def test_fetch_feeds_reads_body_before_next_fetch(self, mock_get_entries, feeds):
+        results = fetch_feeds(tasks._feeds_to_fetch())
+        # a streamed body keeps its pooled connection until it is read, so
+        # every body is read by fetch_feeds, before next feed is fetched
+        assert mock_get_entries.call_count == 3
+        assert all(len(result.entries) == 2 for result in results)
+        persist_fetch_results(results)
+        assert mock_get_entries.call_count == 3
+        assert Entry.objects.count() == 6
+
+
+class TestEntryDedup:
+    @pytest.mark.django_db
+    def test_filter_new_entries(self, entries):
+        link_filter = LocalLinkFilter(bits=2 ** 16, hashes=5, capacity=1000)
+        deduplicator = EntryDeduplicator(link_filter)
+        # filter has not seen any link, so every entry goes to insert
+        candidates = [
+            Entry(
+                feed_id=1, link=link, title="", summary="", published_at=timezone.now()
+            )
+            for link in ("my-link1.io", "my-link2.io", "my-link3.io")
+        ]
+        assert deduplicator.filter_new(candidates) == candidates
+
+        # saved links and a link that is not saved
+        link_filter.add(["my-link1.io", "my-link2.io", "my-link3.io"])
+        assert [entry.link for entry in deduplicator.filter_new(candidates)] == [
+            "my-link3.io"
+        ]
+        assert deduplicator.stats.candidates == 6
+        assert deduplicator.stats.filter_hits == 3
+        assert deduplicator.stats.false_positives == 1
+        assert deduplicator.stats.hit_rate == 0.5
+
+    @pytest.mark.django_db
+    @patch("feed.tasks.FeedReader", MockFeedReader)
+    def test_fetch_feed_entries_mark_saved_links(self, feeds, settings):
+        settings.FEED_DEDUP_FILTER = "local"
+        tasks.fetch_feed_entries(1)
+        links = list(Entry.objects.values_list("link", flat=True))
+        deduplicator = get_entry_deduplicator()
+        assert deduplicator._filter.contains(links) == [True] * len(links)
+
+    @pytest.mark.django_db
+    def test_link_hash(self, entries):
+        for entry in Entry.objects.all():
+            assert entry.link_hash == hash_link(entry.link)
+        entry = Entry.objects.create(
+            feed_id=1,
+            title="entry title",
+            summary="entry summary",
+            link="my-link3.io",
+            published_at=timezone.now(),
+        )
+        assert entry.link_hash == hash_link("my-link3.io")
+        # duplicate links are ignored by unique index of link_hash
+        Entry.objects.bulk_create(
+            [
+                Entry(
+                    feed_id=2,
+                    title="entry title",
+                    summary="entry summary",
+                    link="my-link1.io",
+                    published_at=timezone.now(),
+                )
+            ],
+            ignore_conflicts=True,
+        )
+        assert Entry.objects.filter(link="my-link1.io").get().feed_id == 1
+
+    def test_redis_link_filter(self):
+        link_filter = RedisLinkFilter(bits=2 ** 16, hashes=5, ttl=60)
+        link_filter.key = f"test:{uuid4()}"
+        assert link_filter.contains(["https://www.feed.io/1"]) == [False]
+        link_filter.add(["https://www.feed.io/1"])
+        assert link_filter.contains(["https://www.feed.io/1", "new"]) == [True, False]
+        connection = get_redis_connection("default")
+        assert 0 < connection.ttl(link_filter.key) <= 60
+        connection.delete(link_filter.key)
+
+
+class TestPermanentRedirect:
+    @pytest.mark.django_db
+    def test_link_replaced_after_threshold(self, feeds, settings):
+        settings.FEED_PERMANENT_REDIRECT_THRESHOLD = 3
+        feed = Feed.objects.get(id=1)
+        target = "HTTPS://new.feed.io/rss/?utm_source=feedburner"
+        assert feed.track_permanent_redirect(target) is False
+        assert feed.track_permanent_redirect(target) is False
+        assert feed.redirect_link == "https://new.feed.io/rss/"
+        assert feed.redirect_count == 2
+        assert feed.track_permanent_redirect(target) is True
+        assert feed.link == "https://new.feed.io/rss/"
+        assert feed.redirect_count == 0
+
+    @pytest.mark.django_db
+    def test_link_replaced_by_trailing_slash(self, feeds, settings):
+        settings.FEED_PERMANENT_REDIRECT_THRESHOLD = 1
+        feed = Feed.objects.get(id=1)
+        feed.link = "https://www.feed.io/feed"
+        # like WordPress, server redirects to its form of path
+        assert feed.track_permanent_redirect("https://www.feed.io/feed/") is True
+        assert feed.link == "https://www.feed.io/feed/"
+        assert feed.track_permanent_redirect(None) is False
+
+    @pytest.mark.django_db
+    def test_redirect_streak_reset(self, feeds, settings):
+        settings.FEED_PERMANENT_REDIRECT_THRESHOLD = 2
+        feed = Feed.objects.get(id=1)
+        feed.track_permanent_redirect("https://new.feed.io/rss")
+        # a fetch without redirect resets the streak
+        feed.track_permanent_redirect(None)
+        assert feed.track_permanent_redirect("https://new.feed.io/rss") is False
+        # another target starts a new streak
+        assert feed.track_permanent_redirect("https://other.feed.io/rss") is False
+        assert feed.redirect_count == 1
+
+    @pytest.mark.django_db
+    def test_link_of_another_feed_not_replaced(self, feeds, settings):
+        settings.FEED_PERMANENT_REDIRECT_THRESHOLD = 1
+        feed = Feed.objects.get(id=1)
+        assert feed.track_permanent_redirect("https://WWW.Second-Feed.io") is False
+        assert feed.link == "https://www.feed.io"
+
+    @pytest.mark.django_db
+    @patch("feed.tasks.FeedReader")
+    def test_fetch_feed_entries_track_redirect(self, mock_reader, feeds, settings):
+        settings.FEED_PERMANENT_REDIRECT_THRESHOLD = 1
+        reader = MockFeedReader()
+        reader.permanent_redirect = "https://www.feed.io/new"
+        mock_reader.return_value = reader
+        tasks.fetch_feed_entries(1)
+        assert Feed.objects.get(id=1).link == "https://www.feed.io/new"
+
+
+class MockRateLimitedFeedReader(MockFeedReader):
+    def get_entries(self):
+        self.status_code = 429
+        raise RateLimitedException("Resp with status code 429", retry_after=120)
+
+
+class TestHostRateLimit:
+    @pytest.mark.django_db
+    @patch("feed.tasks.FeedReader", MockFeedReader)
+    def test_fetch_feed_entries_deferred(self, feeds, settings):
+        settings.FEED_HOST_RATE = 0.01
+        settings.FEED_HOST_BURST = 1
+        Feed.objects.update(status=Feed.ACTIVE)
+        tasks.fetch_feed_entries(1)
+        assert Entry.objects.count() == len(feed_reader_entries())
+
+        # host does not have any token, so fetch is deferred
+        Entry.objects.all().delete()
+        tasks.fetch_feed_entries(1)
+        assert Entry.objects.exists() is False
+        feed = Feed.objects.get(id=1)
+        assert feed.priority == Feed.HIGH
+        assert feed.consecutive_failures == 0
+        assert feed.next_fetch_at > timezone.now() + timedelta(seconds=90)
+
+        # other hosts are not limited
+        tasks.fetch_feed_entries(2)
+        assert Entry.objects.filter(feed_id=2).exists()
+
+    @pytest.mark.django_db
+    @patch("feed.tasks.FeedReader", MockRateLimitedFeedReader)
+    def test_fetch_feed_entries_retry_after(self, feeds):
+        Feed.objects.update(status=Feed.ACTIVE)
+        tasks.fetch_feed_entries(1)
+        feed = Feed.objects.get(id=1)
+        assert feed.status == Feed.ACTIVE
+        assert feed.priority == Feed.HIGH
+        assert feed.consecutive_failures == 0
+        assert feed.last_status_code == 429
+        assert feed.next_fetch_at > timezone.now() + timedelta(seconds=110)
+        # other feeds of host wait for Retry-After too
+        assert 110 < get_host_limiter().acquire("www.feed.io") <= 120
+
+    @pytest.mark.django_db
+    @patch("feed.tasks.fetch_feed_entries.apply_async")
+    @patch("feed.tasks.FeedReader", MockRateLimitedFeedReader)
+    def test_pending_feed_retried_after(
+        self, mock_apply_async, feeds, django_capture_on_commit_callbacks
+    ):
+        with django_capture_on_commit_callbacks(execute=True):
+            tasks.fetch_feed_entries(1)
+        mock_apply_async.assert_called_once_with(
+            (1,), countdown=120, queue="feeds_interactive"
+        )
+        assert Feed.objects.get(id=1).status == Feed.PENDING
+
+    @pytest.mark.django_db
+    @patch("feed.ingest.FeedReader", MockFeedReader)
+    def test_fetch_feed_batch_entries_deferred(self, user_sample, settings):
+        settings.FEED_FETCH_ENGINE = "batch"
+        settings.FEED_HOST_RATE = 0.01
+        settings.FEED_HOST_BURST = 2
+        Feed.objects.bulk_create(
+            Feed(creator=user_sample, link=f"https://www.feed.io/{i}", status="A")
+            for i in range(3)
+        )
+        ids = list(Feed.objects.values_list("id", flat=True))
+        tasks.fetch_feed_batch_entries(ids)
+        assert Feed.objects.filter(last_status_code=200).count() == 2
+        feed = Feed.objects.get(last_status_code__isnull=True)
+        assert feed.consecutive_failures == 0
+        assert feed.next_fetch_at > timezone.now() + timedelta(seconds=90)
+
+    @pytest.mark.django_db
+    @patch("feed.tasks.FeedReader.get_entries", side_effect=requests.Timeout)
+    def test_host_circuit(self, mock_get_entries, user_sample, settings):
+        settings.FEED_HOST_CIRCUIT_THRESHOLD = 2
+        Feed.objects.bulk_create(
+            Feed(creator=user_sample, link=f"https://www.feed.io/{i}", status="A")
+            for i in range(3)
+        )
+        feed_ids = list(Feed.objects.values_list("id", flat=True))
+        for feed_id in feed_ids[:2]:
+            with pytest.raises(requests.Timeout):
+                tasks.fetch_feed_entries(feed_id)
+        # circuit of host is open, so third feed is not requested
+        tasks.fetch_feed_entries(feed_ids[2])
+        assert mock_get_entries.call_count == 2
+        feed = Feed.objects.get(id=feed_ids[2])
+        assert feed.consecutive_failures == 0
+        assert feed.next_fetch_at > timezone.now() + timedelta(minutes=2)
+
+    def test_redis_host_limiter(self):
+        limiter = RedisHostLimiter(rate=0.5, burst=2, circuit_threshold=2)
+        limiter.key_prefix = f"test:{uuid4()}"
+        assert limiter.acquire("www.feed.io") == 0
+        assert limiter.acquire("www.feed.io") == 0
+        assert 1.9 < limiter.acquire("www.feed.io") <= 2
+        assert limiter.acquire("www.second-feed.io") == 0
+        limiter.block("www.second-feed.io", 60)
+        assert 59 < limiter.acquire("www.second-feed.io") <= 60
+
+        assert limiter.record_failure("www.last-feed.io") == 0
+        limiter.record_success("www.last-feed.io")
+        assert limiter.record_failure("www.last-feed.io") == 0
+        seconds = limiter.record_failure("www.last-feed.io")
+        assert seconds > 0
+        assert seconds - 1 < limiter.acquire("www.last-feed.io") <= seconds
+        connection = get_redis_connection("default")
+        connection.delete(*connection.keys(f"{limiter.key_prefix}:*"))
+
+
+class TestSingleFlight:
+    def test_claim_enqueue(self):
+        assert claim_enqueue([1, 2], ttl=60) == [1, 2]
+        assert claim_enqueue([1, 2, 3], ttl=60) == [3]
+        # message is consumed by its fetch
+        leases = acquire_leases([1], seconds=60)
+        assert claim_enqueue([1], ttl=60, in_flight=True) == []
+        assert claim_enqueue([1], ttl=60) == [1]
+        release_leases(leases)
+
+    def test_leases(self):
+        leases = acquire_leases([1, 2], seconds=60)
+        assert set(leases) == {1, 2}
+        assert acquire_leases([1, 3], seconds=60).keys() == {3}
+        assert 0 < lease_ttl(1) <= 60
+        # lease of another fetch is not released
+        release_leases({1: "expired-token"})
+        assert acquire_leases([1], seconds=60) == {}
+        release_leases(leases)
+        assert lease_ttl(1) == 0
+        assert acquire_leases([1], seconds=60).keys() == {1}
+
+    @pytest.mark.django_db
+    @patch("feed.tasks.FeedReader", MockFeedReader)
+    def test_fetch_feed_entries_in_flight(self, feeds):
+        Feed.objects.update(status=Feed.ACTIVE)
+        leases = acquire_leases([1], seconds=60)
+        tasks.fetch_feed_entries(1)
+        assert Entry.objects.exists() is False
+        release_leases(leases)
+        tasks.fetch_feed_entries(1)
+        assert Entry.objects.count() == len(feed_reader_entries())
+        assert lease_ttl(1) == 0
+
+    @pytest.mark.django_db
+    @patch("feed.tasks.fetch_feed_entries.apply_async")
+    def test_update_feed_signal_collapsed(
+        self, mock_apply_async, feeds, django_capture_on_commit_callbacks
+    ):
+        feed = Feed.objects.get(id=1)
+        with django_capture_on_commit_callbacks(execute=True):
+            feed.save()
+            feed.save()
+            # fetch is published after commit, so it reads the saved feed
+            mock_apply_async.assert_not_called()
+        mock_apply_async.assert_called_once_with(
+            (1,), countdown=0, queue="feeds_interactive"
+        )
+
+        # a rolled back save does not keep feed marked enqueued
+        feed = Feed.objects.get(id=2)
+        with django_capture_on_commit_callbacks(execute=True) as callbacks:
+            with pytest.raises(DataError), transaction.atomic():
+                feed.save()
+                raise DataError
+        assert callbacks == []
+        with django_capture_on_commit_callbacks(execute=True):
+            feed.save()
+        mock_apply_async.assert_called_with(
+            (2,), countdown=0, queue="feeds_interactive"
+        )
+
+    @pytest.mark.django_db
+    @patch("feed.tasks.group")
+    def test_schedule_fetch_feed_batch_collapsed(self, mock_group, feeds):
+        Feed.objects.update(status=Feed.ACTIVE)
+        claim_enqueue([1], ttl=60)
+        leases = acquire_leases([2], seconds=60)
+        tasks.schedule_fetch_feed_batch()
+        signatures = list(mock_group.call_args[0][0])
+        assert [signature.args for signature in signatures] == [(3,)]
+        # feeds that are not enqueued keep their next_fetch_at
+        assert Feed.objects.get(id=1).next_fetch_at < timezone.now()
+        release_leases(leases)
+
+
+class TestBackpressure:
+    def test_queue_depth(self):
+        # queue of eager tasks is not declared on broker
+        assert queue_depth("not-declared") == 0
+
+    def test_in_flight_count(self):
+        claim_enqueue([1, 2], ttl=60)
+        assert in_flight_count() == 2
+        leases = acquire_leases([1], seconds=60)
+        assert in_flight_count() == 2
+        release_leases(leases)
+        assert in_flight_count() == 1
+        # expired marks are not counted
+        claim_enqueue([3], ttl=60)
+        get_redis_connection("default").zadd("feed:fetch_in_flight", {3: 0})
+        assert in_flight_count() == 1
+
+    @pytest.mark.django_db
+    @patch("feed.tasks.group")
+    @patch("feed.backpressure.queue_depth", return_value=1000)
+    def test_schedule_tick_skipped(self, mock_depth, mock_group, feeds, settings):
+        settings.FEED_SCHEDULE_MAX_QUEUE_DEPTH = 1000
+        Feed.objects.update(
+            status=Feed.ACTIVE, next_fetch_at=timezone.now() - timedelta(hours=1)
+        )
+        tasks.schedule_fetch_feed_batch()
+        assert mock_group.called is False
+        assert in_flight_count() == 0
+        metrics = get_metrics()
+        assert metrics["queue_depth"] == 1000
+        assert metrics["budget"] == 0
+        assert metrics["enqueued"] == 0
+        assert metrics["lag"] >= 3600
+
+    @pytest.mark.django_db
+    @patch("feed.tasks.group")
+    @patch("feed.backpressure.queue_depth", return_value=0)
+    def test_schedule_tick_shrunk(self, mock_depth, mock_group, feeds, settings):
+        settings.FEED_SCHEDULE_MAX_IN_FLIGHT = 3
+        now = timezone.now()
+        Feed.objects.update(status=Feed.ACTIVE)
+        for feed_id, overdue in ((1, 1), (2, 3), (3, 2)):
+            Feed.objects.filter(id=feed_id).update(
+                next_fetch_at=now - timedelta(minutes=overdue)
+            )
+        claim_enqueue([100], ttl=60)
+        tasks.schedule_fetch_feed_batch()
+        # the most overdue feeds fill the pipeline, others stay due
+        signatures = list(mock_group.call_args[0][0])
+        assert [signature.args for signature in signatures] == [(2,), (3,)]
+        assert Feed.objects.get(id=1).next_fetch_at < timezone.now()
+        assert in_flight_count() == 3
+
+    @pytest.mark.django_db
+    @patch("feed.backpressure.queue_depth", return_value=0)
+    def test_schedule_metrics(
+        self, mock_depth, client, feeds, user_authorize_header, settings
+    ):
+        url = reverse("feed_schedule_metrics")
+        resp = client.get(url, **user_authorize_header)
+        assert resp.status_code == 403
+
+        User.objects.update(is_staff=True, is_superuser=True)
+        resp = client.get(url, **user_authorize_header)
+        assert resp.status_code == 200
+        assert resp.json()["data"] == {}
+
+        with patch("feed.tasks.group"):
+            tasks.schedule_fetch_feed_batch()
+        resp = client.get(url, **user_authorize_header)
+        data = resp.json()["data"]
+        assert data["queue_depth"] == 0
+        assert data["in_flight"] == 0
+        assert data["lag"] == 0
+        assert data["budget"] == settings.FEED_SCHEDULE_MAX_IN_FLIGHT
+        assert data["enqueued"] == 0
+
+
+class TestEntryBuffer:
+    @pytest.mark.django_db
+    @patch("feed.tasks.FeedReader", MockFeedReader)
+    def test_fetch_feed_entries_buffered(self, feeds, settings):
+        settings.FEED_ENTRY_BUFFER = "local"
+        settings.FEED_ENTRY_FLUSH_MESSAGES = 2
+        tasks.fetch_feed_entries(1)
+        tasks.fetch_feed_entries(2)
+        tasks.fetch_feed_entries(3)
+        # fetches do not insert their entries
+        assert Entry.objects.exists() is False
+        assert Feed.objects.get(id=1).status == Feed.ACTIVE
+        assert get_entry_buffer().size() == 3
+
+        stats = flush_entry_buffer()
+        assert stats.messages == 2
+        assert stats.rows == 2 * len(feed_reader_entries())
+        assert stats.inserted == stats.rows
+        stats = flush_entry_buffer()
+        assert stats.messages == 1
+        assert stats.inserted == len(feed_reader_entries())
+        assert flush_entry_buffer().messages == 0
+        assert Entry.objects.count() == 3 * len(feed_reader_entries())
+
+        # saved links are skipped
+        get_entry_buffer().push(entry_rows(Entry.objects.all()))
+        stats = flush_entry_buffer()
+        assert stats.rows == Entry.objects.count()
+        assert stats.inserted == 0
+
+    @pytest.mark.django_db
+    @patch("feed.tasks.FeedReader", MockFeedReader)
+    def test_flush_drops_invalid_rows(self, feeds, settings):
+        settings.FEED_ENTRY_BUFFER = "local"
+        settings.FEED_DEDUP_FILTER = "local"
+        tasks.fetch_feed_entries(1)
+        feed = Feed.objects.get(id=1)
+        assert feed.http_etag == MockFeedReader.etag
+        get_entry_buffer().push(
+            entry_rows(
+                [
+                    Entry(
+                        feed=feed,
+                        title="Invalid",
+                        link="https://feed.io/invalid",
+                        summary="",
+                        published_at=timezone.now() + timedelta(days=1),
+                    )
+                ]
+            )
+        )
+        # links are marked saved after they are inserted
+        deduplicator = get_entry_deduplicator()
+        assert deduplicator._filter.contains(["https://feed.io/invalid"]) == [False]
+
+        def insert_valid_rows(rows):
+            if any(row["title"] == "Invalid" for row in rows):
+                raise DataError("value too long")
+            return insert_entry_rows(rows)
+
+        with patch("feed.buffer.insert_entry_rows", side_effect=insert_valid_rows):
+            stats = flush_entry_buffer()
+        assert stats.inserted == len(feed_reader_entries())
+        assert stats.dropped == 1
+        links = list(Entry.objects.values_list("link", flat=True))
+        assert deduplicator._filter.contains(links) == [True] * len(links)
+        assert deduplicator._filter.contains(["https://feed.io/invalid"]) == [False]
+        # feed of dropped row is fetched again without validators
+        feed.refresh_from_db()
+        assert feed.http_etag is None
+        assert feed.content_digest is None
+        assert feed.last_published_at == max(
+            Entry.objects.values_list("published_at", flat=True)
+        )
+
+    @pytest.mark.django_db
+    @patch("feed.tasks.FeedReader", MockFeedReader)
+    def test_flusher_marks_links_for_workers(self, feeds, settings, monkeypatch):
+        settings.FEED_ENTRY_BUFFER = "redis"
+        settings.FEED_DEDUP_FILTER = "redis"
+        # worker and flusher are separate processes with their own filters
+        monkeypatch.setattr(dedup, "_deduplicator", None)
+        tasks.fetch_feed_entries(1)
+        worker = get_entry_deduplicator()
+        monkeypatch.setattr(dedup, "_deduplicator", None)
+        flush_entry_buffer()
+        assert get_entry_deduplicator() is not worker
+
+        # links that flusher inserted are known by worker
+        entries = [
+            Entry(
+                feed_id=1,
+                title=entry.title,
+                link=entry.link,
+                summary=entry.summary,
+                published_at=entry.published_at,
+            )
+            for entry in Entry.objects.all()
+        ]
+        assert len(entries) == len(feed_reader_entries())
+        assert worker.filter_new(entries) == []
+        assert worker.stats.filter_hits == len(entries)
+        assert worker.stats.false_positives == 0
+
+        settings.FEED_DEDUP_FILTER = "local"
+        monkeypatch.setattr(dedup, "_deduplicator", None)
+        with pytest.raises(ImproperlyConfigured):
+            get_entry_deduplicator()
+
+    @pytest.mark.django_db
+    def test_flush_skips_deleted_feeds(self, feeds, settings):
+        settings.FEED_ENTRY_BUFFER = "local"
+        buffer = get_entry_buffer()
+        for feed_id in (1, 2):
+            feed = Feed.objects.get(id=feed_id)
+            buffer.push(
+                entry_rows(
+                    [
+                        Entry(
+                            feed=feed,
+                            title="Title",
+                            link=f"https://feed{feed_id}.io/entry",
+                            summary="",
+                            published_at=timezone.now(),
+                        )
+                    ]
+                )
+            )
+        Feed.objects.filter(id=2).delete()
+        stats = flush_entry_buffer()
+        assert stats.rows == 2
+        assert stats.inserted == 1
+        assert Entry.objects.get().summary == ""
+
+    @pytest.mark.django_db
+    def test_redis_entry_buffer(self, feeds, settings):
+        settings.FEED_ENTRY_BUFFER = "redis"
+        settings.FEED_ENTRY_FLUSH_MESSAGES = 10
+        feed = Feed.objects.get(id=1)
+        rows = entry_rows(
+            [
+                Entry(
+                    feed=feed,
+                    title=f"Title {i}",
+                    link=f"https://feed.io/{i}",
+                    summary="Summary",
+                    published_at=timezone.now(),
+                )
+                for i in range(3)
+            ]
+        )
+        buffer = get_entry_buffer()
+        buffer.push(rows[:2])
+        buffer.push(rows[2:])
+
+        # a flusher died before it flushed messages
+        dead = RedisEntryBuffer(claim_idle=0, consumer="dead")
+        assert [len(message_rows) for _, message_rows in dead.read(10)] == [2, 1]
+        # messages that are not idle long enough are not claimed
+        assert RedisEntryBuffer(claim_idle=60000, consumer="alive").read(10) == []
+        # messages of dead flusher are claimed
+        stats = flush_entry_buffer(RedisEntryBuffer(claim_idle=0, consumer="alive"))
+        assert stats.messages == 2
+        assert stats.inserted == 3
+        assert buffer.size() == 0
+        assert flush_entry_buffer(buffer).messages == 0
+
+    @pytest.mark.django_db
+    @patch("feed.tasks.FeedReader", MockFeedReader)
+    def test_flush_entries_command(self, feeds, settings):
+        settings.FEED_ENTRY_BUFFER = "local"
+        tasks.fetch_feed_entries(1)
+        call_command("flush_entries", "--once")
+        assert Entry.objects.count() == len(feed_reader_entries())
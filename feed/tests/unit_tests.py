@@ -1,9 +1,23 @@
+from datetime import datetime, timedelta, timezone
 from unittest.mock import patch
 
 import pytest
+import requests
 
 from feed.models import Feed
 from feed import tasks
+from feed.bitmaps import IdBitmap
+from feed.dedup import LocalLinkFilter
+from feed.leases import lease_seconds
+from feed.links import canonicalize_url
+from feed.scheduling import (
+    compute_fetch_interval,
+    compute_next_fetch_at,
+    estimate_publish_interval,
+    fetch_countdown,
+    fetch_phase,
+)
+from feed.throttle import LocalHostLimiter, host_of, track_host
 from feedreader.exceptions import FeedReaderBaseException
 
 
@@ -30,7 +44,9 @@ class TestTasks:
         )
         assert mock_get_entries.assert_called_once_with() is None
         assert (
-            mock_feed.objects.annotate().get().feed_fail.assert_called_once_with()
+            mock_feed.objects.annotate()
+            .get()
+            .feed_fail.assert_called_once_with(status_code=None)
             is None
         )
 
@@ -47,7 +63,9 @@ class TestTasks:
         )
         assert mock_get_entries.assert_called_once_with() is None
         assert (
-            mock_feed.objects.annotate().get().feed_fail.assert_called_once_with()
+            mock_feed.objects.annotate()
+            .get()
+            .feed_fail.assert_called_once_with(status_code=None)
             is None
         )
 
@@ -60,8 +78,231 @@ class TestTasks:
             mock_feed.objects.annotate().get.assert_called_once_with(id=feed_id) is None
         )
         assert mock_get_entries.assert_called_once_with() is None
+        feed = mock_feed.objects.annotate().get()
         assert (
-            mock_feed.objects.annotate().get().feed_success.assert_called_once_with()
+            feed.feed_success.assert_called_once_with(
+                published_dates=[],
+                followers_count=feed.followers_count,
+                status_code=None,
+            )
             is None
         )
         assert mock_feed.objects.annotate().get().feed_fail.assert_not_called() is None
+
+
+class TestScheduling:
+    def test_estimate_publish_interval(self, settings):
+        settings.FEED_PUBLISH_INTERVAL_WEIGHT = 0.5
+        now = datetime.now(timezone.utc)
+        hour = timedelta(hours=1)
+        # not enough entries
+        assert estimate_publish_interval([], None, None) is None
+        assert estimate_publish_interval([now], None, 100) == 100
+        # new feed
+        assert estimate_publish_interval([now, now - 2 * hour], None, None) == 7200
+        # since last published entry
+        assert estimate_publish_interval([now, now - hour], now - 4 * hour, None) == (
+            7200
+        )
+        # smoothed with previous estimation
+        assert estimate_publish_interval([now], now - hour, 7200) == 5400
+
+    def test_compute_fetch_interval(self, settings):
+        settings.FEED_MIN_FETCH_INTERVAL = 120
+        settings.FEED_MAX_FETCH_INTERVAL = 43200
+        settings.FEED_DEFAULT_FETCH_INTERVAL = 300
+        settings.FEED_UNCHANGED_BACKOFF = 2
+        settings.FEED_ERROR_BACKOFF = 300
+
+        assert compute_fetch_interval(None) == 300
+        assert compute_fetch_interval(3600) == 1800
+        # bounded
+        assert compute_fetch_interval(60) == 120
+        assert compute_fetch_interval(7 * 24 * 3600) == 43200
+        # no new entries
+        assert compute_fetch_interval(3600, unchanged_count=2) == 7200
+        # followers
+        assert compute_fetch_interval(3600, followers_count=9) == 900
+        # errors
+        assert compute_fetch_interval(3600, consecutive_failures=1) == 300
+        assert compute_fetch_interval(3600, consecutive_failures=3) == 1200
+        assert compute_fetch_interval(3600, consecutive_failures=30) == 43200
+
+    def test_fetch_phase(self):
+        phases = [fetch_phase(feed_id, 60) for feed_id in range(1, 6001)]
+        assert phases == [fetch_phase(feed_id, 60) for feed_id in range(1, 6001)]
+        # consecutive ids are spread evenly over window
+        counts = [0] * 6
+        for phase in phases:
+            assert 0 <= phase < 60
+            counts[int(phase // 10)] += 1
+        assert min(counts) > 900 and max(counts) < 1100
+
+    def test_fetch_countdown(self):
+        now = datetime.fromtimestamp(6000, timezone.utc)
+        phase = fetch_phase(7, 60)
+        assert fetch_countdown(7, now, 60) == pytest.approx(phase)
+        later = now + timedelta(seconds=phase + 1)
+        assert fetch_countdown(7, later, 60) == pytest.approx(59)
+        assert fetch_countdown(7, now, 0) == 0
+
+    def test_next_fetch_at_phase(self, settings):
+        settings.FEED_SCHEDULE_WINDOW = 60
+        settings.FEED_DEFAULT_FETCH_INTERVAL = 300
+        feed = Feed(id=7, status=Feed.ACTIVE)
+        before = datetime.now(timezone.utc)
+        next_fetch_at = compute_next_fetch_at(feed)
+        # feed is due at its phase in window after its interval
+        assert before + timedelta(seconds=300) <= next_fetch_at
+        assert next_fetch_at < datetime.now(timezone.utc) + timedelta(seconds=360)
+        assert next_fetch_at.timestamp() % 60 == pytest.approx(fetch_phase(7, 60))
+
+
+class TestLeases:
+    def test_lease_seconds(self, settings):
+        settings.FEED_FETCH_LEASE_MARGIN = 60
+        assert lease_seconds([]) == 60
+        assert lease_seconds([5]) == 65
+        # one by one
+        assert lease_seconds([5, 2, 10]) == 77
+        # concurrently by waves of 2 feeds
+        assert lease_seconds([5, 2, 10], concurrency=2) == 80
+
+
+class TestLinkFilter:
+    def test_local_link_filter(self):
+        link_filter = LocalLinkFilter(bits=2 ** 16, hashes=5, capacity=100)
+        links = [f"https://www.feed.io/{i}" for i in range(50)]
+        assert link_filter.contains(links) == [False] * 50
+        link_filter.add(links)
+        assert link_filter.contains(links) == [True] * 50
+        assert link_filter.contains(["https://www.feed.io/new"]) == [False]
+
+    def test_local_link_filter_capacity(self):
+        link_filter = LocalLinkFilter(bits=2 ** 16, hashes=5, capacity=100)
+        link_filter.add([f"https://www.feed.io/{i}" for i in range(80)])
+        # filter is cleared before it holds more than capacity
+        link_filter.add(["https://www.feed.io/new"] * 40)
+        assert link_filter.contains(["https://www.feed.io/1"]) == [False]
+        assert link_filter.contains(["https://www.feed.io/new"]) == [True]
+
+
+class TestLinks:
+    @pytest.mark.parametrize(
+        "url,expected",
+        (
+            ("https://www.feed.io/rss", "https://www.feed.io/rss"),
+            (" HTTPS://WWW.Feed.io/Rss/ ", "https://www.feed.io/Rss/"),
+            ("https://www.feed.io:443", "https://www.feed.io"),
+            ("https://www.feed.io:443/", "https://www.feed.io/"),
+            ("http://www.feed.io:8080/rss/", "http://www.feed.io:8080/rss/"),
+            ("https://www.feed.io/a#", "https://www.feed.io/a"),
+            ("https://www.feed.io/a#comments", "https://www.feed.io/a#comments"),
+            ("https://app.feed.io/#!/post/1", "https://app.feed.io/#!/post/1"),
+            (
+                "https://app.feed.io/?utm_source=x#/post/2",
+                "https://app.feed.io/#/post/2",
+            ),
+            (
+                "https://www.feed.io/a?utm_source=rss&utm_medium=x&id=1&fbclid=2",
+                "https://www.feed.io/a?id=1",
+            ),
+            ("https://www.feed.io/a?b=%20c&b=d", "https://www.feed.io/a?b=%20c&b=d"),
+            ("http://[::1]:8000/rss", "http://[::1]:8000/rss"),
+            ("tag:feed.io,2021:entry-1", "tag:feed.io,2021:entry-1"),
+            ("http://[::1/entry", "http://[::1/entry"),
+            ("http://www.feed.io:port/entry", "http://www.feed.io:port/entry"),
+        ),
+    )
+    def test_canonicalize_url(self, url, expected):
+        assert canonicalize_url(url) == expected
+
+
+class TestHostLimiter:
+    @patch("feed.throttle.time.monotonic")
+    def test_local_host_limiter(self, mock_monotonic):
+        mock_monotonic.return_value = 100.0
+        limiter = LocalHostLimiter(rate=0.5, burst=2, circuit_threshold=5)
+        assert limiter.acquire("www.feed.io") == 0
+        assert limiter.acquire("www.feed.io") == 0
+        assert limiter.acquire("www.feed.io") == 2
+        # other hosts have their own bucket
+        assert limiter.acquire("www.second-feed.io") == 0
+
+        mock_monotonic.return_value = 103.0
+        assert limiter.acquire("www.feed.io") == 0
+        assert limiter.acquire("www.feed.io") == 1
+
+    @patch("feed.throttle.time.monotonic")
+    def test_local_host_limiter_block(self, mock_monotonic):
+        mock_monotonic.return_value = 100.0
+        limiter = LocalHostLimiter(rate=1, burst=10, circuit_threshold=5)
+        limiter.block("www.feed.io", 60)
+        assert limiter.acquire("www.feed.io") == 60
+        mock_monotonic.return_value = 160.0
+        assert limiter.acquire("www.feed.io") == 0
+
+    @patch("feed.throttle.jitter", lambda interval: interval)
+    @patch("feed.throttle.time.monotonic")
+    def test_local_host_circuit(self, mock_monotonic, settings):
+        settings.FEED_ERROR_BACKOFF = 300
+        mock_monotonic.return_value = 100.0
+        limiter = LocalHostLimiter(rate=1, burst=10, circuit_threshold=2)
+        assert limiter.record_failure("www.feed.io") == 0
+        assert limiter.record_failure("www.feed.io") == 300
+        assert limiter.acquire("www.feed.io") == 300
+
+        # half open, next failure opens it for a longer time
+        mock_monotonic.return_value = 400.0
+        assert limiter.acquire("www.feed.io") == 0
+        assert limiter.record_failure("www.feed.io") == 600
+
+        # success closes it
+        limiter.record_success("www.feed.io")
+        assert limiter.record_failure("www.feed.io") == 0
+
+    def test_track_host(self, settings):
+        settings.FEED_HOST_RATE_LIMITER = "local"
+        settings.FEED_HOST_CIRCUIT_THRESHOLD = 1
+        url = "https://www.feed.io/rss"
+        # errors of feed are not failures of host
+        assert track_host(url, FeedReaderBaseException(), 404) == 0
+        assert track_host(url, FeedReaderBaseException()) == 0
+        assert track_host(url, requests.ConnectionError()) > 0
+        assert track_host("https://www.second-feed.io", status_code=502) > 0
+
+    def test_host_of(self):
+        assert host_of("https://WWW.Feed.io:443/rss") == "www.feed.io"
+        assert host_of("my-link1.io") == ""
+
+
+class TestIdBitmap:
+    def test_sparse_and_dense_containers(self):
+        # second container has more ids than an array container
+        ids = [1, 7, 65535, *range(70000, 80000, 2), 2 ** 40 + 3]
+        bitmap = IdBitmap(reversed(ids))
+        data = bitmap.to_bytes()
+        # 2 bytes per id of arrays, 8 KiB for the dense container
+        assert len(data) < 5000 * 2
+        restored = IdBitmap.from_bytes(data)
+        assert list(restored) == ids
+        assert len(restored) == len(ids)
+        assert 70002 in restored and 70001 not in restored
+        assert list(IdBitmap.from_bytes(memoryview(data))) == ids
+        assert list(IdBitmap.from_bytes(None)) == []
+
+    def test_discard_until(self):
+        bitmap = IdBitmap([3, 65540, 65600, 200000])
+        bitmap.discard_until(65540)
+        assert list(bitmap) == [65600, 200000]
+        bitmap.discard_until(300000)
+        assert len(bitmap) == 0
+        assert bitmap.to_bytes() == b""
+
+    def test_discard(self):
+        bitmap = IdBitmap([3, 65540])
+        bitmap.discard(65540)
+        bitmap.discard(7)
+        assert list(bitmap) == [3]
+        bitmap.discard(3)
+        assert bitmap.to_bytes() == b""
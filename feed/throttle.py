@@ -0,0 +1,265 @@
+import asyncio
+import os
+import time
+import typing
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from feed.scheduling import compute_fetch_interval, jitter
+from feedreader.exceptions import RateLimitedException
+
+
+# refill and take a token of bucket of a host in one round trip, time of
+# redis is used, so clocks of workers do not matter
+ACQUIRE_SCRIPT = """
+local blocked = redis.call("PTTL", KEYS[2])
+if blocked > 0 then
+    return tostring(blocked / 1000)
+end
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated_at")
+local tokens = tonumber(bucket[1]) or burst
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(now - updated_at, 0) * rate)
+local wait = 0
+if tokens < 1 then
+    wait = (1 - tokens) / rate
+else
+    tokens = tokens - 1
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated_at", tostring(now))
+redis.call("EXPIRE", KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class HostRateLimitedException(RateLimitedException):
+    """
+    Host of feed does not have token, so its request is not sent
+    """
+
+
+# errors of hosts, other errors are errors of feeds
+HOST_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    aiohttp.ClientConnectionError,
+    asyncio.TimeoutError,
+)
+
+
+def host_of(url: str) -> str:
+    return urlsplit(url).hostname or ""
+
+
+def host_backoff(opens: int) -> float:
+    """
+    Seconds an open circuit of a host stays open, it is doubled by every
+    open in a row like backoff of feeds
+    """
+    return jitter(compute_fetch_interval(None, consecutive_failures=opens))
+
+
+class LocalHostLimiter:
+    """
+    Token bucket and circuit breaker of every host in memory of a worker
+    process
+
+    a bucket holds at most burst tokens and is refilled by rate tokens per
+    second, a blocked host does not give any token until its block ends
+
+    circuit of a host opens, it is blocked, after circuit_threshold failures
+    in a row, when block ends circuit is half open, its failures are not
+    reset, so next failure opens it again for a longer time and next
+    success closes it
+    """
+
+    def __init__(self, rate: float, burst: int, circuit_threshold: int):
+        self._rate = rate
+        self._burst = burst
+        self._circuit_threshold = circuit_threshold
+        self._buckets = {}
+        self._blocked_until = {}
+        self._failures = {}
+        self._opens = {}
+
+    def acquire(self, host: str) -> float:
+        """
+        Take a token of host
+
+        :return: seconds to wait for a token, 0 if a token is taken
+        """
+        now = time.monotonic()
+        blocked = self._blocked_until.get(host, 0) - now
+        if blocked > 0:
+            return blocked
+        tokens, updated_at = self._buckets.get(host, (self._burst, now))
+        tokens = min(self._burst, tokens + (now - updated_at) * self._rate)
+        if tokens < 1:
+            self._buckets[host] = (tokens, now)
+            return (1 - tokens) / self._rate
+        self._buckets[host] = (tokens - 1, now)
+        return 0.0
+
+    def block(self, host: str, seconds: float):
+        self._blocked_until[host] = time.monotonic() + seconds
+
+    def record_failure(self, host: str) -> float:
+        """
+        :return: seconds circuit of host is opened, 0 if it is closed
+        """
+        self._failures[host] = self._failures.get(host, 0) + 1
+        if self._failures[host] < self._circuit_threshold:
+            return 0.0
+        self._opens[host] = self._opens.get(host, 0) + 1
+        seconds = host_backoff(self._opens[host])
+        self.block(host, seconds)
+        return seconds
+
+    def record_success(self, host: str):
+        self._failures.pop(host, None)
+        self._opens.pop(host, None)
+
+
+class RedisHostLimiter:
+    """
+    Token bucket and circuit breaker of every host in redis shared by all
+    workers, like LocalHostLimiter
+
+    buckets expire when they are full, blocks expire when they end and
+    counters of circuits expire after FEED_MAX_FETCH_INTERVAL without
+    failures
+    """
+
+    key_prefix = "feed:host"
+
+    def __init__(self, rate: float, burst: int, circuit_threshold: int):
+        self._rate = rate
+        self._burst = burst
+        self._circuit_threshold = circuit_threshold
+        self._script = None
+
+    def acquire(self, host: str) -> float:
+        """
+        Take a token of host
+
+        :return: seconds to wait for a token, 0 if a token is taken
+        """
+        if self._script is None:
+            self._script = get_redis_connection("default").register_script(
+                ACQUIRE_SCRIPT
+            )
+        wait = self._script(
+            keys=(
+                f"{self.key_prefix}:bucket:{host}",
+                f"{self.key_prefix}:blocked:{host}",
+            ),
+            args=(self._rate, self._burst),
+        )
+        return float(wait)
+
+    def block(self, host: str, seconds: float):
+        get_redis_connection("default").set(
+            f"{self.key_prefix}:blocked:{host}", 1, px=max(int(seconds * 1000), 1)
+        )
+
+    def record_failure(self, host: str) -> float:
+        """
+        :return: seconds circuit of host is opened, 0 if it is closed
+        """
+        failures_key = f"{self.key_prefix}:failures:{host}"
+        opens_key = f"{self.key_prefix}:opens:{host}"
+        ttl = settings.FEED_MAX_FETCH_INTERVAL
+        pipe = get_redis_connection("default").pipeline(transaction=False)
+        pipe.incr(failures_key)
+        pipe.expire(failures_key, ttl)
+        if pipe.execute()[0] < self._circuit_threshold:
+            return 0.0
+        pipe.incr(opens_key)
+        pipe.expire(opens_key, ttl)
+        seconds = host_backoff(pipe.execute()[0])
+        self.block(host, seconds)
+        return seconds
+
+    def record_success(self, host: str):
+        get_redis_connection("default").delete(
+            f"{self.key_prefix}:failures:{host}", f"{self.key_prefix}:opens:{host}"
+        )
+
+
+_limiter = None
+_limiter_pid = None
+
+
+def get_host_limiter():
+    """
+    Host limiter of worker process based on FEED_HOST_RATE_LIMITER setting
+
+    None means hosts are not rate limited
+    """
+    global _limiter, _limiter_pid
+    if settings.FEED_HOST_RATE_LIMITER is None:
+        return None
+    if _limiter is None or _limiter_pid != os.getpid():
+        if settings.FEED_HOST_RATE_LIMITER == "redis":
+            limiter_class = RedisHostLimiter
+        else:
+            limiter_class = LocalHostLimiter
+        _limiter = limiter_class(
+            settings.FEED_HOST_RATE,
+            settings.FEED_HOST_BURST,
+            circuit_threshold=settings.FEED_HOST_CIRCUIT_THRESHOLD,
+        )
+        _limiter_pid = os.getpid()
+    return _limiter
+
+
+def acquire_host(url: str) -> float:
+    """
+    Take a token of host of url before fetching it
+
+    :return: seconds to wait before fetching url, 0 if it can be fetched now
+    """
+    limiter = get_host_limiter()
+    return limiter.acquire(host_of(url)) if limiter else 0.0
+
+
+def block_host(url: str, retry_after: typing.Optional[float]) -> int:
+    """
+    Stop fetches of host of url for Retry-After of its response,
+    FEED_HOST_DEFAULT_RETRY_AFTER if it did not send one
+
+    :return: seconds that host is blocked
+    """
+    if retry_after is None:
+        retry_after = settings.FEED_HOST_DEFAULT_RETRY_AFTER
+    seconds = int(min(max(retry_after, 1), settings.FEED_MAX_FETCH_INTERVAL))
+    limiter = get_host_limiter()
+    if limiter:
+        limiter.block(host_of(url), seconds)
+    return seconds
+
+
+def track_host(url: str, error: Exception = None, status_code: int = None) -> float:
+    """
+    Count result of a fetch in circuit of host of url
+
+    timeouts, connection errors and 5xx responses are failures of host,
+    any other response is a success of host even if feed is invalid
+
+    :return: seconds circuit of host is opened, 0 if it is closed
+    """
+    limiter = get_host_limiter()
+    if not limiter:
+        return 0.0
+    if status_code is not None and status_code >= 500 or isinstance(error, HOST_ERRORS):
+        return limiter.record_failure(host_of(url))
+    if status_code is not None:
+        limiter.record_success(host_of(url))
+    return 0.0
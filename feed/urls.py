@@ -8,6 +8,11 @@ urlpatterns = [
     path(
         "feeds/my_feeds", feed_views.FeedCreatedByMeListView.as_view(), name="my_feeds"
     ),
+    path(
+        "feeds/schedule_metrics",
+        feed_views.FeedScheduleMetricsView.as_view(),
+        name="feed_schedule_metrics",
+    ),
     path(
         "feeds/<int:instance_id>",
         feed_views.FeedUpdateView.as_view(),
@@ -18,7 +23,15 @@ urlpatterns = [
         feed_views.FeedUnFollowView.as_view(),
         name="feed_unfollow",
     ),
+    path(
+        "feeds/followed/unread",
+        feed_views.FeedUnreadCountView.as_view(),
+        name="feed_unread_counts",
+    ),
     path("feeds/followed", feed_views.FeedFollowView.as_view(), name="feed_follow"),
+    path(
+        "feeds/<int:feed_id>/read", feed_views.FeedReadView.as_view(), name="feed_read"
+    ),
     path(
         "feeds/<int:feed_id>/entries",
         feed_views.EntryListView.as_view(),
@@ -26,4 +39,5 @@ urlpatterns = [
     ),
     path("entries", feed_views.EntryListView.as_view(), name="entries"),
     path("entries/read", feed_views.EntryReadView.as_view(), name="entry_read"),
+    path("timeline", feed_views.TimelineView.as_view(), name="timeline"),
 ]
@@ -8,16 +8,24 @@ from rest_framework import (
 )
 from rest_framework.permissions import IsAuthenticated
 
-from feed.models import Feed, Entry
+from feed.backpressure import get_metrics
+from feed.models import Entry, Feed, FollowFeed, ReadState
 from feed.serializers import (
     FeedSerializers,
     EntrySerializers,
     NestedFeedEntrySerializer,
 )
-from utils import exceptions, responses, utils
+from utils import counting, exceptions, responses, utils
+from utils.permissions import StaffPermission
 from utils.tools import create, update
 
 
+# orderings of lists end with id, so they are total orders for cursor
+# pagination, they have composite indexes
+FEED_ORDERING = ("title", "id")
+ENTRY_NEWEST_ORDERING = ("-published_at", "-id")
+ENTRY_OLDEST_ORDERING = ("published_at", "id")
+
 # Feed
 @decorators.permission_classes((IsAuthenticated,))
 class FeedCreateListView(create.CreateView):
@@ -41,10 +49,15 @@ class FeedCreateListView(create.CreateView):
 
         Get list of available feeds
 
-            pagination with index and size
+            pagination with index and size or cursor and size
 
             /?index=0&size=20
 
+            /?cursor=&size=20 next_cursor of response is cursor of next page
+
+            /?count=cached total is exact, cached, estimated or none, none has
+            has_more instead of total, exact default
+
             filter
 
                 title
@@ -59,7 +72,6 @@ class FeedCreateListView(create.CreateView):
     throttle_rate = "200/hour"
 
     def get(self, request, *args, **kwargs):
-        index, size = utils.pagination_util(request)
         args = request.query_params
         filters = {}
         if args.get("title"):
@@ -71,10 +83,10 @@ class FeedCreateListView(create.CreateView):
             filters["status"] = Feed.ACTIVE
 
         feed_query = self.model.objects.filter(**filters)
-        total = feed_query.count()
+        page, pagination = utils.paginate(request, feed_query, FEED_ORDERING)
 
-        data = self.get_serializer(feed_query[index:size], many=True).data
-        return responses.SuccessResponse(data, index=index, total=total)
+        data = self.get_serializer(page, many=True).data
+        return responses.SuccessResponse(data, **pagination)
 
 
 @decorators.permission_classes((IsAuthenticated,))
@@ -84,10 +96,15 @@ class FeedCreatedByMeListView(generics.GenericAPIView):
 
         Get list of feeds created by user
 
-            pagination with index and size
+            pagination with index and size or cursor and size
 
             /?index=0&size=20
 
+            /?cursor=&size=20 next_cursor of response is cursor of next page
+
+            /?count=cached total is exact, cached, estimated or none, none has
+            has_more instead of total, exact default
+
             filter
 
                 title
@@ -98,7 +115,6 @@ class FeedCreatedByMeListView(generics.GenericAPIView):
     throttle_classes = ()
 
     def get(self, request, *args, **kwargs):
-        index, size = utils.pagination_util(request)
         args = request.query_params
         filters = {
             "creator": request.user,
@@ -107,14 +123,14 @@ class FeedCreatedByMeListView(generics.GenericAPIView):
             filters["title__icontains"] = args["title"]
 
         feed_query = self.model.objects.filter(**filters)
-        total = feed_query.count()
+        page, pagination = utils.paginate(request, feed_query, FEED_ORDERING)
 
         data = self.get_serializer(
-            feed_query[index:size],
+            page,
             context={"request": request, "my_feeds": True},
             many=True,
         ).data
-        return responses.SuccessResponse(data, index=index, total=total)
+        return responses.SuccessResponse(data, **pagination)
 
 
 @decorators.permission_classes([IsAuthenticated])
@@ -161,10 +177,15 @@ class FeedFollowView(generics.GenericAPIView):
 
             Get my list of followed feeds
 
-                pagination with index and size
+                pagination with index and size or cursor and size
 
                 /?index=0&size=20
 
+                /?cursor=&size=20 next_cursor of response is cursor of next page
+
+                /?count=cached total is exact, cached, estimated or none, none
+                has has_more instead of total, exact default
+
                 filter
 
                     title
@@ -198,7 +219,6 @@ class FeedFollowView(generics.GenericAPIView):
         return responses.SuccessResponse({})
 
     def get(self, request, *args, **kwargs):
-        index, size = utils.pagination_util(request)
         args = request.query_params
         filters = {
             "followers": request.user,
@@ -206,11 +226,9 @@ class FeedFollowView(generics.GenericAPIView):
         if args.get("title"):
             filters["title__icontains"] = args["title"]
         feed_query = self.model.objects.filter(**filters)
-        total = feed_query.count()
-        data = FeedSerializers(
-            feed_query[index:size], context={"request": request}, many=True
-        ).data
-        return responses.SuccessResponse(data, index=index, total=total)
+        page, pagination = utils.paginate(request, feed_query, FEED_ORDERING)
+        data = FeedSerializers(page, context={"request": request}, many=True).data
+        return responses.SuccessResponse(data, **pagination)
 
 
 @decorators.permission_classes([IsAuthenticated])
@@ -231,6 +249,69 @@ class FeedUnFollowView(views.APIView):
         return responses.SuccessResponse(status=status.HTTP_204_NO_CONTENT)
 
 
+@decorators.permission_classes([IsAuthenticated])
+class FeedUnreadCountView(views.APIView):
+    """
+    get:
+
+        Unread counts
+
+            Number of unread entries of every followed feed
+
+    """
+
+    throttle_classes = ()
+
+    def get(self, request, *args, **kwargs):
+        feed_ids = FollowFeed.objects.filter(user=request.user).values_list(
+            "feed_id", flat=True
+        )
+        counts = ReadState.objects.unread_counts(request.user.id, feed_ids)
+        data = [{"id": feed_id, "unread": count} for feed_id, count in counts.items()]
+        return responses.SuccessResponse(data)
+
+
+@decorators.permission_classes([IsAuthenticated])
+class FeedReadView(views.APIView):
+    """
+    post:
+
+        Read feed
+
+            Mark all entries of feed read
+
+    """
+
+    throttle_classes = ()
+
+    def post(self, request, feed_id, *args, **kwargs):
+        if not Feed.objects.filter(id=feed_id).exists():
+            raise exceptions.FeedCloudBaseException(
+                gettext(f"Feed {feed_id} does not exist."),
+                code=status.HTTP_404_NOT_FOUND,
+            )
+        ReadState.objects.mark_feed_read(request.user.id, feed_id)
+        return responses.SuccessResponse({})
+
+
+@decorators.permission_classes((IsAuthenticated, StaffPermission))
+class FeedScheduleMetricsView(views.APIView):
+    """
+    get:
+
+        Schedule metrics
+
+            Queue depth, feeds in flight, lag of most overdue feed in
+            seconds and enqueued feeds of last tick of scheduler
+
+    """
+
+    throttle_classes = ()
+
+    def get(self, request, *args, **kwargs):
+        return responses.SuccessResponse(get_metrics())
+
+
 # Entry
 @decorators.permission_classes([IsAuthenticated])
 class EntryListView(generics.GenericAPIView):
@@ -241,10 +322,15 @@ class EntryListView(generics.GenericAPIView):
 
             Get list of available entries
 
-                pagination with index and size
+                pagination with index and size or cursor and size
 
                 /?index=0&size=20
 
+                /?cursor=&size=20 next_cursor of response is cursor of next page
+
+                /?count=cached total is exact, cached, estimated or none, none
+                has has_more instead of total, cached default
+
                 filter
 
                     title
@@ -253,9 +339,9 @@ class EntryListView(generics.GenericAPIView):
 
                     read
 
-                        true for read
+                        true for read by user
 
-                        false for unread
+                        false for unread by user
 
                         blank for all
 
@@ -272,7 +358,6 @@ class EntryListView(generics.GenericAPIView):
     throttle_classes = ()
 
     def get(self, request, feed_id: int = None, *args, **kwargs):
-        index, size = utils.pagination_util(request)
         args = request.query_params
         filters = {}
         if feed_id:
@@ -290,21 +375,68 @@ class EntryListView(generics.GenericAPIView):
         entry_query = self.model.objects.filter(**filters)
 
         if args.get("read"):
+            read = ReadState.objects.read_filter(request.user.id, feed_id)
             if args["read"].lower() == "true":
-                entry_query = entry_query.exclude(reads=None)
+                entry_query = entry_query.filter(read)
             elif args["read"].lower() == "false":
-                entry_query = entry_query.filter(reads=None)
+                entry_query = entry_query.exclude(read)
             else:
                 raise exceptions.FeedCloudBaseException(
                     gettext("read query param value should be true, false or blank.")
                 )
 
+        ordering = ENTRY_NEWEST_ORDERING
         if args.get("order_by") and args["order_by"] == "OLDEST":
-            entry_query = entry_query.order_by("published")
+            ordering = ENTRY_OLDEST_ORDERING
 
-        total = entry_query.count()
-        data = self.get_serializer(entry_query[index:size], many=True).data
-        return responses.SuccessResponse(data, index=index, total=total)
+        page, pagination = utils.paginate(
+            request, entry_query, ordering, count=counting.CACHED
+        )
+        data = self.get_serializer(page, many=True).data
+        return responses.SuccessResponse(data, **pagination)
+
+
+@decorators.permission_classes([IsAuthenticated])
+class TimelineView(generics.GenericAPIView):
+    """
+    get:
+
+        Timeline
+
+            Entries of followed feeds, newest first
+
+                pagination with cursor and size
+
+                /?cursor=&size=20 next_cursor of response is cursor of next page
+
+                /?count=exact total is exact, cached, estimated or none,
+                none has has_more instead of total, none default
+    """
+
+    serializer_class = EntrySerializers
+    model = Entry
+    throttle_classes = ()
+
+    def get(self, request, *args, **kwargs):
+        cursor = request.query_params.get("cursor")
+        size = utils.cursor_size(request)
+        mode = counting.count_mode(request, counting.NONE)
+        before = None
+        if cursor:
+            before = utils.decode_cursor(
+                cursor, self.model.objects.all(), ENTRY_NEWEST_ORDERING
+            )
+        rows = self.model.objects.timeline(request.user.id, before, size + 1)
+        page, next_cursor = utils.next_cursor_page(rows, ENTRY_NEWEST_ORDERING, size)
+        pagination = {"next_cursor": next_cursor}
+        if mode == counting.NONE:
+            pagination["has_more"] = next_cursor is not None
+        else:
+            pagination["total"] = counting.total_count(
+                self.model.objects.filter(feed__followers=request.user), mode
+            )
+        data = self.get_serializer(page, many=True).data
+        return responses.SuccessResponse(data, **pagination)
 
 
 @decorators.permission_classes([IsAuthenticated])
@@ -325,12 +457,9 @@ class EntryReadView(generics.GenericAPIView):
         serialized_data = self.get_serializer(data=request.data)
         serialized_data.is_valid(raise_exception=True)
         entry_id = serialized_data.data["id"]
-        try:
-            request.user.entries_read.add(entry_id)
-        except IntegrityError as e:
-            if 'is not present in table "feed_entry"' in "".join(e.args):
-                raise exceptions.FeedCloudBaseException(
-                    gettext(f"Entry {entry_id} does not exist."),
-                    code=status.HTTP_404_NOT_FOUND,
-                )
+        if not ReadState.objects.mark_read(request.user.id, (entry_id,)):
+            raise exceptions.FeedCloudBaseException(
+                gettext(f"Entry {entry_id} does not exist."),
+                code=status.HTTP_404_NOT_FOUND,
+            )
         return responses.SuccessResponse({})
@@ -1,8 +1,8 @@
 import os
 
 from celery import Celery
-from celery.schedules import crontab
 from django.conf import settings
+from kombu import Queue
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "feedcloud.settings.development")
 
@@ -24,20 +24,35 @@ app.autodiscover_tasks(
         "utils",
     )
 )
+# fetches that users wait for, like first fetch of a new feed, have their own
+# queue and workers, periodic fetches are delivered by priority of their feed
+INTERACTIVE_QUEUE = "feeds_interactive"
+BACKGROUND_QUEUE = "feeds_background"
+app.conf.task_queues = (
+    Queue(app.conf.task_default_queue),
+    Queue(INTERACTIVE_QUEUE),
+    Queue(
+        BACKGROUND_QUEUE,
+        queue_arguments={"x-max-priority": settings.FEED_QUEUE_MAX_PRIORITY},
+    ),
+)
 app.conf.task_routes = {
-    "fetch_feed_entries": {"queue": "feeds"},
-    "schedule_fetch_feed_batch": {"queue": "feeds"},
+    "fetch_feed_entries": {"queue": BACKGROUND_QUEUE},
+    "fetch_feed_batch_entries": {"queue": BACKGROUND_QUEUE},
+    "schedule_fetch_feed_batch": {"queue": BACKGROUND_QUEUE},
 }
+# a worker reserves one message per process, so a message of higher
+# priority is not stuck behind prefetched ones
+app.conf.worker_prefetch_multiplier = 1
 app.conf.beat_schedule = {
-    "low-priority-tasks": {
-        "task": "schedule_fetch_feed_batch",
-        "schedule": crontab(minute="*/5"),
-        "args": (1,),  # Low priority tasks
-    },
-    "high-priority-tasks": {
+    "due-feeds-tasks": {
         "task": "schedule_fetch_feed_batch",
-        "schedule": crontab(minute="*/2"),
-        "args": (2,),  # High priority tasks
+        # feeds are scheduled by next_fetch_at, ticks publish due feeds only
+        "schedule": settings.FEED_SCHEDULE_TICK,
+        "options": {
+            "expires": settings.FEED_SCHEDULE_TICK_EXPIRES,
+            "priority": settings.FEED_QUEUE_MAX_PRIORITY,
+        },
     },
 }
 
@@ -4,3 +4,116 @@ MESSAGE_SHOW_TYPE = {"TOAST": "TOAST", "NONE": "NONE"}
 EMAIL_SEND_COUNT = "EMAIL_SEND_COUNT"
 MAX_EMAIL_SEND_TIMEOUT = 60 * 60
 MAX_EMAIL_SEND_COUNT = 3
+
+# Feed scheduling configs, all intervals are in seconds
+FEED_MIN_FETCH_INTERVAL = 2 * 60
+FEED_MAX_FETCH_INTERVAL = 12 * 60 * 60
+FEED_DEFAULT_FETCH_INTERVAL = 5 * 60  # when publish interval is not known
+FEED_PUBLISH_INTERVAL_WEIGHT = 0.3  # weight of new observation in average
+FEED_UNCHANGED_BACKOFF = 1.2  # per fetch without new entries
+FEED_ERROR_BACKOFF = 5 * 60  # doubled per failed fetch, with jitter
+# circuit of a feed opens after this number of failed fetches in a row,
+# its next fetch after backoff is a trial (half open)
+FEED_CIRCUIT_FAILURE_THRESHOLD = 3
+# feed goes to ERROR after this number, it is just probed once per
+# FEED_MAX_FETCH_INTERVAL until a fetch succeeds
+FEED_CIRCUIT_ERROR_FAILURES = 10
+# fetches of a host stop for a backoff after this number of failures of
+# its feeds in a row (timeouts, connection errors and 5xx responses)
+FEED_HOST_CIRCUIT_THRESHOLD = 5
+# a dispatched feed is not scheduled again during this time,
+# its fetch sets the real next_fetch_at
+FEED_FETCH_LEASE = 10 * 60
+# a fetch leases its feed, so just one fetch of a feed is in flight, lease
+# expires after timeout of feed and this margin for parsing and saving
+FEED_FETCH_LEASE_MARGIN = 60
+# backpressure of schedule_fetch_feed_batch, a tick is skipped when fetch
+# queue has this number of messages
+FEED_SCHEDULE_MAX_QUEUE_DEPTH = 1000
+# a tick enqueues the most overdue feeds until this number of feeds are
+# enqueued or being fetched, other due feeds wait for next ticks
+FEED_SCHEDULE_MAX_IN_FLIGHT = 5000
+# period of beat, a tick enqueues feeds that are due since previous tick
+FEED_SCHEDULE_TICK = 10
+# a tick that is not started in this time is dropped, so ticks do not
+# stack behind a long queue
+FEED_SCHEDULE_TICK_EXPIRES = 8
+# next fetch of a feed is moved to its stable phase in this window, so
+# ticks enqueue a steady share of feeds instead of feeds that were fetched
+# together, 0 does not move it
+FEED_SCHEDULE_WINDOW = 60
+# background fetch queue delivers messages of higher priority first,
+# ticks of scheduler have the max priority
+FEED_QUEUE_MAX_PRIORITY = 9
+# message priority of background fetches by priority of feed, HIGH, LOW and
+# STOP, first fetches of users go to interactive queue instead
+FEED_FETCH_MESSAGE_PRIORITY = {2: 6, 1: 3, 0: 0}
+
+# Feed fetch configs
+FEED_BATCH_SIZE = 100
+# celery: one fetch_feed_entries task per feed
+# batch: one fetch_feed_batch_entries task per batch, feeds of batch are
+# fetched one by one and saved together with a constant number of queries
+# asyncio: like batch but feeds of batch are fetched concurrently on
+# an event loop, it should run on a prefork worker
+FEED_FETCH_ENGINE = "celery"
+FEED_ASYNC_BATCH_SIZE = 500
+FEED_ASYNC_CONCURRENCY = 100
+# session: pooled keep-alive session shared by fetches of a worker
+# requests: new connection for every fetch
+FEED_REQUEST_AGENT = "session"
+FEED_HTTP_POOL_CONNECTIONS = 100  # number of hosts to keep connections of
+FEED_HTTP_POOL_MAXSIZE = 4  # max connections per host
+# seconds to wait for a free connection of a host before fetch fails
+FEED_HTTP_POOL_TIMEOUT = 10
+# download body of feeds in chunks and stop at FEED_MAX_RESPONSE_BYTES
+FEED_STREAM_RESPONSE = True
+FEED_MAX_RESPONSE_BYTES = 5 * 1024 * 1024
+# feedparser: lenient parser that sanitizes html of entries
+# streaming: incremental parser that stops reading at already fetched
+# entries, html of entries is sanitized like feedparser
+# lxml: streaming parser on top of lxml, malformed feeds fall back to feedparser
+FEED_PARSER_AGENT = "feedparser"
+# bloom filter of saved entry links that drops known entries before insert
+# local: filter of worker process, redis: filter shared by workers,
+# None: every entry reaches insert, with redis entry buffer links are marked
+# by flushers, so filter has to be redis to be seen by workers
+FEED_DEDUP_FILTER = "redis"
+FEED_DEDUP_FILTER_BITS = 2 ** 24  # 2 MiB
+FEED_DEDUP_FILTER_HASHES = 7
+FEED_DEDUP_FILTER_CAPACITY = 1000000  # links of local filter before clear
+FEED_DEDUP_FILTER_TTL = 7 * 24 * 60 * 60  # seconds of redis filter
+# link of feed is replaced by target of its permanent redirects after
+# this number of fetches that are redirected to same target
+FEED_PERMANENT_REDIRECT_THRESHOLD = 3
+# write-behind buffer of entries, fetches push their entries to it and
+# flush_entries command inserts them in large batches, by COPY to a staging
+# table on postgres, redis: stream shared by workers, local: queue of
+# process for tests, None: fetches insert their entries themselves
+FEED_ENTRY_BUFFER = "redis"
+FEED_ENTRY_FLUSH_MESSAGES = 500  # fetches per flush
+FEED_ENTRY_FLUSH_BLOCK = 1000  # milliseconds a flusher waits for entries
+# messages of a flusher that did not flush them in this milliseconds are
+# claimed by other flushers
+FEED_ENTRY_FLUSH_CLAIM_IDLE = 60 * 1000
+# per host token bucket, every fetch takes a token of host of feed before
+# its request, fetches of a host without token are deferred, not failed
+# redis: buckets shared by workers, local: buckets of worker process,
+# None: hosts are not rate limited
+FEED_HOST_RATE_LIMITER = "redis"
+FEED_HOST_RATE = 1  # tokens per second
+FEED_HOST_BURST = 10
+# seconds a host is not fetched after a 429 without Retry-After
+FEED_HOST_DEFAULT_RETRY_AFTER = 5 * 60
+
+# List configs
+# total of cached count mode is counted again after this number of seconds,
+# or after a change of its tables by users or status of feeds, entries
+# inserted by fetches just reach it after this time
+LIST_COUNT_CACHE_TTL = 60
+
+# Read configs
+# read entries after read_until and unread entries before it that a read
+# state of a feed keeps, when there are more, oldest unread entries are
+# marked read, so condition of read entries has a bounded size per feed
+READ_STATE_MAX_IDS = 500
@@ -44,3 +44,6 @@ CACHES = {
 }
 
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
+
+FEED_HOST_RATE_LIMITER = "local"
+FEED_ENTRY_BUFFER = None
@@ -0,0 +1,161 @@
+import os
+import typing
+from http.cookiejar import DefaultCookiePolicy
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+
+from feedreader.exceptions import ResponseTooLargeException
+
+
+class Response:
+    """
+    Minimal response returned by async request agents
+
+    it has the same attributes FeedReader uses from requests.Response
+    """
+
+    def __init__(
+        self,
+        status_code: int,
+        content: bytes,
+        headers: typing.Mapping,
+        url: str = None,
+        history: typing.Sequence["Response"] = (),
+    ):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.url = url
+        self.history = history
+
+
+class AioHttpRequestAgent:
+    """
+    Async request agent on top of an aiohttp.ClientSession
+
+    session is owned by caller, so many readers share its connection pool,
+    reading body stops as soon as it is larger than max_bytes
+    """
+
+    chunk_size = 16 * 1024
+
+    def __init__(self, session, max_bytes: int = None):
+        self._session = session
+        self._max_bytes = max_bytes
+
+    async def get(self, url, timeout, headers) -> Response:
+        async with self._session.get(
+            url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as resp:
+            url = str(resp.url)
+            history = [Response(r.status, b"", r.headers) for r in resp.history]
+            if not self._max_bytes:
+                return Response(
+                    resp.status, await resp.read(), resp.headers, url, history
+                )
+            chunks, size = [], 0
+            async for chunk in resp.content.iter_chunked(self.chunk_size):
+                size += len(chunk)
+                if size > self._max_bytes:
+                    raise ResponseTooLargeException(
+                        f"Resp is larger than {self._max_bytes} bytes"
+                    )
+                chunks.append(chunk)
+            return Response(resp.status, b"".join(chunks), resp.headers, url, history)
+
+
+class _PoolTimeoutMixin:
+    """
+    Connection pool that waits at most pool_timeout seconds for a free
+    connection, requests does not pass a pool timeout to urllib3
+    """
+
+    pool_timeout: typing.Optional[float] = None
+
+    def _get_conn(self, timeout=None):
+        if timeout is None:
+            timeout = self.pool_timeout
+        return super()._get_conn(timeout=timeout)
+
+
+class PoolTimeoutHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that a request to a host with no free connection raises
+    urllib3 EmptyPoolError after pool_timeout seconds instead of waiting
+    forever with pool_block
+    """
+
+    def __init__(self, pool_timeout: float = None, **kwargs):
+        self._pool_timeout = pool_timeout
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: type(
+                pool_class.__name__,
+                (_PoolTimeoutMixin, pool_class),
+                {"pool_timeout": self._pool_timeout},
+            )
+            for scheme, pool_class in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+
+class SessionRequestAgent:
+    """
+    Request agent on top of a pooled keep-alive requests.Session
+
+    pool_connections is number of hosts that their connections are kept,
+    pool_maxsize is max number of connections per host, with pool_block
+    requests to a host wait for a free connection instead of opening more,
+    at most pool_timeout seconds, then fetch fails like other network errors
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = 100,
+        pool_maxsize: int = 4,
+        pool_block: bool = True,
+        pool_timeout: float = 10,
+    ):
+        self._session = requests.Session()
+        adapter = PoolTimeoutHTTPAdapter(
+            pool_timeout=pool_timeout,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        # advertise every encoding urllib3 can decode, br needs brotli package
+        self._session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+        # session is shared between feeds, so cookies of one feed should not
+        # be sent to others
+        self._session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+    def get(self, url, timeout, headers, stream=False):
+        return self._session.get(url, timeout=timeout, headers=headers, stream=stream)
+
+    def close(self):
+        self._session.close()
+
+
+_shared_session_agent = None
+_shared_session_agent_pid = None
+
+
+def get_shared_session_agent(**kwargs) -> SessionRequestAgent:
+    """
+    Session agent shared by all fetches of a worker process
+
+    connections can not be shared with forked children, so every process
+    creates its own agent
+    """
+    global _shared_session_agent, _shared_session_agent_pid
+    if _shared_session_agent is None or _shared_session_agent_pid != os.getpid():
+        _shared_session_agent = SessionRequestAgent(**kwargs)
+        _shared_session_agent_pid = os.getpid()
+    return _shared_session_agent
@@ -0,0 +1,145 @@
+import functools
+import re
+import time
+import typing
+from datetime import datetime, timedelta, timezone
+
+from dateutil.parser import parse
+
+from feedreader.exceptions import FeedReaderBaseException
+
+
+RFC822_RE = re.compile(
+    r"(?:[A-Za-z]{3},\s*)?(\d{1,2})\s+([A-Za-z]{3})\s+(\d{2,4})\s+"
+    r"(\d{1,2}):(\d{2})(?::(\d{2}))?(?:\s*([+-]\d{4}|[A-Za-z]{1,3}))?"
+)
+RFC3339_RE = re.compile(
+    r"(\d{4})-(\d{2})-(\d{2})[Tt ](\d{2}):(\d{2}):(\d{2})(?:\.(\d+))?"
+    r"\s*([Zz]|[+-]\d{2}:?\d{2})?"
+)
+MONTHS = {
+    month: number
+    for number, month in enumerate(
+        ("jan", "feb", "mar", "apr", "may", "jun")
+        + ("jul", "aug", "sep", "oct", "nov", "dec"),
+        start=1,
+    )
+}
+# zone names of RFC 822, others are left to dateutil
+ZONES = {
+    "ut": 0,
+    "utc": 0,
+    "gmt": 0,
+    "z": 0,
+    "est": -5,
+    "edt": -4,
+    "cst": -6,
+    "cdt": -5,
+    "mst": -7,
+    "mdt": -6,
+    "pst": -8,
+    "pdt": -7,
+}
+TZINFOS = {name.upper(): hours * 60 * 60 for name, hours in ZONES.items()}
+DATE_CACHE_SIZE = 4096
+
+
+def parse_entry_date(entry: typing.Mapping) -> datetime:
+    """
+    Publish time of an entry, update time if it does not have publish time
+
+    struct that feedparser parsed is used when there is, it is in UTC
+
+    :raise FeedReaderBaseException: if entry does not have a valid date
+    """
+    for key in ("published", "updated"):
+        value = entry.get(key)
+        if not value:
+            continue
+        parsed = entry.get(f"{key}_parsed")
+        if isinstance(parsed, time.struct_time):
+            return datetime(*parsed[:6], tzinfo=timezone.utc)
+        return parse_date(value)
+    raise FeedReaderBaseException("Entry does not have publish time")
+
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_date(value: str) -> datetime:
+    """
+    Parse date of feeds, RFC 822 and RFC 3339 dates are parsed by fast
+    paths and other formats by dateutil
+
+    dates without timezone are considered UTC, result is memoized because
+    entries of a feed are fetched many times
+
+    :raise FeedReaderBaseException: if value is not a valid date
+    """
+    value = value.strip()
+    try:
+        return (
+            _parse_rfc3339(value)
+            or _parse_rfc822(value)
+            or _with_timezone(parse(value, tzinfos=TZINFOS))
+        )
+    except (ValueError, OverflowError) as e:
+        raise FeedReaderBaseException(f"Invalid date {value!r}: {e}")
+
+
+def _parse_rfc822(value: str) -> typing.Optional[datetime]:
+    match = RFC822_RE.fullmatch(value)
+    if not match:
+        return None
+    day, month, year, hour, minute, second, zone = match.groups()
+    month = MONTHS.get(month.lower())
+    if month is None:
+        return None
+    if zone is None:
+        offset = timedelta()
+    elif zone[0] in "+-":
+        offset = timedelta(hours=int(zone[1:3]), minutes=int(zone[3:]))
+        offset = -offset if zone[0] == "-" else offset
+    elif zone.lower() in ZONES:
+        offset = timedelta(hours=ZONES[zone.lower()])
+    else:
+        return None
+    year = int(year)
+    if len(match.group(3)) == 2:
+        year += 2000 if year < 50 else 1900
+    return datetime(
+        year,
+        month,
+        int(day),
+        int(hour),
+        int(minute),
+        int(second or 0),
+        tzinfo=timezone(offset),
+    )
+
+
+def _parse_rfc3339(value: str) -> typing.Optional[datetime]:
+    match = RFC3339_RE.fullmatch(value)
+    if not match:
+        return None
+    year, month, day, hour, minute, second, fraction, zone = match.groups()
+    if zone is None or zone in "Zz":
+        offset = timedelta()
+    else:
+        zone = zone.replace(":", "")
+        offset = timedelta(hours=int(zone[1:3]), minutes=int(zone[3:]))
+        offset = -offset if zone[0] == "-" else offset
+    return datetime(
+        int(year),
+        int(month),
+        int(day),
+        int(hour),
+        int(minute),
+        int(second),
+        int(fraction[:6].ljust(6, "0")) if fraction else 0,
+        tzinfo=timezone(offset),
+    )
+
+
+def _with_timezone(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
@@ -8,3 +8,21 @@ class UnSuccessfulRequestException(FeedReaderBaseException):
     """
     The request responded with a status code that is not equal to 200
     """
+
+
+class ResponseTooLargeException(FeedReaderBaseException):
+    """
+    The response body is larger than max_bytes of reader
+    """
+
+
+class RateLimitedException(UnSuccessfulRequestException):
+    """
+    The request responded with 429, or 503 with Retry-After
+
+    retry_after is seconds that server asked to wait, None if it did not ask
+    """
+
+    def __init__(self, message: str = "", retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
@@ -1,19 +1,45 @@
+import asyncio
+import hashlib
 import logging
 import typing
+from email.utils import parsedate_to_datetime
 
 import feedparser
 import requests
-from datetime import datetime
-from dateutil.parser import parse
+from datetime import datetime, timezone
 
+from feedreader.dates import parse_entry_date
 from feedreader.entities import Feed, Entry
-from feedreader.exceptions import FeedReaderBaseException, UnSuccessfulRequestException
+from feedreader.exceptions import (
+    FeedReaderBaseException,
+    RateLimitedException,
+    ResponseTooLargeException,
+    UnSuccessfulRequestException,
+)
 
 
 logger = logging.getLogger(__name__)
 
 
 class FeedReader:
+    """
+    with stream, body is downloaded in chunks and reading stops as soon as
+    it is larger than max_bytes, if parser agent has iter_parse chunks are
+    parsed while they are downloaded and rest of body is not downloaded
+    when entries reach last_modified
+
+    when body of a 200 response has same digest as content_digest of
+    previous response, it is not parsed and not_modified is True like 304
+
+    permanent_redirect is the final url when response is reached just by
+    permanent redirects (301 and 308)
+
+    429 responses, and 503 responses with Retry-After, raise
+    RateLimitedException with seconds of their Retry-After
+    """
+
+    chunk_size = 16 * 1024
+
     def __init__(
         self,
         url,
@@ -21,41 +47,168 @@ class FeedReader:
         parser_agent=None,
         last_modified: datetime = None,
         timeout: int = 5,
+        etag: str = None,
+        modified: str = None,
+        stream: bool = False,
+        max_bytes: int = None,
+        content_digest: str = None,
     ):
         self._url = url
         self._request_agent = request_agent if request_agent else requests
         self._parser_agent = parser_agent if parser_agent else feedparser
         self._last_modified = last_modified
         self._timeout = timeout
+        self._stream = stream
+        self._max_bytes = max_bytes
+        # validators of previous response, they will be replaced by
+        # validators of new response after fetching
+        self.etag = etag
+        self.modified = modified
+        self.content_digest = content_digest
+        self.not_modified = False
+        self.status_code = None
+        self.permanent_redirect = None
+        # streamed response that is parsed while entries are read
+        self._response = None
 
-    def get_feed_info(self) -> Feed:
+    def fetch(self):
+        """
+        Fetch and parse feed, getters fetch it too if it is not fetched
+        """
         self._fetch()
+
+    def get_feed_info(self) -> typing.Optional[Feed]:
+        self._fetch()
+        if self.not_modified:
+            return None
         self._validate()
         return self._handle_feed_info()
 
     def get_entries(self) -> typing.List[Entry]:
         self._fetch()
+        if self.not_modified:
+            return []
         self._validate()
         return self._handle_entries()
 
     def _fetch(self):
         if not hasattr(self, "data"):
+            kwargs = {"stream": True} if self._stream else {}
             resp = self._request_agent.get(
                 self._url,
                 timeout=self._timeout,
-                headers={
-                    "If-Modified-Since": self._last_modified.strftime(
-                        "%a, %d %b %Y %H:%M:%S %Z"
-                    )
-                    if self._last_modified
-                    else None
-                },
+                headers=self._get_conditional_headers(),
+                **kwargs,
             )
-            if resp.status_code not in (200, 304):
-                raise UnSuccessfulRequestException(
-                    f"Resp with status code {resp.status_code}"
-                )
-            self.data = self._parser_agent.parse(resp.content)
+            self._handle_response(resp)
+
+    def close(self):
+        """
+        Stop reading rest of a streamed body and release its connection
+        """
+        if hasattr(getattr(self, "data", None), "close"):
+            self.data.close()
+        if self._response is not None:
+            self._response.close()
+            self._response = None
+
+    def _handle_response(self, resp):
+        """
+        Response is closed here unless its body is parsed lazily, then it is
+        closed when entries are read or reader is closed
+        """
+        try:
+            self._read_response(resp)
+        finally:
+            close = getattr(resp, "close", None)
+            if self._response is not resp and close:
+                close()
+
+    def _read_response(self, resp):
+        self.status_code = resp.status_code
+        retry_after = resp.headers.get("Retry-After")
+        if resp.status_code == 429 or (resp.status_code == 503 and retry_after):
+            raise RateLimitedException(
+                f"Resp with status code {resp.status_code}",
+                retry_after=parse_retry_after(retry_after),
+            )
+        if resp.status_code not in (200, 304):
+            raise UnSuccessfulRequestException(
+                f"Resp with status code {resp.status_code}"
+            )
+        history = getattr(resp, "history", None)
+        if history and all(r.status_code in (301, 308) for r in history):
+            self.permanent_redirect = resp.url
+        self.not_modified = resp.status_code == 304
+        if self.not_modified:
+            # server may omit validators in 304, so keep previous ones
+            self.etag = resp.headers.get("ETag", self.etag)
+            self.modified = resp.headers.get("Last-Modified", self.modified)
+            self.data = None
+            return
+        self.etag = resp.headers.get("ETag")
+        self.modified = resp.headers.get("Last-Modified")
+        self._check_content_length(resp.headers.get("Content-Length"))
+        if not self._stream:
+            content = resp.content
+            if self._max_bytes:
+                self._check_content_length(len(content))
+        elif hasattr(self._parser_agent, "iter_parse"):
+            # body is parsed while it is downloaded, so it is not hashed,
+            # reading of unchanged body stops at first entry anyway
+            self.content_digest = None
+            self.data = self._parser_agent.iter_parse(self._iter_content(resp))
+            self._response = resp
+            return
+        else:
+            content = b"".join(self._iter_content(resp))
+        digest = hash_content(content)
+        self.not_modified = digest == self.content_digest
+        self.content_digest = digest
+        if self.not_modified:
+            self.data = None
+            return
+        self.data = self._parser_agent.parse(content)
+
+    def _check_content_length(self, length):
+        if not self._max_bytes or not length:
+            return
+        try:
+            length = int(length)
+        except ValueError:
+            # malformed header is ignored, size of body is checked while
+            # it is read
+            logger.warning(f"Invalid Content-Length {length!r} of {self._url}")
+            return
+        if length > self._max_bytes:
+            raise ResponseTooLargeException(
+                f"Resp is larger than {self._max_bytes} bytes"
+            )
+
+    def _iter_content(self, resp) -> typing.Iterator[bytes]:
+        """
+        Chunks of decoded body, connection is released when body is read
+        completely or reading is stopped
+        """
+        size = 0
+        try:
+            for chunk in resp.iter_content(chunk_size=self.chunk_size):
+                size += len(chunk)
+                self._check_content_length(size)
+                yield chunk
+        finally:
+            resp.close()
+
+    def _get_conditional_headers(self) -> dict:
+        """
+        Replay validators of previous response exactly as server sent them
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.modified:
+            headers["If-Modified-Since"] = self.modified
+        return headers
 
     def _validate(self):
         if self.data.bozo:
@@ -64,18 +217,23 @@ class FeedReader:
 
     def _handle_entries(self) -> typing.List[Entry]:
         entries_list = []
-        for entry in self.data.entries:
-            published_at = parse(entry["published"])
-            if self._last_modified and published_at <= self._last_modified:
-                break
-            entries_list.append(
-                Entry(
-                    title=entry["title"],
-                    url=entry["link"],
-                    summary=entry["summary"],
-                    published_at=published_at,
+        try:
+            for entry in self.data.entries:
+                published_at = parse_entry_date(entry)
+                if self._last_modified and published_at <= self._last_modified:
+                    break
+                entries_list.append(
+                    Entry(
+                        title=entry["title"],
+                        # feedburner wraps links in its proxy
+                        url=entry.get("feedburner_origlink") or entry["link"],
+                        summary=entry["summary"],
+                        published_at=published_at,
+                    )
                 )
-            )
+        finally:
+            # stop reading rest of streamed body
+            self.close()
         return entries_list
 
     def _handle_feed_info(self):
@@ -85,3 +243,75 @@ class FeedReader:
                 url=self._url,
             )
         return None
+
+
+def hash_content(content: bytes) -> str:
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+def parse_retry_after(value: typing.Optional[str]) -> typing.Optional[float]:
+    """
+    Seconds of a Retry-After header, it is either seconds or an HTTP date
+
+    :return: None if value is missing or invalid
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max((date - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class AsyncFeedReader(FeedReader):
+    """
+    FeedReader with an async request agent
+
+    fetch should be awaited before getting feed info or entries, parsing is
+    postponed to them to keep event loop free for other requests
+    """
+
+    def __init__(self, url, request_agent, *args, **kwargs):
+        super().__init__(url, request_agent, *args, **kwargs)
+        self._response = None
+
+    async def fetch(self):
+        if self._response is None and not hasattr(self, "data"):
+            self._response = await self._request_agent.get(
+                self._url,
+                timeout=self._timeout,
+                headers=self._get_conditional_headers(),
+            )
+
+    def _fetch(self):
+        if not hasattr(self, "data"):
+            if self._response is None:
+                raise FeedReaderBaseException("Feed is not fetched, await fetch first.")
+            resp, self._response = self._response, None
+            self._handle_response(resp)
+
+
+async def fetch_concurrently(
+    readers: typing.Iterable[AsyncFeedReader], concurrency: int = 100
+) -> typing.List[typing.Optional[Exception]]:
+    """
+    Fetch readers concurrently, at most concurrency requests are in flight
+
+    :return: exception of each reader in order of readers, None if succeeded
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _fetch(reader: AsyncFeedReader):
+        async with semaphore:
+            try:
+                await reader.fetch()
+            except Exception as e:
+                return e
+
+    return await asyncio.gather(*(_fetch(reader) for reader in readers))
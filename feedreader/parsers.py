@@ -0,0 +1,289 @@
+import collections
+import logging
+import typing
+import xml.etree.ElementTree
+from xml.sax.saxutils import escape
+
+import feedparser
+import lxml.etree
+
+from feedreader.exceptions import FeedReaderBaseException
+
+try:
+    # feedparser has no public function to sanitize html, summaries are
+    # sanitized by parsing a document of them when this one is gone
+    from feedparser.sanitizer import _sanitize_html
+except ImportError:
+    _sanitize_html = None
+
+
+logger = logging.getLogger(__name__)
+
+
+ATOM_NS = "{http://www.w3.org/2005/Atom}"
+RSS1_NS = "{http://purl.org/rss/1.0/}"
+DC_NS = "{http://purl.org/dc/elements/1.1/}"
+DCTERMS_NS = "{http://purl.org/dc/terms/}"
+CONTENT_NS = "{http://purl.org/rss/1.0/modules/content/}"
+FEEDBURNER_NS = "{http://rssnamespace.org/feedburner/ext/1.0}"
+
+SANITIZE_DOCUMENT = (
+    '<rss version="2.0"><channel><item><description>{}</description></item>'
+    "</channel></rss>"
+)
+
+ENTRY_TAGS = ("item", f"{RSS1_NS}item", f"{ATOM_NS}entry")
+FEED_TAGS = ("channel", f"{RSS1_NS}channel", f"{ATOM_NS}feed")
+TITLE_TAGS = ("title", f"{RSS1_NS}title", f"{ATOM_NS}title", f"{DC_NS}title")
+LINK_TAGS = ("link", f"{RSS1_NS}link")
+SUMMARY_TAGS = (
+    "description",
+    f"{RSS1_NS}description",
+    f"{ATOM_NS}summary",
+    f"{CONTENT_NS}encoded",
+    f"{ATOM_NS}content",
+)
+PUBLISHED_TAGS = ("pubDate", f"{ATOM_NS}published")
+# like feedparser, dc:date is update time of entry
+UPDATED_TAGS = (f"{ATOM_NS}updated", f"{DC_NS}date", f"{DCTERMS_NS}modified")
+
+
+class ParsedFeed:
+    """
+    Result of parsing, it has the attributes FeedReader uses from result
+    of feedparser
+
+    entries of a streamed document are read lazily and just once, reading
+    them can raise FeedReaderBaseException when document is malformed
+    """
+
+    def __init__(self, items: typing.Iterator[typing.Tuple[str, dict]]):
+        self.bozo = False
+        self.bozo_exception = None
+        self._feed = {}
+        self._items = items
+        self._read_entries = collections.deque()
+
+    @property
+    def feed(self) -> dict:
+        """
+        Read document until title of feed, entries that are read meanwhile
+        are kept to be yielded by entries
+        """
+        if "title" not in self._feed:
+            for kind, value in self._items:
+                if kind == "feed":
+                    self._feed.update(value)
+                    break
+                self._read_entries.append(value)
+        return self._feed
+
+    @property
+    def entries(self) -> typing.Iterator[dict]:
+        return self._iter_entries()
+
+    def _iter_entries(self):
+        while self._read_entries:
+            yield self._read_entries.popleft()
+        for kind, value in self._items:
+            if kind == "feed":
+                self._feed.update(value)
+            else:
+                yield value
+
+    def close(self):
+        """
+        Stop reading rest of document
+        """
+        self._items.close()
+
+
+class StreamingParser:
+    """
+    Incremental RSS and Atom parser on top of XMLPullParser of an
+    ElementTree implementation
+
+    every entry is yielded as soon as its element is closed and then removed
+    from tree, so memory does not grow with size of document and reader can
+    stop reading rest of document when it reaches old entries
+    """
+
+    def __init__(self, etree=xml.etree.ElementTree):
+        self._etree = etree
+
+    def parse(self, content: bytes) -> ParsedFeed:
+        """
+        Parse whole document like feedparser.parse, errors set bozo
+        """
+        data = self.iter_parse((content,))
+        entries = []
+        try:
+            entries = list(data.entries)
+        except FeedReaderBaseException as e:
+            data.bozo = True
+            data.bozo_exception = e
+        data._read_entries.extend(entries)
+        return data
+
+    def iter_parse(self, chunks: typing.Iterable[bytes]) -> ParsedFeed:
+        return ParsedFeed(self._iter_items(chunks))
+
+    def _new_pull_parser(self):
+        return self._etree.XMLPullParser(events=("start", "end"))
+
+    def _iter_items(self, chunks):
+        parser = self._new_pull_parser()
+        stack = []
+        try:
+            for chunk in chunks:
+                parser.feed(chunk)
+                yield from self._handle_events(parser.read_events(), stack)
+            parser.close()
+            yield from self._handle_events(parser.read_events(), stack)
+        except self._etree.ParseError as e:
+            raise FeedReaderBaseException(f"Malformed feed: {e}")
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+
+    def _handle_events(self, events, stack):
+        for event, element in events:
+            if event == "start":
+                stack.append(element)
+                continue
+            stack.pop()
+            parent = stack[-1] if stack else None
+            if element.tag in ENTRY_TAGS:
+                yield "entry", self._entry(element)
+                element.clear()
+                if parent is not None:
+                    parent.remove(element)
+            elif (
+                element.tag in TITLE_TAGS
+                and parent is not None
+                and parent.tag in FEED_TAGS
+            ):
+                yield "feed", {"title": _text(element)}
+
+    def _entry(self, element) -> dict:
+        entry, summaries = {}, {}
+        for child in element:
+            tag = child.tag
+            if tag in TITLE_TAGS:
+                entry.setdefault("title", _text(child))
+            elif tag in LINK_TAGS:
+                entry.setdefault("link", _text(child).strip())
+            elif (
+                tag == f"{ATOM_NS}link" and child.get("rel", "alternate") == "alternate"
+            ):
+                entry.setdefault("link", child.get("href", "").strip())
+            elif tag == f"{FEEDBURNER_NS}origLink":
+                # like feedparser, original link of feedburner proxy links
+                entry.setdefault("feedburner_origlink", _text(child).strip())
+            elif tag == "guid" and child.get("isPermaLink", "true") == "true":
+                entry.setdefault("guid", _text(child).strip())
+            elif tag in SUMMARY_TAGS:
+                summaries.setdefault(SUMMARY_TAGS.index(tag), _summary(child))
+            elif tag in PUBLISHED_TAGS:
+                entry.setdefault("published", _text(child).strip())
+            elif tag in UPDATED_TAGS:
+                entry.setdefault("updated", _text(child).strip())
+        guid = entry.pop("guid", None)
+        if "link" not in entry and guid:
+            entry["link"] = guid
+        # description and summary win over full content
+        entry["summary"] = summaries[min(summaries)] if summaries else ""
+        return entry
+
+
+class LxmlParser(StreamingParser):
+    """
+    StreamingParser on top of lxml, a C accelerated XML parser
+
+    documents that are malformed are parsed again by fallback parser, so
+    iter_parse keeps chunks that are read until it finishes, parse reads
+    a document by iter_parse too, so it falls back once
+    """
+
+    def __init__(self, fallback=feedparser):
+        super().__init__(etree=lxml.etree)
+        self._fallback = fallback
+
+    def iter_parse(self, chunks: typing.Iterable[bytes]) -> ParsedFeed:
+        return ParsedFeed(self._iter_items_with_fallback(iter(chunks)))
+
+    def _new_pull_parser(self):
+        # just entries and titles are reported, entities are not resolved
+        # and network is not accessed
+        return lxml.etree.XMLPullParser(
+            events=("end",),
+            tag=ENTRY_TAGS + TITLE_TAGS,
+            resolve_entities=False,
+            no_network=True,
+        )
+
+    def _handle_events(self, events, stack):
+        # lxml elements know their parent, so stack is not needed
+        for _, element in events:
+            parent = element.getparent()
+            if element.tag in ENTRY_TAGS:
+                yield "entry", self._entry(element)
+                element.clear()
+                if parent is not None:
+                    parent.remove(element)
+            elif parent is not None and parent.tag in FEED_TAGS:
+                yield "feed", {"title": _text(element)}
+
+    def _iter_items_with_fallback(self, chunks):
+        read_chunks = []
+
+        def _read():
+            for chunk in chunks:
+                read_chunks.append(chunk)
+                yield chunk
+
+        entries_count = 0
+        try:
+            for kind, value in self._iter_items(_read()):
+                entries_count += kind == "entry"
+                yield kind, value
+        except FeedReaderBaseException as e:
+            logger.warning(f"Fallback to feedparser, {e}")
+            data = self._fallback.parse(b"".join((*read_chunks, *chunks)))
+            if data.bozo:
+                raise FeedReaderBaseException(data.bozo_exception)
+            if "title" in data.feed:
+                yield "feed", {"title": data.feed["title"]}
+            # entries that are yielded before error are skipped
+            for entry in data.entries[entries_count:]:
+                yield "entry", entry
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+
+
+def _summary(element) -> str:
+    """
+    Text of summary, html is sanitized like feedparser does, so scripts and
+    event handlers are removed, plain text of atom is kept as it is
+    """
+    text = _text(element).strip()
+    if element.tag.startswith(ATOM_NS) and element.get("type", "text") == "text":
+        return text
+    return sanitize_html(text)
+
+
+def sanitize_html(html: str) -> str:
+    """
+    Sanitize html like feedparser does for summaries
+    """
+    if _sanitize_html is not None:
+        return _sanitize_html(html, "utf-8", "text/html")
+    data = feedparser.parse(SANITIZE_DOCUMENT.format(escape(html)).encode())
+    return data.entries[0].get("summary", "") if data.entries else ""
+
+
+def _text(element) -> str:
+    if len(element):
+        return "".join(element.itertext())
+    return element.text or ""
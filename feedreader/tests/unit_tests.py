@@ -1,27 +1,140 @@
+import asyncio
+import glob
 import json
+import threading
+import time
+from datetime import timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from typing import Optional
 
+import feedparser
 import pytest
 from dateutil.parser import parse
+from urllib3.exceptions import EmptyPoolError
 
-from feedreader.feedreader import FeedReader
+from feedreader import agents, parsers
+from feedreader.agents import SessionRequestAgent, get_shared_session_agent
+from feedreader.dates import TZINFOS, parse_date, parse_entry_date
+from feedreader.feedreader import (
+    AsyncFeedReader,
+    FeedReader,
+    fetch_concurrently,
+    hash_content,
+    parse_retry_after,
+)
 from feedreader.entities import Entry
-from feedreader.exceptions import FeedReaderBaseException, UnSuccessfulRequestException
+from feedreader.exceptions import (
+    FeedReaderBaseException,
+    RateLimitedException,
+    ResponseTooLargeException,
+    UnSuccessfulRequestException,
+)
+from feedreader.parsers import LxmlParser, StreamingParser
 
 
 class MockResponse:
-    def __init__(self, content, status_code):
-        self.content = content
+    def __init__(self, content, status_code, headers: Optional[dict] = None):
+        self.content = json.dumps(content).encode()
         self.status_code = status_code
+        self.headers = headers if headers else {}
 
 
 class MockRequestAgent:
-    def __init__(self, content: Optional[dict] = None, status_code: int = 200):
+    def __init__(
+        self,
+        content: Optional[dict] = None,
+        status_code: int = 200,
+        headers: Optional[dict] = None,
+    ):
         self.content = content
         self.status_code = status_code
+        self.headers = headers
+        self.request_headers = None
 
     def get(self, url, timeout, headers):
-        return MockResponse(self.content, self.status_code)
+        self.request_headers = headers
+        return MockResponse(self.content, self.status_code, self.headers)
+
+
+class MockStreamResponse(MockResponse):
+    def __init__(self, chunks, status_code=200, headers: Optional[dict] = None):
+        super().__init__(None, status_code, headers)
+        self.chunks = chunks
+        self.read_chunks = 0
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for chunk in self.chunks:
+            self.read_chunks += 1
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+class MockStreamRequestAgent:
+    def __init__(self, response: MockStreamResponse):
+        self.response = response
+
+    def get(self, url, timeout, headers, stream=False):
+        assert stream is True
+        return self.response
+
+
+class MockAsyncRequestAgent(MockRequestAgent):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def get(self, url, timeout, headers):
+        self.in_flight += 1
+        self.max_in_flight = max(self.in_flight, self.max_in_flight)
+        await asyncio.sleep(0)
+        self.in_flight -= 1
+        if url == "bad_url":
+            raise ConnectionError()
+        return super().get(url, timeout, headers)
+
+
+class FeedServerHandler(BaseHTTPRequestHandler):
+    """
+    Keep-alive server of responses that FeedReader handles, a body is sent
+    with every response, so connection is released only when it is read or
+    closed
+    """
+
+    protocol_version = "HTTP/1.1"
+    responses = {
+        "/feed": (200, {}, b"{}"),
+        "/not-modified": (304, {}, b""),
+        "/error": (500, {}, b"error"),
+        "/rate-limited": (429, {"Retry-After": "60"}, b"slow down"),
+        "/large": (200, {}, b"x" * 1024),
+    }
+
+    def do_GET(self):
+        status, headers, body = self.responses[self.path]
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def feed_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FeedServerHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
 
 
 class MockParsedFeed:
@@ -44,7 +157,28 @@ class MockParserAgent:
         self.entries = content["entries"] if content and content.get("entries") else []
 
     def parse(self, content):
-        return MockParserAgent(self.bozo, self.bozo_exception, content=content)
+        return MockParserAgent(
+            self.bozo, self.bozo_exception, content=json.loads(content)
+        )
+
+
+class MockFallbackParser:
+    def __init__(self):
+        self.content = None
+        self.parse_count = 0
+
+    def parse(self, content):
+        self.content = content
+        self.parse_count += 1
+        return MockParserAgent(
+            content={
+                "feed": {"title": "Fallback feed"},
+                "entries": [
+                    {"title": "Fallback entry 2"},
+                    {"title": "Fallback entry 1"},
+                ],
+            }
+        )
 
 
 @pytest.fixture
@@ -105,3 +239,541 @@ class TestFeedParser:
         entries = fp.get_entries()
         assert isinstance(entries, list)
         assert len(entries) == 1
+
+    def test_conditional_request_headers(self):
+        request_agent = MockRequestAgent()
+        fp = FeedReader(
+            "sample_url",
+            request_agent=request_agent,
+            parser_agent=MockParserAgent(),
+        )
+        fp.get_entries()
+        assert request_agent.request_headers == {}
+
+        etag = 'W/"5e8d-1a2b"'
+        modified = "Wed, 22 Sep 2021 08:52:00 GMT"
+        fp = FeedReader(
+            "sample_url",
+            request_agent=request_agent,
+            parser_agent=MockParserAgent(),
+            etag=etag,
+            modified=modified,
+        )
+        fp.get_entries()
+        assert request_agent.request_headers == {
+            "If-None-Match": etag,
+            "If-Modified-Since": modified,
+        }
+
+    def test_validators_of_response(self, sample_content):
+        etag = '"new-etag"'
+        modified = "Thu, 23 Sep 2021 08:52:00 GMT"
+        fp = FeedReader(
+            "sample_url",
+            request_agent=MockRequestAgent(
+                content=sample_content,
+                headers={"ETag": etag, "Last-Modified": modified},
+            ),
+            parser_agent=MockParserAgent(),
+            etag='"old-etag"',
+        )
+        fp.get_entries()
+        assert fp.not_modified is False
+        assert fp.etag == etag
+        assert fp.modified == modified
+
+    def test_not_modified_response(self):
+        etag = '"old-etag"'
+        fp = FeedReader(
+            "sample_url",
+            request_agent=MockRequestAgent(status_code=304),
+            # parsing would raise FeedReaderBaseException
+            parser_agent=MockParserAgent(True, Exception()),
+            etag=etag,
+        )
+        assert fp.get_entries() == []
+        assert fp.get_feed_info() is None
+        assert fp.not_modified is True
+        assert fp.etag == etag
+        assert fp.data is None
+
+
+RSS_HEAD = b"""<?xml version="1.0" encoding="utf-8"?>
+<rss version="2.0"><channel><title>Sample Feed</title><link>https://feed.io</link>
+"""
+RSS_ITEM = """<item><title>Entry {0}</title><link>https://feed.io/{0}</link>
+<description>Summary {0}</description>
+<pubDate>Wed, 22 Sep 2021 {0:02d}:00:00 GMT</pubDate></item>
+"""
+RSS_TAIL = b"</channel></rss>"
+
+
+def rss_chunks(count):
+    """
+    One chunk for head of document and one for every item, newest first
+    """
+    items = [RSS_ITEM.format(hour).encode() for hour in range(count, 0, -1)]
+    return [RSS_HEAD, *items, RSS_TAIL]
+
+
+class TestStreamingParser:
+    def test_parse_rss(self):
+        data = StreamingParser().parse(b"".join(rss_chunks(2)))
+        assert data.bozo is False
+        assert data.feed["title"] == "Sample Feed"
+        assert list(data.entries) == [
+            {
+                "title": "Entry 2",
+                "link": "https://feed.io/2",
+                "summary": "Summary 2",
+                "published": "Wed, 22 Sep 2021 02:00:00 GMT",
+            },
+            {
+                "title": "Entry 1",
+                "link": "https://feed.io/1",
+                "summary": "Summary 1",
+                "published": "Wed, 22 Sep 2021 01:00:00 GMT",
+            },
+        ]
+
+    def test_parse_atom(self):
+        content = b"""<?xml version="1.0" encoding="utf-8"?>
+        <feed xmlns="http://www.w3.org/2005/Atom"><title>Atom Feed</title>
+        <entry><title>Entry</title><link rel="self" href="https://feed.io/self"/>
+        <link href="https://feed.io/1"/><summary>Summary</summary>
+        <published>2021-09-22T08:00:00Z</published>
+        <updated>2021-09-22T09:00:00Z</updated></entry></feed>"""
+        data = StreamingParser().parse(content)
+        assert data.feed["title"] == "Atom Feed"
+        assert list(data.entries) == [
+            {
+                "title": "Entry",
+                "link": "https://feed.io/1",
+                "summary": "Summary",
+                "published": "2021-09-22T08:00:00Z",
+                "updated": "2021-09-22T09:00:00Z",
+            }
+        ]
+
+    def test_parse_malformed(self):
+        data = StreamingParser().parse(b"".join(rss_chunks(2)[:-1]))
+        assert data.bozo is True
+        assert isinstance(data.bozo_exception, FeedReaderBaseException)
+
+    def test_feed_info_before_entries(self):
+        data = StreamingParser().iter_parse(iter(rss_chunks(2)))
+        assert data.feed["title"] == "Sample Feed"
+        assert len(list(data.entries)) == 2
+
+
+CORPUS = sorted(glob.glob("feedreader/tests/corpus/*.xml"))
+ENTRY_FIELDS = ("title", "link", "summary", "published")
+
+
+def parsed_fields(data) -> dict:
+    return {
+        "bozo": bool(data.bozo),
+        "title": data.feed.get("title"),
+        "entries": [
+            {field: entry.get(field) for field in ENTRY_FIELDS}
+            for entry in data.entries
+        ],
+    }
+
+
+class TestLxmlParser:
+    @pytest.mark.parametrize("path", CORPUS)
+    def test_equivalence_with_feedparser(self, path):
+        with open(path, "rb") as file:
+            content = file.read()
+        expected = parsed_fields(feedparser.parse(content))
+        chunks = (content[i : i + 64] for i in range(0, len(content), 64))
+        if expected["bozo"]:
+            # feedparser could not parse it too, so reader fails like before
+            assert LxmlParser().parse(content).bozo is True
+            with pytest.raises(FeedReaderBaseException):
+                parsed_fields(LxmlParser().iter_parse(chunks))
+        else:
+            assert parsed_fields(LxmlParser().parse(content)) == expected
+            assert parsed_fields(LxmlParser().iter_parse(chunks)) == expected
+            assert parsed_fields(StreamingParser().parse(content)) == expected
+
+    def test_fallback_after_entries(self):
+        chunks = rss_chunks(2)
+        chunks[2] = chunks[2].replace(b"Entry 1<", b"Entry & 1<")
+        fallback = MockFallbackParser()
+        data = LxmlParser(fallback=fallback).iter_parse(iter(chunks))
+        # first entry is yielded before error, so it is skipped in fallback
+        assert [entry["title"] for entry in data.entries] == [
+            "Entry 2",
+            "Fallback entry 1",
+        ]
+        assert fallback.content == b"".join(chunks)
+
+        fallback = MockFallbackParser()
+        data = LxmlParser(fallback=fallback).parse(b"".join(chunks))
+        assert [entry["title"] for entry in data.entries] == [
+            "Entry 2",
+            "Fallback entry 1",
+        ]
+        assert fallback.parse_count == 1
+
+    def test_sanitize_html_without_private_sanitizer(self, monkeypatch):
+        html = '<p onclick="x()">Hi <script>alert(1)</script><b>there</b></p>'
+        expected = parsers.sanitize_html(html)
+        assert expected == "<p>Hi <b>there</b></p>"
+        monkeypatch.setattr(parsers, "_sanitize_html", None)
+        assert parsers.sanitize_html(html) == expected
+
+    def test_get_entries(self):
+        response = MockStreamResponse(rss_chunks(10))
+        fp = FeedReader(
+            "sample_url",
+            request_agent=MockStreamRequestAgent(response),
+            parser_agent=LxmlParser(),
+            last_modified=parse("Wed, 22 Sep 2021 08:00:00 GMT"),
+            stream=True,
+        )
+        assert [entry.title for entry in fp.get_entries()] == ["Entry 10", "Entry 9"]
+        assert fp.get_feed_info().title == "Sample Feed"
+        assert response.read_chunks == 4
+
+
+class TestStreamingFeedReader:
+    def test_get_entries_stops_reading(self):
+        response = MockStreamResponse(rss_chunks(10))
+        fp = FeedReader(
+            "sample_url",
+            request_agent=MockStreamRequestAgent(response),
+            parser_agent=StreamingParser(),
+            last_modified=parse("Wed, 22 Sep 2021 08:00:00 GMT"),
+            stream=True,
+        )
+        entries = fp.get_entries()
+        assert [entry.title for entry in entries] == ["Entry 10", "Entry 9"]
+        assert fp.get_feed_info().title == "Sample Feed"
+        # head and 3 items are read, rest of body is not downloaded
+        assert response.read_chunks == 4
+        assert response.closed is True
+
+    def test_get_entries_with_feedparser(self):
+        response = MockStreamResponse(rss_chunks(3))
+        fp = FeedReader(
+            "sample_url",
+            request_agent=MockStreamRequestAgent(response),
+            stream=True,
+            max_bytes=10 * 1024,
+        )
+        assert len(fp.get_entries()) == 3
+        assert fp.get_feed_info().title == "Sample Feed"
+        assert response.closed is True
+
+    def test_max_bytes(self):
+        response = MockStreamResponse(rss_chunks(100))
+        fp = FeedReader(
+            "sample_url",
+            request_agent=MockStreamRequestAgent(response),
+            stream=True,
+            max_bytes=1024,
+        )
+        with pytest.raises(ResponseTooLargeException):
+            fp.get_entries()
+        assert response.read_chunks < 100
+        assert response.closed is True
+
+    def test_max_bytes_of_content_length(self):
+        response = MockStreamResponse(rss_chunks(1), headers={"Content-Length": "2048"})
+        fp = FeedReader(
+            "sample_url",
+            request_agent=MockStreamRequestAgent(response),
+            parser_agent=StreamingParser(),
+            stream=True,
+            max_bytes=1024,
+        )
+        with pytest.raises(ResponseTooLargeException):
+            fp.get_entries()
+        assert response.read_chunks == 0
+        assert response.closed is True
+
+    def test_malformed_content_length(self):
+        response = MockStreamResponse(rss_chunks(1), headers={"Content-Length": "1k"})
+        fp = FeedReader(
+            "sample_url",
+            request_agent=MockStreamRequestAgent(response),
+            parser_agent=StreamingParser(),
+            stream=True,
+            max_bytes=10 * 1024,
+        )
+        assert len(fp.get_entries()) == 1
+        assert response.closed is True
+
+    @pytest.mark.parametrize(
+        "path, exception",
+        [
+            ("/error", UnSuccessfulRequestException),
+            ("/rate-limited", RateLimitedException),
+            ("/large", ResponseTooLargeException),
+            ("/not-modified", None),
+        ],
+    )
+    def test_connection_is_released(self, feed_server, path, exception):
+        request_agent = SessionRequestAgent(pool_maxsize=2, pool_timeout=0.5)
+        # more fetches than connections of pool, a response that is not
+        # closed keeps its connection and exhausts pool
+        for _ in range(3):
+            fp = FeedReader(
+                f"{feed_server}{path}",
+                request_agent=request_agent,
+                parser_agent=StreamingParser(),
+                stream=True,
+                max_bytes=512,
+            )
+            if exception:
+                with pytest.raises(exception):
+                    fp.fetch()
+            else:
+                assert fp.get_entries() == []
+        request_agent.close()
+
+    def test_connection_is_released_on_close(self, feed_server):
+        request_agent = SessionRequestAgent(pool_maxsize=2, pool_timeout=0.5)
+        for _ in range(3):
+            fp = FeedReader(
+                f"{feed_server}/feed",
+                request_agent=request_agent,
+                parser_agent=StreamingParser(),
+                stream=True,
+            )
+            # body is parsed lazily, so it is not read by fetch
+            fp.fetch()
+            fp.close()
+        request_agent.close()
+
+
+with open("feedreader/tests/corpus/dates.txt") as file:
+    DATES = file.read().splitlines()
+
+
+class TestDates:
+    @pytest.mark.parametrize("value", DATES)
+    def test_parse_date_like_dateutil(self, value):
+        expected = parse(value, tzinfos=TZINFOS)
+        if expected.tzinfo is None:
+            expected = expected.replace(tzinfo=timezone.utc)
+        result = parse_date(value)
+        assert result == expected
+        assert result.utcoffset() == expected.utcoffset()
+
+    def test_parse_invalid_date(self):
+        with pytest.raises(FeedReaderBaseException):
+            parse_date("Wed, 31 Sep 2021 08:52:00 GMT")
+        with pytest.raises(FeedReaderBaseException):
+            parse_date("not a date")
+
+    def test_parse_entry_date(self):
+        published = parse_date("Wed, 22 Sep 2021 08:52:00 GMT")
+        assert parse_entry_date({"published": "Wed, 22 Sep 2021 08:52:00 GMT"}) == (
+            published
+        )
+        # struct of feedparser is used when there is
+        assert (
+            parse_entry_date(
+                {
+                    "published": "invalid",
+                    "published_parsed": time.strptime(
+                        "2021-09-22 08:52", "%Y-%m-%d %H:%M"
+                    ),
+                }
+            )
+            == published
+        )
+        assert parse_entry_date({"updated": "2021-09-22T08:52:00Z"}) == published
+        with pytest.raises(FeedReaderBaseException):
+            parse_entry_date({"title": "Entry without date"})
+
+
+class TestLinks:
+    def test_permanent_redirect(self, sample_content):
+        request_agent = MockRequestAgent(content=sample_content)
+        response = MockResponse(sample_content, 200)
+        response.url = "https://new.feed.io/rss"
+        response.history = [MockResponse(None, 301), MockResponse(None, 308)]
+        request_agent.get = lambda *args, **kwargs: response
+        fp = FeedReader("sample_url", request_agent, MockParserAgent())
+        fp.fetch()
+        assert fp.permanent_redirect == "https://new.feed.io/rss"
+
+        # a temporary redirect in chain
+        response.history = [MockResponse(None, 301), MockResponse(None, 302)]
+        fp = FeedReader("sample_url", request_agent, MockParserAgent())
+        fp.fetch()
+        assert fp.permanent_redirect is None
+
+    def test_feedburner_origlink(self):
+        content = (
+            b"".join(rss_chunks(1))
+            .replace(
+                b"<rss ",
+                b'<rss xmlns:feedburner="http://rssnamespace.org/feedburner/ext/1.0" ',
+            )
+            .replace(
+                b"</link>",
+                b"</link><feedburner:origLink>https://origin.io/1</feedburner:origLink>",
+                2,
+            )
+        )
+        for parser_agent in (feedparser, StreamingParser(), LxmlParser()):
+            fp = FeedReader(
+                "sample_url",
+                request_agent=MockStreamRequestAgent(MockStreamResponse([content])),
+                parser_agent=parser_agent,
+                stream=True,
+            )
+            assert [entry.url for entry in fp.get_entries()] == ["https://origin.io/1"]
+
+
+class TestRetryAfter:
+    def test_rate_limited(self):
+        fp = FeedReader(
+            "sample_url",
+            request_agent=MockRequestAgent(
+                status_code=429, headers={"Retry-After": "120"}
+            ),
+        )
+        with pytest.raises(RateLimitedException) as e:
+            fp.get_entries()
+        assert e.value.retry_after == 120
+        assert fp.status_code == 429
+
+        fp = FeedReader("sample_url", request_agent=MockRequestAgent(status_code=429))
+        with pytest.raises(RateLimitedException) as e:
+            fp.get_entries()
+        assert e.value.retry_after is None
+
+    def test_unavailable(self):
+        fp = FeedReader(
+            "sample_url",
+            request_agent=MockRequestAgent(
+                status_code=503, headers={"Retry-After": "5"}
+            ),
+        )
+        with pytest.raises(RateLimitedException):
+            fp.get_entries()
+
+        # 503 without Retry-After is a failure
+        fp = FeedReader("sample_url", request_agent=MockRequestAgent(status_code=503))
+        with pytest.raises(UnSuccessfulRequestException) as e:
+            fp.get_entries()
+        assert not isinstance(e.value, RateLimitedException)
+
+    def test_parse_retry_after(self):
+        assert parse_retry_after("30") == 30
+        assert parse_retry_after(None) is None
+        assert parse_retry_after("soon") is None
+        assert parse_retry_after("Wed, 22 Sep 2021 08:52:00 GMT") == 0
+        retry_after = parse_retry_after(
+            time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 60))
+        )
+        assert 55 < retry_after <= 60
+
+
+class TestContentDigest:
+    def test_same_body_is_not_parsed(self, sample_content):
+        fp = FeedReader(
+            "sample_url",
+            request_agent=MockRequestAgent(content=sample_content),
+            parser_agent=MockParserAgent(),
+        )
+        assert len(fp.get_entries()) == 2
+        assert fp.content_digest == hash_content(json.dumps(sample_content).encode())
+
+        fp = FeedReader(
+            "sample_url",
+            request_agent=MockRequestAgent(content=sample_content),
+            # parsing would raise FeedReaderBaseException
+            parser_agent=MockParserAgent(True, Exception()),
+            content_digest=fp.content_digest,
+        )
+        assert fp.get_entries() == []
+        assert fp.get_feed_info() is None
+        assert fp.not_modified is True
+        assert fp.status_code == 200
+
+    def test_changed_body_is_parsed(self, sample_content):
+        fp = FeedReader(
+            "sample_url",
+            request_agent=MockRequestAgent(content=sample_content),
+            parser_agent=MockParserAgent(),
+            content_digest=hash_content(b"previous body"),
+        )
+        assert len(fp.get_entries()) == 2
+        assert fp.not_modified is False
+        assert fp.content_digest != hash_content(b"previous body")
+
+
+class TestAsyncFeedParser:
+    def test_get_entries_success(self, sample_content):
+        fp = AsyncFeedReader(
+            "sample_url",
+            request_agent=MockAsyncRequestAgent(content=sample_content),
+            parser_agent=MockParserAgent(),
+        )
+        asyncio.run(fp.fetch())
+        entries = fp.get_entries()
+        assert len(entries) == 2
+        assert all([isinstance(entry, Entry) for entry in entries])
+        assert fp.get_feed_info().title == sample_content["feed"]["title"]
+
+    def test_get_entries_before_fetch(self):
+        fp = AsyncFeedReader(
+            "sample_url",
+            request_agent=MockAsyncRequestAgent(),
+            parser_agent=MockParserAgent(),
+        )
+        with pytest.raises(FeedReaderBaseException):
+            fp.get_entries()
+
+    def test_fetch_concurrently(self, sample_content):
+        request_agent = MockAsyncRequestAgent(content=sample_content)
+        urls = ["sample_url"] * 10 + ["bad_url"]
+        readers = [
+            AsyncFeedReader(
+                url, request_agent=request_agent, parser_agent=MockParserAgent()
+            )
+            for url in urls
+        ]
+        errors = asyncio.run(fetch_concurrently(readers, concurrency=3))
+        assert request_agent.max_in_flight == 3
+        assert errors[:-1] == [None] * 10
+        assert isinstance(errors[-1], ConnectionError)
+        assert all([len(reader.get_entries()) == 2 for reader in readers[:-1]])
+
+
+class TestSessionRequestAgent:
+    def test_session_configuration(self):
+        agent = SessionRequestAgent(pool_connections=10, pool_maxsize=2)
+        adapter = agent._session.get_adapter("https://www.feed.io")
+        assert adapter._pool_connections == 10
+        assert adapter._pool_maxsize == 2
+        assert adapter._pool_block is True
+        assert adapter._pool_timeout == 10
+        assert "gzip" in agent._session.headers["Accept-Encoding"]
+        assert "deflate" in agent._session.headers["Accept-Encoding"]
+
+    def test_pool_timeout(self, feed_server):
+        agent = SessionRequestAgent(pool_maxsize=1, pool_timeout=0.1)
+        resp = agent.get(f"{feed_server}/feed", timeout=1, headers={}, stream=True)
+        # the only connection of host is kept by unread response
+        with pytest.raises(EmptyPoolError):
+            agent.get(f"{feed_server}/feed", timeout=1, headers={})
+        resp.close()
+        assert agent.get(f"{feed_server}/feed", timeout=1, headers={}).ok
+        agent.close()
+
+    def test_get_shared_session_agent(self, monkeypatch):
+        agent = get_shared_session_agent()
+        assert get_shared_session_agent() is agent
+
+        # forked worker process
+        monkeypatch.setattr(agents.os, "getpid", lambda: -1)
+        assert get_shared_session_agent() is not agent
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import time
+import typing
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connection
+from django.db.models import Model, QuerySet
+from django.db.models.sql import Query
+from django.utils.translation import gettext
+
+from utils.exceptions import FeedCloudBaseException
+
+
+EXACT = "exact"
+CACHED = "cached"
+ESTIMATED = "estimated"
+NONE = "none"
+COUNT_MODES = (EXACT, CACHED, ESTIMATED, NONE)
+
+TABLE_VERSION_KEY = "count:version:{}"
+COUNT_KEY = "count:{}"
+
+
+def count_mode(request, default: str) -> str:
+    """
+    Total count mode of a list from count query param, default of view if
+    it is not given
+    """
+    mode = request.query_params.get("count") or default
+    if mode not in COUNT_MODES:
+        raise FeedCloudBaseException(
+            detail=gettext(
+                "count query param should be exact, cached, estimated or none."
+            )
+        )
+    return mode
+
+
+def _query_tables(query: Query, tables: typing.Set[str]):
+    tables.add(query.get_meta().db_table)
+    tables.update(join.table_name for join in query.alias_map.values())
+    _expression_tables(query.where, tables)
+
+
+def _expression_tables(expression, tables: typing.Set[str]):
+    """
+    Tables of subqueries in an expression, like EXISTS of excluded relations
+    """
+    if isinstance(expression, Query):
+        _query_tables(expression, tables)
+        return
+    if isinstance(getattr(expression, "query", None), Query):
+        _query_tables(expression.query, tables)
+    for child in getattr(expression, "children", ()):
+        _expression_tables(child, tables)
+    for side in ("lhs", "rhs"):
+        if hasattr(expression, side):
+            _expression_tables(getattr(expression, side), tables)
+    if hasattr(expression, "get_source_expressions"):
+        for source in expression.get_source_expressions():
+            _expression_tables(source, tables)
+
+
+def _tables(queryset: QuerySet) -> typing.List[str]:
+    """
+    :return: tables that queryset reads, joins and subqueries included
+    """
+    tables = set()
+    _query_tables(queryset.query, tables)
+    return sorted(tables)
+
+
+def invalidate_counts(*models: typing.Type[Model]):
+    """
+    Drop cached counts of querysets that read tables of these models
+    """
+    version = time.time_ns()
+    cache.set_many(
+        {TABLE_VERSION_KEY.format(model._meta.db_table): version for model in models},
+        timeout=None,
+    )
+
+
+def cached_count(queryset: QuerySet) -> int:
+    """
+    Count of queryset cached for LIST_COUNT_CACHE_TTL seconds
+
+    key of a count has versions of tables that queryset reads, so changes
+    that invalidate_counts is called for drop it before its ttl
+    """
+    queryset = queryset.order_by()
+    tables = _tables(queryset)
+    version_keys = [TABLE_VERSION_KEY.format(table) for table in tables]
+    versions = cache.get_many(version_keys)
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    digest = hashlib.md5(
+        repr((sql, params, [versions.get(key) for key in version_keys])).encode()
+    ).hexdigest()
+    key = COUNT_KEY.format(digest)
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout=settings.LIST_COUNT_CACHE_TTL)
+    return count
+
+
+def estimated_count(queryset: QuerySet) -> int:
+    """
+    Count of queryset estimated by postgres planner, reltuples of table for
+    a queryset without filter, otherwise rows of plan of query
+
+    other databases do not have estimates, so they count exactly
+    """
+    if connection.vendor != "postgresql":
+        return queryset.count()
+    queryset = queryset.order_by()
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                (queryset.model._meta.db_table,),
+            )
+            reltuples = cursor.fetchone()[0]
+            # table that is never analyzed has -1
+            if reltuples >= 0:
+                return int(reltuples)
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def total_count(queryset: QuerySet, mode: str) -> typing.Optional[int]:
+    """
+    :return: total count of queryset by mode, None for none mode
+    """
+    if mode == CACHED:
+        return cached_count(queryset)
+    if mode == ESTIMATED:
+        return estimated_count(queryset)
+    if mode == NONE:
+        return None
+    return queryset.count()
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from feed.models import Feed
+
+
+class Command(BaseCommand):
+    help = "Backfill last_published_at of feeds from their entries"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        updated = 0
+        last_id = 0
+        while True:
+            feeds = list(
+                Feed.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .annotate(newest_entry_published_at=Max("entry__published_at"))[
+                    :batch_size
+                ]
+            )
+            if len(feeds) == 0:
+                break
+            changed_feeds = []
+            for feed in feeds:
+                if feed.last_published_at != feed.newest_entry_published_at:
+                    feed.last_published_at = feed.newest_entry_published_at
+                    changed_feeds.append(feed)
+            Feed.objects.bulk_update(changed_feeds, ("last_published_at",))
+            updated += len(changed_feeds)
+            last_id = feeds[-1].id
+        self.stdout.write(
+            self.style.SUCCESS(f"Backfill of {updated} feeds was successful")
+        )
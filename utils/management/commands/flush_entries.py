@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from feed.buffer import flush_entry_buffer, get_entry_buffer
+
+
+class Command(BaseCommand):
+    help = "Insert buffered entries of fetches in large batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once", action="store_true", help="Exit when buffer is empty"
+        )
+
+    def handle(self, *args, **options):
+        buffer = get_entry_buffer()
+        if buffer is None:
+            raise CommandError("FEED_ENTRY_BUFFER is not set")
+        flushed = 0
+        while True:
+            stats = flush_entry_buffer(
+                buffer,
+                block=None if options["once"] else settings.FEED_ENTRY_FLUSH_BLOCK,
+            )
+            if stats.messages:
+                flushed += stats.rows
+                self.stdout.write(
+                    f"{stats.rows} entries, {stats.inserted} inserted, "
+                    f"{stats.dropped} dropped, {stats.seconds * 1000:.1f}ms"
+                )
+            elif options["once"]:
+                break
+        self.stdout.write(
+            self.style.SUCCESS(f"Flush of {flushed} entries was successful")
+        )
@@ -45,6 +45,10 @@ class SuccessResponse(BaseResponse):
         self.success = True
         self.index = kwargs["index"] if kwargs.get("index") is not None else None
         self.total = kwargs["total"] if kwargs.get("total") is not None else None
+        if "next_cursor" in kwargs:
+            self.next_cursor = kwargs["next_cursor"]
+        if "has_more" in kwargs:
+            self.has_more = kwargs["has_more"]
         super().__init__(status)
 
 
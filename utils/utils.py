@@ -1,5 +1,14 @@
+import base64
+import binascii
+import json
+import typing
+from datetime import datetime
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q, QuerySet
 from django.utils.translation import gettext
 
+from utils import counting
 from utils.exceptions import FeedCloudBaseException
 
 
@@ -14,3 +23,162 @@ def pagination_util(request) -> (int, int):
         )
     size = index + size
     return index, size
+
+
+def encode_cursor(ordering: typing.Sequence[str], values: typing.Sequence) -> str:
+    """
+    Opaque cursor of a row by values of ordering fields of it
+    """
+    values = [
+        value.isoformat() if isinstance(value, datetime) else value for value in values
+    ]
+    payload = json.dumps([list(ordering), values]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(
+    cursor: str, queryset: QuerySet, ordering: typing.Sequence[str]
+) -> list:
+    """
+    Values of ordering fields of cursor, they are validated by fields of model
+
+    :raise FeedCloudBaseException: if cursor is invalid or it is of another
+        ordering
+    """
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_ordering, values = json.loads(payload)
+        if cursor_ordering != list(ordering) or len(values) != len(ordering):
+            raise ValueError(cursor_ordering)
+        if None in values:
+            # ordering fields are non-null, so a row can not have NULL
+            raise ValueError(values)
+        return [
+            queryset.model._meta.get_field(field.lstrip("-")).to_python(value)
+            for field, value in zip(ordering, values)
+        ]
+    except (
+        binascii.Error,
+        FieldDoesNotExist,
+        TypeError,
+        UnicodeDecodeError,
+        ValidationError,
+        ValueError,
+    ):
+        raise FeedCloudBaseException(detail=gettext("Cursor is invalid."))
+
+
+def keyset_filter(ordering: typing.Sequence[str], values: typing.Sequence) -> Q:
+    """
+    Rows after a row with values in ordering, all fields of ordering should
+    have same direction and be non-null, rows with NULL are never after a row
+
+    first field is bounded by itself too, so an index on ordering fields is
+    scanned as a range
+    """
+    descending = ordering[0].startswith("-")
+    fields = [field.lstrip("-") for field in ordering]
+    bound = "lte" if descending else "gte"
+    lookup = "lt" if descending else "gt"
+    after = Q()
+    for position, field in enumerate(fields):
+        condition = Q(**{f"{field}__{lookup}": values[position]})
+        for previous, value in zip(fields[:position], values[:position]):
+            condition &= Q(**{previous: value})
+        after |= condition
+    return Q(**{f"{fields[0]}__{bound}": values[0]}) & after
+
+
+def keyset_page(
+    queryset: QuerySet,
+    ordering: typing.Sequence[str],
+    cursor: typing.Optional[str],
+    size: int,
+) -> (list, typing.Optional[str]):
+    """
+    Page of rows after cursor by keyset pagination, ordering should end
+    with a unique field
+
+    :return: rows of page and cursor of next page, None for last page
+    """
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        queryset = queryset.filter(
+            keyset_filter(ordering, decode_cursor(cursor, queryset, ordering))
+        )
+    return next_cursor_page(list(queryset[: size + 1]), ordering, size)
+
+
+def next_cursor_page(
+    rows: list, ordering: typing.Sequence[str], size: int
+) -> (list, typing.Optional[str]):
+    """
+    Page of size rows from size + 1 rows fetched after a cursor
+
+    :return: rows of page and cursor of next page, None for last page
+    """
+    if len(rows) <= size:
+        return rows, None
+    rows = rows[:size]
+    last = rows[-1]
+    return rows, encode_cursor(
+        ordering, [getattr(last, field.lstrip("-")) for field in ordering]
+    )
+
+
+def cursor_size(request) -> int:
+    """
+    Size of a page of cursor pagination
+    """
+    try:
+        size = int(request.query_params.get("size", 20))
+    except ValueError:
+        raise FeedCloudBaseException(
+            detail=gettext("Size query param for pagination must be integer.")
+        )
+    if size < 1:
+        raise FeedCloudBaseException(
+            detail=gettext("Size query param for pagination must be positive.")
+        )
+    return size
+
+
+def paginate(
+    request,
+    queryset: QuerySet,
+    ordering: typing.Sequence[str],
+    count: str = counting.EXACT,
+):
+    """
+    Page of queryset in order of ordering fields
+
+    with cursor query param, blank for first page, rows are paginated by
+    an opaque cursor of keyset pagination, otherwise by index and size
+
+    total is counted by count query param, count is default of view, none
+    mode has has_more instead of total
+
+    :return: rows of page and pagination fields of response
+    """
+    arguments = request.query_params
+    mode = counting.count_mode(request, count)
+    if "cursor" not in arguments:
+        index, size = pagination_util(request)
+        if mode == counting.NONE:
+            rows = list(queryset.order_by(*ordering)[index : size + 1])
+            return rows[: size - index], {
+                "index": index,
+                "has_more": len(rows) > size - index,
+            }
+        return queryset.order_by(*ordering)[index:size], {
+            "index": index,
+            "total": counting.total_count(queryset, mode),
+        }
+    size = cursor_size(request)
+    rows, next_cursor = keyset_page(queryset, ordering, arguments["cursor"], size)
+    if mode == counting.NONE:
+        return rows, {"next_cursor": next_cursor, "has_more": next_cursor is not None}
+    return rows, {
+        "next_cursor": next_cursor,
+        "total": counting.total_count(queryset, mode),
+    }